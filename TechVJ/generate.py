@@ -18,6 +18,7 @@ from pyrogram.errors import (
 from config import API_ID, API_HASH
 from database.db import db
 from security import security_manager
+from client_pool import client_pool
 
 SESSION_STRING_SIZE = 351
 
@@ -34,9 +35,9 @@ async def logout(client, message):
     
     # Clear user activity and session
     await db.set_session(user_id, session=None)
-    security_manager.user_activity.pop(user_id, None)
-    security_manager.rate_limits.pop(user_id, None)
-    security_manager.suspicious_activity.pop(user_id, None)
+    await db.forget_peers(user_id)
+    await client_pool.close(user_id)
+    await security_manager.forget_user(user_id)
     
     security_manager.log_security_event(user_id, "LOGOUT_SUCCESS", "User logged out successfully")
     await message.reply("**Logout Successfully** ♦")
@@ -46,7 +47,7 @@ async def main(bot: Client, message: Message):
     user_id = message.from_user.id
     
     # Security checks
-    if security_manager.is_rate_limited(user_id):
+    if await security_manager.is_rate_limited(user_id):
         security_manager.log_security_event(user_id, "LOGIN_RATE_LIMIT", "Too many login attempts")
         return await message.reply("**⚠️ Too many login attempts. Please wait before trying again.**")
     
@@ -2,6 +2,7 @@
 from pyrogram import Client, filters
 from pyrogram.types import Message
 from security import security_manager
+from client_pool import client_pool
 # Admin functionality removed
 import time
 
@@ -11,8 +12,8 @@ async def security_status(client: Client, message: Message):
     user_id = message.from_user.id
     
     # Get user activity info
-    activity = security_manager.user_activity.get(user_id, {})
-    suspicious_count = security_manager.suspicious_activity.get(user_id, 0)
+    activity = await security_manager.get_user_activity(user_id)
+    suspicious_count = activity.get('suspicious_count', 0)
     
     # Calculate session time remaining (if timeout is enabled)
     if security_manager.SESSION_TIMEOUT > 0:
@@ -48,8 +49,8 @@ async def security_status(client: Client, message: Message):
 • Rate limit: `{security_manager.MAX_REQUESTS_PER_WINDOW} requests per {security_manager.RATE_LIMIT_WINDOW // 60} minutes`
 
 **Your Status:**
-• Rate limited: `{'Yes' if security_manager.is_rate_limited(user_id) else 'No'}`
-• Session expired: `{'Yes' if security_manager.is_session_expired(user_id) else 'No'}`
+• Rate limited: `{'Yes' if await security_manager.is_rate_limited(user_id) else 'No'}`
+• Session expired: `{'Yes' if await security_manager.is_session_expired(user_id) else 'No'}`
 
 **Tips:**
 • Use `/logout` if you suspect unauthorized access
@@ -67,13 +68,13 @@ async def force_logout(client: Client, message: Message):
     user_id = message.from_user.id
     
     # Clear all security data
-    security_manager.user_activity.pop(user_id, None)
-    security_manager.rate_limits.pop(user_id, None)
-    security_manager.suspicious_activity.pop(user_id, None)
+    await security_manager.forget_user(user_id)
     
     # Clear session from database
     from database.db import db
     await db.set_session(user_id, session=None)
+    await db.forget_peers(user_id)
+    await client_pool.close(user_id)
     
     security_manager.log_security_event(user_id, "FORCE_LOGOUT", "User forced logout")
     
@@ -3,64 +3,53 @@
 # Ask Doubt on telegram @KingVJ01
 
 import os
+import time
 import asyncio 
+import functools
+from contextlib import asynccontextmanager, AsyncExitStack
 import pyrogram
 from pyrogram import Client, filters, enums
 from pyrogram.errors import FloodWait, UserIsBlocked, InputUserDeactivated, UserAlreadyParticipant, InviteHashExpired, UsernameNotOccupied
-from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Message 
-from config import API_ID, API_HASH, ERROR_MESSAGE
+from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Message, InputMediaPhoto, InputMediaVideo, InputMediaDocument, InputMediaAudio
+from config import ERROR_MESSAGE, BOT_ROLE
 from database.db import db
 from TechVJ.strings import HELP_TXT
 from security import security_manager
+from client_pool import client_pool
+from relay import media_relay
+from pipeline import batch_pipeline, OrderedDelivery
+from tracker import progress_tracker
+from pacing import rate_scheduler
+from jobs import batch_queue
+from downloader import parallel_downloader
+from uploader import parallel_uploader, send_uploaded_media, UPLOADABLE_TYPES
+from server_copy import server_copy
+from thumbs import thumbnail_cache, THUMB_TYPES
+from metrics import metrics
+from scheduler import transfer_scheduler, FAST_TYPES
+from planner import batch_planner, BatchPlan
+from staging import staging_area
+from peers import peer_cache
+
+# Maximum number of ids accepted by a single get_messages call
+GET_MESSAGES_LIMIT = 200
+# Maximum number of ids accepted by a single forward_messages call
+FORWARD_MESSAGES_LIMIT = 100
+# Message types that can be delivered together with send_media_group
+ALBUM_TYPES = {"Photo": InputMediaPhoto, "Video": InputMediaVideo, "Document": InputMediaDocument, "Audio": InputMediaAudio}
 
 class batch_temp(object):
     IS_BATCH = {}
 
-async def downstatus(client, statusfile, message, chat):
-    while True:
-        if os.path.exists(statusfile):
-            break
-
-        await asyncio.sleep(3)
-      
-    while os.path.exists(statusfile):
-        with open(statusfile, "r") as downread:
-            txt = downread.read()
-        try:
-            await client.edit_message_text(chat, message.id, f"**Downloaded:** **{txt}**")
-            await asyncio.sleep(10)
-        except:
-            await asyncio.sleep(5)
-
-
-# upload status
-async def upstatus(client, statusfile, message, chat):
-    while True:
-        if os.path.exists(statusfile):
-            break
-
-        await asyncio.sleep(3)      
-    while os.path.exists(statusfile):
-        with open(statusfile, "r") as upread:
-            txt = upread.read()
-        try:
-            await client.edit_message_text(chat, message.id, f"**Uploaded:** **{txt}**")
-            await asyncio.sleep(10)
-        except:
-            await asyncio.sleep(5)
-
-
 # progress writer
-def progress(current, total, message, type):
-    with open(f'{message.id}{type}status.txt', "w") as fileup:
-        fileup.write(f"{current * 100 / total:.1f}%")
+def progress(current, total, key, type):
+    progress_tracker.update(key, type, current, total)
 
 
 # start command
 @Client.on_message(filters.command(["start"]))
 async def send_start(client: Client, message: Message):
-    if not await db.is_user_exist(message.from_user.id):
-        await db.add_user(message.from_user.id, message.from_user.first_name)
+    await db.add_user(message.from_user.id, message.from_user.first_name)
     buttons = [[
         InlineKeyboardButton("❣️ Developer", url = "https://t.me/kingvj01")
     ],[
@@ -89,36 +78,41 @@ async def send_help(client: Client, message: Message):
 @Client.on_message(filters.command(["cancel"]))
 async def send_cancel(client: Client, message: Message):
     batch_temp.IS_BATCH[message.from_user.id] = True
+    # the batch may be running in another worker process
+    await db.cancel_user_jobs(message.from_user.id)
     await client.send_message(
         chat_id=message.chat.id, 
         text="**Batch Successfully Cancelled.**"
     )
 
+# media a user client copied to the bot for the server-side fast path
+@Client.on_message(filters.private & filters.incoming & filters.media, group=-1)
+async def receive_server_copy(client: Client, message: Message):
+    if server_copy.receive(message):
+        message.stop_propagation()
+
 @Client.on_message(filters.text & filters.private)
 async def save(client: Client, message: Message):
     user_id = message.from_user.id
     
     # Security checks
-    if security_manager.is_rate_limited(user_id):
+    if await security_manager.is_rate_limited(user_id):
         security_manager.log_security_event(user_id, "RATE_LIMIT", "Too many requests")
         return await message.reply_text("**⚠️ Rate limit exceeded. Please wait before making more requests.**")
     
     # Input validation
     is_valid, validation_msg = security_manager.validate_input(message.text)
     if not is_valid:
-        security_manager.track_user_activity(user_id, 'invalid_input')
+        await security_manager.track_user_activity(user_id, 'invalid_input')
         security_manager.log_security_event(user_id, "INVALID_INPUT", validation_msg)
         return await message.reply_text(f"**❌ {validation_msg}**")
     
     # Check for security warnings
-    warning = security_manager.get_security_warning(user_id)
+    warning = await security_manager.get_security_warning(user_id)
     if warning:
         await message.reply_text(f"**{warning}**")
     
     if "https://t.me/" in message.text:
-        if batch_temp.IS_BATCH.get(user_id) == False:
-            return await message.reply_text("**One Task Is Already Processing. Wait For Complete It. If You Want To Cancel This Task Then Use - /cancel**")
-        
         datas = message.text.split("/")
         temp = datas[-1].replace("?single","").split("-")
         
@@ -131,200 +125,623 @@ async def save(client: Client, message: Message):
         # Batch size validation
         is_valid_batch, batch_msg = security_manager.validate_batch_size(fromID, toID)
         if not is_valid_batch:
-            security_manager.track_user_activity(user_id, 'large_batch')
+            await security_manager.track_user_activity(user_id, 'large_batch')
             security_manager.log_security_event(user_id, "LARGE_BATCH", batch_msg)
             return await message.reply_text(f"**❌ {batch_msg}**")
         
         if "Large batch detected" in batch_msg:
             await message.reply_text(f"**⚠️ {batch_msg}**")
         
-        batch_temp.IS_BATCH[user_id] = False
-        security_manager.track_user_activity(user_id, 'batch_request')
-        for msgid in range(fromID, toID+1):
-            if batch_temp.IS_BATCH.get(user_id): break
+        # the job queue allows one queued or running batch per user across all workers
+        job_id = await db.create_job(user_id, message.chat.id, message.id, fromID, toID)
+        if job_id is None:
+            return await message.reply_text("**One Task Is Already Processing. Wait For Complete It. If You Want To Cancel This Task Then Use - /cancel**")
+        await security_manager.track_user_activity(user_id, 'batch_request')
+        
+        if BOT_ROLE == 'frontend':
+            return await message.reply_text("**⏳ Your Task Is Queued, It Will Start Shortly.**")
+        
+        # run it right here unless another worker claimed it first
+        job = await batch_queue.claim(job_id)
+        if job:
+            await batch_queue.spawn(client, job, functools.partial(run_claimed_job, message=message))
+
+
+# run a job claimed from the queue, resuming after its last checkpoint
+async def run_claimed_job(client: Client, job: dict, message: Message = None):
+    fromID = job['last_done'] + 1
+    if fromID > job['to_id']:
+        return await db.finish_job(job['_id'], 'done')
+    if message is None:
+        try:
+            message = await client.get_messages(job['chat_id'], job['message_id'])
+        except Exception:
+            message = None
+    if message is None or message.empty or not message.text:
+        return await db.finish_job(job['_id'], 'failed')
+
+    batch_temp.IS_BATCH[job['user_id']] = False
+    if job['attempts'] > 1:
+        await client.send_message(job['chat_id'], f"**♻️ Bot Restarted, Resuming Your Task From Message {fromID}.**", reply_to_message_id=job['message_id'])
+    await execute_batch(client, message, job['_id'], fromID, job['to_id'])
+
+
+# run a batch job with the user's pooled client and record how it ended
+async def execute_batch(client: Client, message: Message, job_id, fromID: int, toID: int):
+    user_id = message.from_user.id
+    datas = message.text.split("/")
+    # read when the job is claimed, the user may have logged out or in again through another process
+    user_data = await db.get_session(user_id)
+    if user_data is None:
+        batch_temp.IS_BATCH[user_id] = True
+        await db.finish_job(job_id, 'failed')
+        await client_pool.close(user_id)
+        return await message.reply("**For Downloading Restricted Content You Have To /login First.**")
+    
+    try:
+        acc, validation_msg = await client_pool.acquire(user_id, user_data)
+        if acc is None:
+            security_manager.log_security_event(user_id, "INVALID_SESSION", validation_msg)
+            batch_temp.IS_BATCH[user_id] = True
+            await db.finish_job(job_id, 'failed')
+            return await message.reply("**Your Login Session Expired. So /logout First Then Login Again By - /login**")
+    except FloodWait as e:
+        batch_temp.IS_BATCH[user_id] = True
+        await db.finish_job(job_id, 'failed')
+        return await message.reply(f"**Telegram Asks Your Account To Wait {e.value} Seconds. Try Again Later.**")
+    except Exception as e:
+        security_manager.log_security_event(user_id, "SESSION_ERROR", str(e))
+        batch_temp.IS_BATCH[user_id] = True
+        await db.finish_job(job_id, 'failed')
+        return await message.reply("**Your Login Session Expired. So /logout First Then Login Again By - /login**")
+    
+    try:
+        await run_batch(client, acc, message, datas, fromID, toID, job_id)
+    finally:
+        client_pool.release(user_id)
+        # on shutdown the job stays unfinished so the next start resumes it,
+        # a job cancelled or reclaimed elsewhere is already settled in the queue
+        if not batch_queue.stopping and not batch_queue.is_cancelled(job_id):
+            await db.finish_job(job_id, 'cancelled' if batch_temp.IS_BATCH.get(user_id) else 'done')
+        batch_temp.IS_BATCH[user_id] = True
+        await staging_area.cleanup(staging_job(message))
+
+
+# process every message of a batch with the user's pooled client
+async def run_batch(client: Client, acc, message: Message, datas: list, fromID: int, toID: int, job_id = None):
+    user_id = message.from_user.id
+    # private
+    if "https://t.me/c/" in message.text:
+        source = int("-100" + datas[4])
+    # bot
+    elif "https://t.me/b/" in message.text:
+        source = datas[4]
+    # public, copied in bulk by the bot
+    else:
+        return await copy_public_range(client, acc, message, datas[3], fromID, toID, job_id)
+
+    try:
+        # resolved once here, every later call of the batch finds the source in the session
+        await peer_cache.resolve(acc, user_id, source)
+        plan = await prepare_batch(acc, message, source, fromID, toID)
+        if plan is None:
+            return
+        started = time.monotonic()
+        if not await deliver_messages(client, acc, message, source, plan.messages, job_id):
+            return
+    except UsernameNotOccupied: 
+        await client.send_message(message.chat.id, "The username is not occupied by anyone", reply_to_message_id=message.id)
+        return
+    except Exception as e:
+        if ERROR_MESSAGE == True:
+            await client.send_message(message.chat.id, f"Error: {e}", reply_to_message_id=message.id)
+        return
+    
+    if not batch_temp.IS_BATCH.get(user_id):
+        batch_planner.record(plan.total_bytes, time.monotonic() - started)
+    security_manager.log_security_event(user_id, "BATCH_COMPLETED", f"Processed {toID - fromID + 1} messages")
+
+
+# deliver messages read by acc in order, later messages download while earlier ones upload
+async def deliver_messages(client: Client, acc, message: Message, source, msgs: list, job_id = None) -> bool:
+    """Run msgs through the batch pipeline, the items of an album are sent together.
+
+    Returns False when the user's session expired on the way.
+    """
+    user_id = message.from_user.id
+    delivery = OrderedDelivery()
+    user_slots = batch_pipeline.user_slots()
+    tasks = []
+    album = []
+
+    async def dispatch(msgs: list):
+        # text and photos skip the global in-flight cap so they never queue behind big files
+        fast = all(get_message_type(msg) in FAST_TYPES for msg in msgs)
+        await batch_pipeline.acquire(user_slots, fast)
+        if batch_temp.IS_BATCH.get(user_id) or batch_queue.stopping:
+            # cancelled while waiting for the slot
+            batch_pipeline.release(user_slots, fast)
+            return
+        ticket = delivery.ticket()
+        tasks.append(asyncio.create_task(
+            process_message(client, acc, message, source, msgs, delivery, ticket, user_slots, job_id, fast)
+        ))
+
+    try:
+        for msg in msgs:
+            if batch_queue.is_cancelled(job_id):
+                batch_temp.IS_BATCH[user_id] = True
+            if batch_temp.IS_BATCH.get(user_id) or batch_queue.stopping: break
             
             # Check session timeout
-            if security_manager.is_session_expired(user_id):
+            if await security_manager.is_session_expired(user_id):
                 security_manager.log_security_event(user_id, "SESSION_TIMEOUT", "Session expired")
                 await message.reply("**⚠️ Your session has expired. Please /login again.**")
+                return False
+
+            # the items of an album are delivered together
+            if album and msg.media_group_id != album[0].media_group_id:
+                await dispatch(album)
+                album = []
+            if msg.media_group_id:
+                album.append(msg)
+            else:
+                await dispatch([msg])
+
+            # security tracking, api pacing is handled per call by rate_scheduler
+            await security_manager.track_user_activity(user_id, 'message_processed')
+
+        if album and not (batch_temp.IS_BATCH.get(user_id) or batch_queue.stopping):
+            await dispatch(album)
+    finally:
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return True
+
+
+# resolve the metadata of the whole range, enforce the size limit and daily quota before any transfer
+async def prepare_batch(fetcher: Client, message: Message, source, fromID: int, toID: int):
+    user_id = message.from_user.id
+    plan = batch_planner.new_plan()
+    with metrics.time("plan"):
+        async for msg in iter_messages(fetcher, source, fromID, toID):
+            plan.add(msg, None if msg.empty else get_message_type(msg))
+
+    allowed, quota_msg = await batch_planner.check(user_id, plan)
+    if not allowed:
+        security_manager.log_security_event(user_id, "QUOTA_EXCEEDED", quota_msg)
+        batch_temp.IS_BATCH[user_id] = True
+        await message.reply(f"**❌ {quota_msg}**")
+        return None
+    if plan.oversized:
+        security_manager.log_security_event(user_id, "FILE_TOO_LARGE", f"{len(plan.oversized)} files over {security_manager.MAX_FILE_SIZE} bytes skipped")
+    # a single post needs no summary unless something was left out
+    if len(plan.messages) > 1 or plan.oversized:
+        await message.reply(f"**{batch_planner.summary(plan)}**")
+    return plan
+
+
+# deliver one message or album of a batch once every earlier message is delivered
+async def process_message(client: Client, acc, message: Message, source, msgs: list,
+                          delivery: OrderedDelivery, ticket: int, user_slots: asyncio.Semaphore, job_id = None, fast: bool = False):
+    turn = functools.partial(delivery.wait, ticket)
+    try:
+        try:
+            if len(msgs) > 1:
+                delivered = await handle_album(client, acc, message, source, msgs, turn)
+            else:
+                delivered = msgs if await handle_private(client, acc, message, source, msgs[0].id, msgs[0], turn=turn) else []
+            # failures are reported by the handlers themselves, only what arrived counts against the quota
+            await batch_planner.charge(message.from_user.id, sum(BatchPlan.size_of(msg, get_message_type(msg)) for msg in delivered))
+        except Exception as e:
+            await turn()
+            if ERROR_MESSAGE == True:
+                await client.send_message(message.chat.id, f"Error: {e}", reply_to_message_id=message.id)
+    finally:
+        try:
+            # checkpoint in delivery order so a resume never skips an undelivered message
+            await turn()
+            if job_id is not None:
+                await db.checkpoint_job(job_id, msgs[-1].id)
+        finally:
+            delivery.finish(ticket)
+            batch_pipeline.release(user_slots, fast)
+
+
+# copy a public range with a few bulk forwards, messages the bot cannot forward go through the user's pipeline
+async def copy_public_range(client: Client, acc, message: Message, source, fromID: int, toID: int, job_id = None):
+    user_id = message.from_user.id
+    resolved = False
+    try:
+        plan = await prepare_batch(client, message, source, fromID, toID)
+        if plan is None:
+            return
+        for start in range(0, len(plan.messages), FORWARD_MESSAGES_LIMIT):
+            msgs = plan.messages[start:start + FORWARD_MESSAGES_LIMIT]
+            if batch_queue.is_cancelled(job_id):
                 batch_temp.IS_BATCH[user_id] = True
+            if batch_temp.IS_BATCH.get(user_id) or batch_queue.stopping: break
+
+            if await security_manager.is_session_expired(user_id):
+                security_manager.log_security_event(user_id, "SESSION_TIMEOUT", "Session expired")
+                await message.reply("**⚠️ Your session has expired. Please /login again.**")
                 return
-            
-            user_data = await db.get_session(user_id)
-            if user_data is None:
-                await message.reply("**For Downloading Restricted Content You Have To /login First.**")
-                batch_temp.IS_BATCH[user_id] = True
-                return
-            
-            try:
-                acc = Client("saverestricted", session_string=user_data, api_hash=API_HASH, api_id=API_ID)
-                await acc.connect()
-                
-                # Validate session is still active
-                is_valid, validation_msg = await security_manager.validate_session(acc, user_id)
-                if not is_valid:
-                    security_manager.log_security_event(user_id, "INVALID_SESSION", validation_msg)
-                    await acc.disconnect()
-                    batch_temp.IS_BATCH[user_id] = True
-                    return await message.reply("**Your Login Session Expired. So /logout First Then Login Again By - /login**")
-                    
-            except Exception as e:
-                security_manager.log_security_event(user_id, "SESSION_ERROR", str(e))
-                batch_temp.IS_BATCH[user_id] = True
-                return await message.reply("**Your Login Session Expired. So /logout First Then Login Again By - /login**")
-            
-            # private
-            if "https://t.me/c/" in message.text:
-                chatid = int("-100" + datas[4])
-                try:
-                    await handle_private(client, acc, message, chatid, msgid)
-                except Exception as e:
-                    if ERROR_MESSAGE == True:
-                        await client.send_message(message.chat.id, f"Error: {e}", reply_to_message_id=message.id)
-    
-            # bot
-            elif "https://t.me/b/" in message.text:
-                username = datas[4]
-                try:
-                    await handle_private(client, acc, message, username, msgid)
-                except Exception as e:
-                    if ERROR_MESSAGE == True:
-                        await client.send_message(message.chat.id, f"Error: {e}", reply_to_message_id=message.id)
-            
-            # public
-            else:
-                username = datas[3]
 
-                try:
-                    msg = await client.get_messages(username, msgid)
-                except UsernameNotOccupied: 
-                    await client.send_message(message.chat.id, "The username is not occupied by anyone", reply_to_message_id=message.id)
+            rejected = await bulk_copy(client, message, source, msgs)
+            rejected_ids = {msg.id for msg in rejected}
+            copied = [msg for msg in msgs if msg.id not in rejected_ids]
+            await batch_planner.charge(user_id, sum(BatchPlan.size_of(msg, get_message_type(msg)) for msg in copied))
+            for _ in copied:
+                await security_manager.track_user_activity(user_id, 'message_processed')
+
+            if rejected:
+                # the plan was read by the bot, its file_ids are no use to the user's client
+                if not resolved:
+                    await peer_cache.resolve(acc, user_id, source)
+                    resolved = True
+                with metrics.time("get_messages"):
+                    refetched = await rate_scheduler.call(acc.name, acc.get_messages, source, [msg.id for msg in rejected])
+                refetched = [msg for msg in refetched if not msg.empty and get_message_type(msg)]
+                if not await deliver_messages(client, acc, message, source, refetched, job_id):
                     return
-                try:
-                    await client.copy_message(message.chat.id, msg.chat.id, msg.id, reply_to_message_id=message.id)
-                except:
-                    try:    
-                        await handle_private(client, acc, message, username, msgid)               
-                    except Exception as e:
-                        if ERROR_MESSAGE == True:
-                            await client.send_message(message.chat.id, f"Error: {e}", reply_to_message_id=message.id)
-
-            # wait time with security tracking
-            await asyncio.sleep(3)
-            security_manager.track_user_activity(user_id, 'message_processed')
-        
-        batch_temp.IS_BATCH[user_id] = True
-        security_manager.log_security_event(user_id, "BATCH_COMPLETED", f"Processed {toID - fromID + 1} messages")
+                # a resume must not skip what the interrupted fallback left undelivered
+                if batch_temp.IS_BATCH.get(user_id) or batch_queue.stopping: break
+
+            if job_id is not None:
+                await db.checkpoint_job(job_id, msgs[-1].id)
+    except UsernameNotOccupied: 
+        await client.send_message(message.chat.id, "The username is not occupied by anyone", reply_to_message_id=message.id)
+        return
+    except Exception as e:
+        if ERROR_MESSAGE == True:
+            await client.send_message(message.chat.id, f"Error: {e}", reply_to_message_id=message.id)
+        return
+
+    security_manager.log_security_event(user_id, "BATCH_COMPLETED", f"Processed {toID - fromID + 1} messages")
 
 
-# handle private
-async def handle_private(client: Client, acc, message: Message, chatid: int, msgid: int):
-    msg: Message = await acc.get_messages(chatid, msgid)
-    if msg.empty: return 
+# forward messages without the author in one call and return the ones that did not arrive
+async def bulk_copy(client: Client, message: Message, source, msgs: list) -> list:
+    if not msgs:
+        return []
+    try:
+        with metrics.time("copy"):
+            copied = await rate_scheduler.send(client, message.chat.id, client.forward_messages, message.chat.id, source, [msg.id for msg in msgs], drop_author=True)
+    except Exception:
+        # protected or otherwise restricted, every message takes the slow path
+        return msgs
+    if not isinstance(copied, list):
+        copied = [copied]
+    if len(copied) == len(msgs):
+        return []
+    arrived = {content_key(msg) for msg in copied}
+    return [msg for msg in msgs if content_key(msg) not in arrived]
+
+
+# identify a message by its content, forwarded copies get new ids
+def content_key(msg: Message):
     msg_type = get_message_type(msg)
-    if not msg_type: return 
+    if msg_type and msg_type != "Text":
+        return getattr(msg, msg_type.lower()).file_unique_id
+    return msg.text
+
+
+# fetch a range of messages in as few calls as the api allows
+async def iter_message_chunks(fetcher: Client, chatid, fromID: int, toID: int, size: int = GET_MESSAGES_LIMIT):
+    for start in range(fromID, toID+1, size):
+        ids = list(range(start, min(start + size, toID+1)))
+        with metrics.time("get_messages"):
+            msgs = await rate_scheduler.call(fetcher.name, fetcher.get_messages, chatid, ids)
+        yield msgs
+
+
+async def iter_messages(fetcher: Client, chatid, fromID: int, toID: int):
+    async for msgs in iter_message_chunks(fetcher, chatid, fromID, toID):
+        for msg in msgs:
+            yield msg
+
+
+# handle private, returns whether the message was delivered
+async def handle_private(client: Client, acc, message: Message, chatid: int, msgid: int, msg: Message = None, turn = None) -> bool:
+    if msg is None:
+        msg = await rate_scheduler.call(acc.name, acc.get_messages, chatid, msgid)
+    if msg.empty: return False
+    msg_type = get_message_type(msg)
+    if not msg_type: return False
     chat = message.chat.id
-    if batch_temp.IS_BATCH.get(message.from_user.id): return 
+    if batch_temp.IS_BATCH.get(message.from_user.id): return False
+    if turn is None:
+        turn = _no_wait
     if "Text" == msg_type:
+        await turn()
         try:
-            await client.send_message(chat, msg.text, entities=msg.entities, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
-            return 
+            async with transfer_scheduler.slot(message.from_user.id, "fast"):
+                await rate_scheduler.send(client, chat, client.send_message, chat, msg.text, entities=msg.entities, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
+            return True
         except Exception as e:
             if ERROR_MESSAGE == True:
                 await client.send_message(message.chat.id, f"Error: {e}", reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
-            return 
+            return False
+
+    # already uploaded once, re-send by file_id without downloading
+    media = getattr(msg, msg_type.lower())
+    cached_file_id = await db.get_cached_file(msg.chat.id, msg.id, media.file_unique_id)
+    if cached_file_id:
+        await turn()
+        try:
+            with metrics.time("copy"):
+                await rate_scheduler.send(client, chat, client.send_cached_media, chat, cached_file_id, caption=msg.caption, caption_entities=msg.caption_entities, reply_to_message_id=message.id)
+            return True
+        except Exception:
+            await db.forget_cached_file(msg.chat.id, msg.id, media.file_unique_id)
+
+    # unprotected chats are copied server side, only protected ones need a download
+    if server_copy.supports(msg):
+        file_id = await server_copy.fetch(client, acc, msg, msg_type)
+        if file_id:
+            await turn()
+            try:
+                with metrics.time("copy"):
+                    await rate_scheduler.send(client, chat, client.send_cached_media, chat, file_id, caption=msg.caption, caption_entities=msg.caption_entities, reply_to_message_id=message.id)
+            except Exception as e:
+                if ERROR_MESSAGE == True:
+                    await client.send_message(message.chat.id, f"Error: {e}", reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
+                return False
+            try:
+                await db.cache_file(msg.chat.id, msg.id, media.file_unique_id, file_id)
+            except Exception as e:
+                print(f"File cache write failed: {e}")
+            return True
 
+    # messages of one batch run concurrently, so progress is keyed per source message too
+    status_key = f"{message.id}_{msg.id}"
     smsg = await client.send_message(message.chat.id, '**Downloading**', reply_to_message_id=message.id)
-    asyncio.create_task(downstatus(client, f'{message.id}downstatus.txt', smsg, chat))
+
+    progress_tracker.start(status_key)
+    asyncio.create_task(progress_tracker.watch(client, chat, smsg.id, status_key))
+    # the thumbnail is fetched while the media downloads
+    thumb = asyncio.create_task(thumbnail_cache.get(acc, media)) if msg_type in THUMB_TYPES else None
+    try:
+        return await transfer_media(client, acc, message, msg, msg_type, status_key, smsg, turn, thumb)
+    finally:
+        progress_tracker.finish(status_key)
+        if thumb:
+            thumbnail_cache.release(await thumb)
+
+
+# move the media of one message from the user client to the bot, returns whether it was sent
+async def transfer_media(client: Client, acc, message: Message, msg: Message, msg_type: str, status_key: str, smsg: Message, turn, thumb: asyncio.Task = None) -> bool:
+    chat = message.chat.id
+    # stream straight from the user client into the bot upload, no temp file
+    if media_relay.supports(msg, msg_type):
+        try:
+            async with transfer_scheduler.slot(message.from_user.id, "upload", getattr(msg, msg_type.lower()).file_size) as slot:
+                # the slot is given back before waiting for the turn to send
+                async def release_and_wait():
+                    slot.release()
+                    await turn()
+                sent = await media_relay.relay(client, acc, msg, msg_type, chat, message.id, caption=msg.caption, thumb=thumb, progress=progress, progress_args=[status_key,"up"], turn=release_and_wait)
+        except Exception as e:
+            await turn()
+            if ERROR_MESSAGE == True:
+                await client.send_message(message.chat.id, f"Error: {e}", reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
+            sent = None
+        await remember_upload(msg, msg_type, sent)
+        await client.delete_messages(message.chat.id,[smsg.id])
+        return sent is not None
+
+    # the download waits for staging space before it starts, whatever it leaves behind is removed at the end
+    media = getattr(msg, msg_type.lower())
+    file_size = getattr(media, 'file_size', 0) or 0
     try:
-        file = await acc.download_media(msg, progress=progress, progress_args=[message,"down"])
-        os.remove(f'{message.id}downstatus.txt')
+        async with staging_area.reserve(staging_job(message), file_size) as directory:
+            return await transfer_file(client, acc, message, msg, msg_type, status_key, smsg, turn, thumb, directory)
     except Exception as e:
+        await turn()
         if ERROR_MESSAGE == True:
             await client.send_message(message.chat.id, f"Error: {e}", reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML) 
-        return await smsg.delete()
-    if batch_temp.IS_BATCH.get(message.from_user.id): return 
-    asyncio.create_task(upstatus(client, f'{message.id}upstatus.txt', smsg, chat))
+        await smsg.delete()
+        return False
+
+
+# download the media of one message into a staging directory and upload it from there, returns whether it was sent
+async def transfer_file(client: Client, acc, message: Message, msg: Message, msg_type: str, status_key: str, smsg: Message, turn, thumb: asyncio.Task, directory: str) -> bool:
+    chat = message.chat.id
+    media = getattr(msg, msg_type.lower())
+    file_size = getattr(media, 'file_size', 0) or 0
+    try:
+        async with transfer_stage(message, msg_type, "download", file_size):
+            if parallel_downloader.supports(file_size):
+                file_name = os.path.basename(getattr(media, 'file_name', None) or msg_type.lower())
+                file = await parallel_downloader.download(acc, msg, file_size, os.path.join(directory, file_name), progress=progress, progress_args=[status_key,"down"])
+            else:
+                file = await rate_scheduler.call(acc.name, acc.download_media, msg, file_name=directory + os.sep, progress=progress, progress_args=[status_key,"down"])
+                metrics.add_bytes("down", os.path.getsize(file))
+    except Exception as e:
+        await turn()
+        if ERROR_MESSAGE == True:
+            await client.send_message(message.chat.id, f"Error: {e}", reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML) 
+        await smsg.delete()
+        return False
+    if batch_temp.IS_BATCH.get(message.from_user.id): return False
+
+    # big documents, videos and audio upload their parts in parallel, only the send waits for its turn
+    if msg_type in UPLOADABLE_TYPES and parallel_uploader.supports(os.path.getsize(file)):
+        sent = None
+        try:
+            async with transfer_stage(message, msg_type, "upload", file_size):
+                input_file = await parallel_uploader.upload_file(client, file, progress=progress, progress_args=[status_key,"up"])
+            await turn()
+            sent = await send_uploaded_media(client, msg, msg_type, chat, message.id, input_file, msg.caption, thumb)
+        except Exception as e:
+            await turn()
+            if ERROR_MESSAGE == True:
+                await client.send_message(message.chat.id, f"Error: {e}", reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
+        await remember_upload(msg, msg_type, sent)
+        await client.delete_messages(message.chat.id,[smsg.id])
+        return sent is not None
+
+    await turn()
 
     if msg.caption:
         caption = msg.caption
     else:
         caption = None
-    if batch_temp.IS_BATCH.get(message.from_user.id): return 
+    if batch_temp.IS_BATCH.get(message.from_user.id): return False
             
+    sent = None
     if "Document" == msg_type:
-        try:
-            ph_path = await acc.download_media(msg.document.thumbs[0].file_id)
-        except:
-            ph_path = None
+        ph_path = await thumb if thumb else None
         
         try:
-            await client.send_document(chat, file, thumb=ph_path, caption=caption, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML, progress=progress, progress_args=[message,"up"])
+            async with transfer_stage(message, msg_type, "upload", file_size):
+                sent = await rate_scheduler.send(client, chat, client.send_document, chat, file, thumb=ph_path, caption=caption, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML, progress=progress, progress_args=[status_key,"up"])
         except Exception as e:
             if ERROR_MESSAGE == True:
                 await client.send_message(message.chat.id, f"Error: {e}", reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
-        if ph_path != None: os.remove(ph_path)
         
 
     elif "Video" == msg_type:
-        try:
-            ph_path = await acc.download_media(msg.video.thumbs[0].file_id)
-        except:
-            ph_path = None
+        ph_path = await thumb if thumb else None
         
         try:
-            await client.send_video(chat, file, duration=msg.video.duration, width=msg.video.width, height=msg.video.height, thumb=ph_path, caption=caption, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML, progress=progress, progress_args=[message,"up"])
+            async with transfer_stage(message, msg_type, "upload", file_size):
+                sent = await rate_scheduler.send(client, chat, client.send_video, chat, file, duration=msg.video.duration, width=msg.video.width, height=msg.video.height, thumb=ph_path, caption=caption, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML, progress=progress, progress_args=[status_key,"up"])
         except Exception as e:
             if ERROR_MESSAGE == True:
                 await client.send_message(message.chat.id, f"Error: {e}", reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
-        if ph_path != None: os.remove(ph_path)
 
     elif "Animation" == msg_type:
         try:
-            await client.send_animation(chat, file, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
+            async with transfer_stage(message, msg_type, "upload", file_size):
+                sent = await rate_scheduler.send(client, chat, client.send_animation, chat, file, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
         except Exception as e:
             if ERROR_MESSAGE == True:
                 await client.send_message(message.chat.id, f"Error: {e}", reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
         
     elif "Sticker" == msg_type:
         try:
-            await client.send_sticker(chat, file, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
+            async with transfer_stage(message, msg_type, "upload", file_size):
+                sent = await rate_scheduler.send(client, chat, client.send_sticker, chat, file, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
         except Exception as e:
             if ERROR_MESSAGE == True:
                 await client.send_message(message.chat.id, f"Error: {e}", reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)     
 
     elif "Voice" == msg_type:
         try:
-            await client.send_voice(chat, file, caption=caption, caption_entities=msg.caption_entities, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML, progress=progress, progress_args=[message,"up"])
+            async with transfer_stage(message, msg_type, "upload", file_size):
+                sent = await rate_scheduler.send(client, chat, client.send_voice, chat, file, caption=caption, caption_entities=msg.caption_entities, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML, progress=progress, progress_args=[status_key,"up"])
         except Exception as e:
             if ERROR_MESSAGE == True:
                 await client.send_message(message.chat.id, f"Error: {e}", reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
 
     elif "Audio" == msg_type:
-        try:
-            ph_path = await acc.download_media(msg.audio.thumbs[0].file_id)
-        except:
-            ph_path = None
+        ph_path = await thumb if thumb else None
 
         try:
-            await client.send_audio(chat, file, thumb=ph_path, caption=caption, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML, progress=progress, progress_args=[message,"up"])   
+            async with transfer_stage(message, msg_type, "upload", file_size):
+                sent = await rate_scheduler.send(client, chat, client.send_audio, chat, file, thumb=ph_path, caption=caption, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML, progress=progress, progress_args=[status_key,"up"])   
         except Exception as e:
             if ERROR_MESSAGE == True:
                 await client.send_message(message.chat.id, f"Error: {e}", reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
         
-        if ph_path != None: os.remove(ph_path)
 
     elif "Photo" == msg_type:
         try:
-            await client.send_photo(chat, file, caption=caption, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
+            async with transfer_stage(message, msg_type, "upload", file_size):
+                sent = await rate_scheduler.send(client, chat, client.send_photo, chat, file, caption=caption, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
         except:
             if ERROR_MESSAGE == True:
                 await client.send_message(message.chat.id, f"Error: {e}", reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
     
-    if os.path.exists(f'{message.id}upstatus.txt'): 
-        os.remove(f'{message.id}upstatus.txt')
-        os.remove(file)
+    if sent is not None:
+        metrics.add_bytes("up", os.path.getsize(file))
+    await remember_upload(msg, msg_type, sent)
     await client.delete_messages(message.chat.id,[smsg.id])
+    return sent is not None
+
+
+# deliver an album with a single send_media_group call, returns the messages that were delivered
+async def handle_album(client: Client, acc, message: Message, chatid, msgs: list, turn) -> list:
+    msg_types = [get_message_type(msg) for msg in msgs]
+    if any(msg_type not in ALBUM_TYPES for msg_type in msg_types):
+        delivered = []
+        for msg in msgs:
+            if await handle_private(client, acc, message, chatid, msg.id, msg, turn=turn):
+                delivered.append(msg)
+        return delivered
+    chat = message.chat.id
+    if batch_temp.IS_BATCH.get(message.from_user.id): return []
+
+    smsg = await client.send_message(chat, '**Downloading Album**', reply_to_message_id=message.id)
+    # downloaded items stay staged until the album is sent
+    staged = AsyncExitStack()
+    try:
+        # every item is fetched at once, the album still costs one send
+        # every item settles before the stack is closed, so no late download escapes the cleanup
+        media = await asyncio.gather(*[
+            album_item(client, acc, message, msg, msg_type, staged) for msg, msg_type in zip(msgs, msg_types)
+        ], return_exceptions=True)
+        for item in media:
+            if isinstance(item, BaseException):
+                raise item
+        if batch_temp.IS_BATCH.get(message.from_user.id): return []
+        await turn()
+        async with transfer_stage(message, msg_types[0], "upload", sum(getattr(msg, msg_type.lower()).file_size or 0 for msg, msg_type in zip(msgs, msg_types))):
+            sent = await rate_scheduler.send(client, chat, client.send_media_group, chat, media, reply_to_message_id=message.id)
+        for msg, msg_type, item in zip(msgs, msg_types, sent):
+            await remember_upload(msg, msg_type, item)
+        return msgs
+    finally:
+        await staged.aclose()
+        await client.delete_messages(chat, [smsg.id])
+
+
+# build the input media of one album item, reusing a known file_id when possible
+async def album_item(client: Client, acc, message: Message, msg: Message, msg_type: str, staged: AsyncExitStack):
+    media = getattr(msg, msg_type.lower())
+    file = await db.get_cached_file(msg.chat.id, msg.id, media.file_unique_id)
+    if not file and server_copy.supports(msg):
+        file = await server_copy.fetch(client, acc, msg, msg_type)
+    if not file:
+        directory = await staged.enter_async_context(staging_area.reserve(staging_job(message), media.file_size))
+        async with transfer_stage(message, msg_type, "download", media.file_size):
+            file = await rate_scheduler.call(acc.name, acc.download_media, msg, file_name=directory + os.sep)
+        metrics.add_bytes("down", os.path.getsize(file))
+
+    caption = msg.caption or ""
+    if "Video" == msg_type:
+        return InputMediaVideo(file, caption=caption, caption_entities=msg.caption_entities, duration=media.duration, width=media.width, height=media.height)
+    return ALBUM_TYPES[msg_type](file, caption=caption, caption_entities=msg.caption_entities)
+
+
+# hold a fair scheduler slot for one transfer phase and time it
+@asynccontextmanager
+async def transfer_stage(message: Message, msg_type: str, phase: str, size: int):
+    async with transfer_scheduler.slot(message.from_user.id, transfer_scheduler.lane_for(msg_type, phase), size) as slot:
+        with metrics.time(phase):
+            yield slot
+
+
+# staging directory name of the request a download belongs to
+def staging_job(message: Message) -> str:
+    return f"{message.chat.id}_{message.id}"
+
+
+# keep the bot's file_id so the next request for this post skips the transfer
+async def remember_upload(msg: Message, msg_type: str, sent: Message):
+    if sent is None:
+        return
+    uploaded = getattr(sent, msg_type.lower(), None)
+    if uploaded is None:
+        return
+    try:
+        await db.cache_file(msg.chat.id, msg.id, getattr(msg, msg_type.lower()).file_unique_id, uploaded.file_id)
+    except Exception as e:
+        print(f"File cache write failed: {e}")
+
+
+async def _no_wait():
+    return
 
 
 # get the type of message
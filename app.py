@@ -1,15 +1,32 @@
 from flask import Flask
 import os
+import urllib.request
+import urllib.error
 
 app = Flask(__name__)
 
+# The bot's own /health on its metrics port, it fails when the event loop stalls.
+# Set it when the bot runs where this web process can reach it, e.g. http://127.0.0.1:9090/health
+BOT_HEALTH_URL = os.environ.get('BOT_HEALTH_URL', '')
+BOT_HEALTH_TIMEOUT = float(os.environ.get('BOT_HEALTH_TIMEOUT', '3'))
+
 @app.route('/')
 def hello_world():
     return 'VJ Save Restricted Content Bot is running!'
 
 @app.route('/health')
 def health_check():
-    return 'OK', 200
+    if not BOT_HEALTH_URL:
+        return 'OK', 200
+    try:
+        with urllib.request.urlopen(BOT_HEALTH_URL, timeout=BOT_HEALTH_TIMEOUT) as response:
+            return response.read().decode(), response.status
+    except urllib.error.HTTPError as e:
+        # the bot answered, but its loop is lagging
+        return e.read().decode(), e.code
+    except Exception as e:
+        # a bot whose loop is stuck does not answer at all
+        return f'Bot unreachable: {e}\n', 503
 
 if __name__ == "__main__":
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1 @@
+# Offline benchmarks for VJ Save Restricted Content Bot, run with: python -m benchmarks
@@ -0,0 +1,210 @@
+# Offline benchmarks for VJ Save Restricted Content Bot
+#
+#   python -m benchmarks                       every scenario, one process each
+#   python -m benchmarks --scenario batch_100  a single scenario
+#
+# Telegram and Mongo are replaced by seeded in-memory fakes, so the same arguments always
+# produce the same workload and runs can be compared before a deploy.
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import asyncio
+import resource
+import tempfile
+import contextlib
+import subprocess
+
+SCENARIOS = ("single_file", "batch_100", "concurrent_users", "login")
+MB = 1024 * 1024
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def configure_env(workdir: str):
+    """Settings the bot reads at import time, real environment values still win"""
+    defaults = dict(
+        BOT_TOKEN="0:benchmark", API_ID="1", API_HASH="benchmark", DB_URI="mongodb://localhost:27017",
+        METRICS_PORT="0",
+        # raw MTProto upload paths need a real connection, the fakes cover the pyrogram send_* paths
+        STREAM_RELAY="False", UPLOAD_CONNECTIONS="0",
+        THUMB_CACHE_DIR=os.path.join(workdir, "thumbs"),
+        MAX_REQUESTS_PER_WINDOW="1000000",
+    )
+    for name, value in defaults.items():
+        os.environ.setdefault(name, value)
+
+
+def percentile(values, share: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(share * (len(ordered) - 1))))]
+
+
+async def run_scenario(args, workdir: str) -> dict:
+    from benchmarks.fake_telegram import Network, Channel, FakeBot, FakeUserClient, FakeLoginClient, FakeMessage, Obj
+    from benchmarks.fake_db import FakeDatabase
+    from database.db import db
+    from client_pool import client_pool
+    from config import MAX_CONCURRENT_TRANSMISSIONS
+    from downloader import media_sessions
+    from server_copy import server_copy
+    import TechVJ.start as start
+    import TechVJ.generate as generate
+
+    network = Network(args.seed, args.latency, args.bandwidth * MB, args.flood_rate, args.flood_seconds)
+    fake_db = FakeDatabase(args.db_latency)
+    fake_db.install(db)
+    FakeLoginClient.network = network
+    generate.Client = FakeLoginClient
+
+    protected = not args.unprotected
+    channels = {}
+    if args.scenario == "single_file":
+        channel = Channel.single(-100100, args.file_size * MB, protected)
+        requests = {1: "https://t.me/c/100/1"}
+    elif args.scenario == "batch_100":
+        channel = Channel.generate(-100100, 100, args.seed, [1 * MB, 5 * MB, 20 * MB], protected, album_every=args.album_every)
+        requests = {1: "https://t.me/c/100/1-100"}
+    else:
+        channel = Channel.generate(-100100, args.users, args.seed, [5 * MB], protected)
+        requests = {user_id: f"https://t.me/c/100/{user_id}" for user_id in range(1, args.users + 1)}
+    channels[channel.chat_id] = channel
+
+    bot = FakeBot("benchmark bot", network, workdir, channels, MAX_CONCURRENT_TRANSMISSIONS)
+    bot.handlers.append(lambda client, message: server_copy.receive(message))
+    accounts = {}
+
+    async def acquire(user_id, session_string):
+        if user_id not in accounts:
+            accounts[user_id] = FakeUserClient(f"saverestricted_{user_id}", network, workdir, channels, bot, user_id, MAX_CONCURRENT_TRANSMISSIONS)
+        return accounts[user_id], "Session valid"
+    client_pool.acquire = acquire
+
+    async def open_session(client, dc_id):
+        return await client.open_media_session(dc_id)
+    media_sessions.open_session = open_session
+
+    def request(user_id, text):
+        return FakeMessage(bot, id=1000 + user_id, chat=Obj(id=user_id), text=text,
+                           from_user=Obj(id=user_id, first_name=f"user{user_id}", mention=f"user{user_id}"))
+
+    latencies = []
+    started = time.perf_counter()
+    if args.scenario == "login":
+        async def login(user_id):
+            bot.answers[user_id] = ["+10000000000", "1 2 3 4 5"]
+            begin = time.perf_counter()
+            await generate.main(bot, request(user_id, "/login"))
+            latencies.append(time.perf_counter() - begin)
+        await asyncio.gather(*[login(user_id) for user_id in range(1, args.users + 1)])
+        completed, moved = len(latencies), 0
+    else:
+        begins = {}
+
+        async def save(user_id, text):
+            fake_db.users[user_id] = {'id': user_id, 'name': None, 'session': "S" * 351}
+            begins[user_id] = time.perf_counter()
+            await start.save(bot, request(user_id, text))
+        await asyncio.gather(*[save(user_id, text) for user_id, text in requests.items()])
+        # a message's latency runs from the request that asked for it to its delivery
+        latencies = [delivered - begins[chat_id] for chat_id, size, delivered in bot.deliveries if chat_id in begins]
+        completed, moved = len(latencies), sum(size for _, size, _ in bot.deliveries)
+    elapsed = time.perf_counter() - started
+
+    return dict(
+        scenario=args.scenario,
+        seed=args.seed,
+        messages=completed,
+        seconds=round(elapsed, 3),
+        messages_per_s=round(completed / elapsed, 3),
+        mb_per_s=round(moved / MB / elapsed, 3),
+        p50_s=round(percentile(latencies, 0.5), 3),
+        p99_s=round(percentile(latencies, 0.99), 3),
+        api_calls=network.calls,
+        flood_waits=network.flood_waits,
+        db_calls=fake_db.calls,
+        # ru_maxrss is in kilobytes on Linux
+        peak_rss_mb=round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    )
+
+
+def run_one(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="savebot-bench-")
+    configure_env(workdir)
+    sys.path.insert(0, ROOT)
+    cwd = os.getcwd()
+    # pyrogram style relative downloads land in the scratch directory
+    os.chdir(workdir)
+    try:
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output if not args.verbose else sys.stdout):
+            return asyncio.run(run_scenario(args, workdir))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_all(args, argv) -> list:
+    """Run every scenario in a fresh interpreter so peak RSS is measured per scenario"""
+    results = []
+    for scenario in SCENARIOS:
+        command = [sys.executable, "-m", "benchmarks", "--json", "--scenario", scenario] + argv
+        completed = subprocess.run(command, capture_output=True, text=True, cwd=ROOT)
+        if completed.returncode != 0:
+            print(completed.stderr, file=sys.stderr)
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    return results
+
+
+def print_table(results: list):
+    columns = ("scenario", "messages", "seconds", "messages_per_s", "mb_per_s", "p50_s", "p99_s", "api_calls", "flood_waits", "peak_rss_mb")
+    widths = [max(len(column), *(len(str(result[column])) for result in results)) for column in columns]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for result in results:
+        print("  ".join(str(result[column]).ljust(width) for column, width in zip(columns, widths)))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Offline benchmarks against a fake Telegram and Mongo")
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per Telegram round trip")
+    parser.add_argument("--bandwidth", type=float, default=50, help="MB/s per transfer")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="share of API calls answered with FloodWait")
+    parser.add_argument("--flood-seconds", type=int, default=2)
+    parser.add_argument("--db-latency", type=float, default=0.002, help="seconds per Mongo round trip")
+    parser.add_argument("--file-size", type=int, default=50, help="MB, single_file scenario")
+    parser.add_argument("--users", type=int, default=20, help="users of the concurrent_users and login scenarios")
+    parser.add_argument("--album-every", type=int, default=0, help="make every Nth post of batch_100 part of an album")
+    parser.add_argument("--unprotected", action="store_true", help="source chat allows copying")
+    parser.add_argument("--json", action="store_true", help="print results as JSON lines")
+    parser.add_argument("--verbose", action="store_true", help="keep the bot's own output")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    if args.scenario == "all":
+        passthrough = [arg for arg in argv if arg not in ("--json",)]
+        # drop an explicit "--scenario all"
+        if "--scenario" in passthrough:
+            index = passthrough.index("--scenario")
+            del passthrough[index:index + 2]
+        results = run_all(args, passthrough)
+    else:
+        results = [run_one(args)]
+    if args.json:
+        for result in results:
+            print(json.dumps(result))
+    else:
+        print_table(results)
+
+
+if __name__ == "__main__":
+    main()
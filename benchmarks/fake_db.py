@@ -0,0 +1,157 @@
+# In-memory stand-in for database.db.Database used by the offline benchmarks
+import asyncio
+import itertools
+from datetime import datetime
+
+# Database methods replaced on the shared db instance
+METHODS = (
+    'create_indexes', 'add_user', 'is_user_exist', 'total_users_count', 'delete_user', 'set_session', 'get_session',
+    'get_cached_file', 'cache_file', 'forget_cached_file', 'trim_file_cache', 'create_job', 'claim_job',
+    'heartbeat_job', 'checkpoint_job', 'finish_job', 'cancel_user_jobs', 'queued_jobs_count',
+    'get_usage', 'add_usage', 'get_peers', 'save_peer', 'forget_peers',
+)
+
+
+class FakeDatabase:
+    """Keeps users, cached file ids and jobs in dicts, every call costs one simulated round trip"""
+
+    def __init__(self, latency: float = 0.002):
+        self.latency = latency
+        self.users = {}
+        self.files = {}
+        self.jobs = {}
+        self.usage = {}
+        self.peers = {}
+        self.job_ids = itertools.count(1)
+        self.calls = 0
+
+    def install(self, db):
+        """Point every data access method of the shared db instance at this fake"""
+        for name in METHODS:
+            setattr(db, name, getattr(self, name))
+
+    async def _rpc(self):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+
+    async def create_indexes(self):
+        await self._rpc()
+
+    async def add_user(self, id, name):
+        await self._rpc()
+        self.users.setdefault(int(id), {'id': int(id), 'name': name, 'session': None})
+
+    async def is_user_exist(self, id):
+        await self._rpc()
+        return int(id) in self.users
+
+    async def total_users_count(self):
+        await self._rpc()
+        return len(self.users)
+
+    async def delete_user(self, user_id):
+        await self._rpc()
+        self.users.pop(int(user_id), None)
+
+    async def set_session(self, id, session):
+        await self._rpc()
+        self.users.setdefault(int(id), {'id': int(id), 'name': None})['session'] = session
+
+    async def get_session(self, id):
+        await self._rpc()
+        user = self.users.get(int(id))
+        return user.get('session') if user else None
+
+    async def get_sessions(self, ids):
+        await self._rpc()
+        return {int(id): (self.users.get(int(id)) or {}).get('session') for id in ids}
+
+    async def get_cached_file(self, chat_id, msg_id, file_unique_id):
+        await self._rpc()
+        return self.files.get((chat_id, msg_id, file_unique_id))
+
+    async def cache_file(self, chat_id, msg_id, file_unique_id, file_id):
+        await self._rpc()
+        self.files[(chat_id, msg_id, file_unique_id)] = file_id
+
+    async def forget_cached_file(self, chat_id, msg_id, file_unique_id):
+        await self._rpc()
+        self.files.pop((chat_id, msg_id, file_unique_id), None)
+
+    async def trim_file_cache(self):
+        await self._rpc()
+
+    async def create_job(self, user_id, chat_id, message_id, from_id, to_id):
+        await self._rpc()
+        if any(job['user_id'] == int(user_id) and job.get('active') for job in self.jobs.values()):
+            return None
+        job_id = next(self.job_ids)
+        self.jobs[job_id] = dict(
+            _id=job_id, user_id=int(user_id), chat_id=chat_id, message_id=message_id, from_id=from_id, to_id=to_id,
+            last_done=from_id - 1, status='queued', active=True, worker=None, heartbeat=None, attempts=0,
+        )
+        return job_id
+
+    async def claim_job(self, worker, stale_after, job_id=None, exclude=(), started=None):
+        await self._rpc()
+        for job in self.jobs.values():
+            if job_id is not None and job['_id'] != job_id:
+                continue
+            if job['_id'] in exclude or job['status'] != 'queued':
+                continue
+            job.update(status='running', worker=worker, heartbeat=datetime.utcnow())
+            job['attempts'] += 1
+            return dict(job)
+        return None
+
+    async def heartbeat_job(self, job_id, worker):
+        await self._rpc()
+        job = self.jobs.get(job_id)
+        return job['status'] if job and job['worker'] == worker else None
+
+    async def checkpoint_job(self, job_id, last_done):
+        await self._rpc()
+        job = self.jobs[job_id]
+        job['last_done'] = max(job['last_done'], last_done)
+
+    async def finish_job(self, job_id, status):
+        await self._rpc()
+        job = self.jobs[job_id]
+        job['status'] = status
+        job.pop('active', None)
+
+    async def cancel_user_jobs(self, user_id):
+        await self._rpc()
+        for job in self.jobs.values():
+            if job['user_id'] == int(user_id) and job.get('active'):
+                job['status'] = 'cancelled'
+                job.pop('active', None)
+
+    async def queued_jobs_count(self):
+        await self._rpc()
+        return sum(1 for job in self.jobs.values() if job['status'] == 'queued')
+
+    async def get_usage(self, user_id, day):
+        await self._rpc()
+        return self.usage.get((int(user_id), day), 0)
+
+    async def add_usage(self, user_id, day, count):
+        await self._rpc()
+        key = (int(user_id), day)
+        self.usage[key] = self.usage.get(key, 0) + count
+
+    async def get_peers(self, user_id, account_id, limit):
+        await self._rpc()
+        docs = [doc for key, doc in self.peers.items() if key[:2] == (int(user_id), account_id)]
+        return sorted(docs, key=lambda doc: doc['used_at'], reverse=True)[:limit]
+
+    async def save_peer(self, user_id, account_id, peer_id, access_hash, peer_type, username=None):
+        await self._rpc()
+        self.peers[(int(user_id), account_id, peer_id)] = dict(
+            peer_id=peer_id, access_hash=access_hash, type=peer_type, username=username, used_at=datetime.utcnow(),
+        )
+
+    async def forget_peers(self, user_id):
+        await self._rpc()
+        for key in [key for key in self.peers if key[0] == int(user_id)]:
+            del self.peers[key]
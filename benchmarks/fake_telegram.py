@@ -0,0 +1,429 @@
+# Fake Telegram backend for the offline benchmarks
+import os
+import time
+import random
+import asyncio
+import itertools
+from typing import Dict, List, Optional
+from pyrogram import raw
+from pyrogram.errors import FloodWait
+from pyrogram.file_id import FileId, FileType, ThumbnailSource
+from pyrogram.storage.sqlite_storage import get_input_peer
+
+CHUNK_SIZE = 1024 * 1024
+
+# media id -> file size, what a raw GetFile is answered from
+MEDIA_SIZES: Dict[int, int] = {}
+
+
+class Network:
+    """Simulated link between this host and Telegram, every random draw comes from one seeded generator"""
+
+    def __init__(self, seed: int = 1, latency: float = 0.05, bandwidth: float = 50 * 1024 * 1024, flood_rate: float = 0.0, flood_seconds: int = 2):
+        self.random = random.Random(seed)
+        self.latency = latency          # seconds per API round trip
+        self.bandwidth = bandwidth      # bytes per second per transfer
+        self.flood_rate = flood_rate    # share of API calls answered with FloodWait
+        self.flood_seconds = flood_seconds
+        self.calls = 0
+        self.flood_waits = 0
+
+    async def rpc(self):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.flood_rate and self.random.random() < self.flood_rate:
+            self.flood_waits += 1
+            raise FloodWait(value=self.flood_seconds)
+
+    async def transfer(self, size: int):
+        await asyncio.sleep(size / self.bandwidth)
+
+
+class Obj:
+    """Attribute bag standing in for pyrogram types"""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def __getattr__(self, name):
+        # pyrogram types answer None for every field that is not set
+        return None
+
+
+MEDIA_TYPES = ("document", "video", "animation", "sticker", "voice", "audio", "photo")
+
+
+class FakeMessage(Obj):
+    def __init__(self, client=None, **kwargs):
+        kwargs.setdefault('empty', False)
+        kwargs.setdefault('service', None)
+        super().__init__(**kwargs)
+        self._client = client
+
+    async def reply(self, text, **kwargs):
+        return await self._client.send_message(self.chat.id, text, reply_to_message_id=self.id)
+
+    reply_text = reply
+
+    async def delete(self):
+        return await self._client.delete_messages(self.chat.id, [self.id])
+
+    def stop_propagation(self):
+        pass
+
+
+_media_ids = itertools.count(1)
+
+
+def make_file_id(kind: str, size: int) -> str:
+    """A real encoded file_id, so the raw download path can decode its location"""
+    media_id = next(_media_ids)
+    MEDIA_SIZES[media_id] = size
+    if kind == "photo":
+        file_id = FileId(file_type=FileType.PHOTO, dc_id=2, media_id=media_id, access_hash=media_id, file_reference=b"",
+                         thumbnail_source=ThumbnailSource.THUMBNAIL, thumbnail_file_type=FileType.PHOTO, thumbnail_size="y",
+                         volume_id=0, local_id=0)
+    else:
+        file_id = FileId(file_type=FileType.DOCUMENT, dc_id=2, media_id=media_id, access_hash=media_id, file_reference=b"")
+    return file_id.encode()
+
+
+def make_media(kind: str, size: int, unique_id: str, thumb: bool = True) -> Obj:
+    thumbs = [Obj(file_id=f"thumb-{unique_id}", file_unique_id=f"thumb-{unique_id}")] if thumb else None
+    return Obj(
+        file_id=make_file_id(kind, size), file_unique_id=unique_id, file_size=size, file_name=f"{unique_id}.bin",
+        mime_type="application/octet-stream", thumbs=thumbs, duration=1, width=1280, height=720
+    )
+
+
+class Channel:
+    """A source chat with a fixed, seeded history"""
+
+    def __init__(self, chat_id: int, messages: Dict[int, FakeMessage], protected: bool = True):
+        self.chat_id = chat_id
+        self.messages = messages
+        self.protected = protected
+
+    @classmethod
+    def generate(cls, chat_id: int, count: int, seed: int, sizes: List[int], protected: bool = True, album_every: int = 0):
+        """Build `count` posts, mostly media with sizes drawn from `sizes`, some text and optionally albums"""
+        rng = random.Random(seed)
+        chat = Obj(id=chat_id, has_protected_content=protected)
+        messages = {}
+        group = None
+        for msg_id in range(1, count + 1):
+            kind = rng.choice(("document", "document", "video", "photo", "audio", "text"))
+            fields = dict(id=msg_id, chat=chat, has_protected_content=protected)
+            # the first three posts of every `album_every` posts form one album
+            if album_every and (msg_id - 1) % album_every < 3:
+                group = f"album-{(msg_id - 1) // album_every}"
+                kind = "photo"
+            else:
+                group = None
+            if kind == "text":
+                fields['text'] = f"post {msg_id}"
+            else:
+                size = rng.choice(sizes) if kind != "photo" else 200 * 1024
+                fields[kind] = make_media(kind, size, f"{chat_id}-{msg_id}", thumb=kind != "photo")
+                fields['caption'] = f"caption {msg_id}"
+                fields['media_group_id'] = group
+            messages[msg_id] = FakeMessage(**fields)
+        return cls(chat_id, messages, protected)
+
+    @classmethod
+    def single(cls, chat_id: int, size: int, protected: bool = True):
+        """One document post, for timing a single large transfer"""
+        chat = Obj(id=chat_id, has_protected_content=protected)
+        msg = FakeMessage(id=1, chat=chat, has_protected_content=protected, document=make_media("document", size, f"{chat_id}-1"), caption="caption 1")
+        return cls(chat_id, {1: msg}, protected)
+
+    def get(self, msg_id: int) -> FakeMessage:
+        return self.messages.get(msg_id) or FakeMessage(id=msg_id, empty=True, chat=Obj(id=self.chat_id))
+
+
+class FakeStorage:
+    """The peer table of a pyrogram session, nothing else"""
+
+    def __init__(self, account_id: int):
+        self.account_id = account_id
+        # peer id -> (id, access_hash, type, username, phone_number)
+        self.peers = {}
+
+    async def user_id(self):
+        return self.account_id
+
+    async def update_peers(self, peers):
+        for row in peers:
+            self.peers[row[0]] = row
+
+    async def get_peer_by_id(self, peer_id):
+        if peer_id not in self.peers:
+            raise KeyError(f"ID not found: {peer_id}")
+        return get_input_peer(*self.peers[peer_id][:3])
+
+
+class FakeMediaSession:
+    """A media connection of a user client, it answers raw GetFile parts"""
+
+    def __init__(self, network: Network):
+        self.network = network
+
+    async def invoke(self, query, sleep_threshold: int = None):
+        await self.network.rpc()
+        size = MEDIA_SIZES[query.location.id]
+        length = max(0, min(query.limit, size - query.offset))
+        await self.network.transfer(length)
+        return raw.types.upload.File(type=raw.types.storage.FileUnknown(), mtime=0, bytes=bytes(length))
+
+    async def stop(self):
+        pass
+
+
+class FakeClient:
+    """Common part of the bot and user clients"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, name: str, network: Network, workdir: str, max_concurrent_transmissions: int = 1):
+        self.name = name
+        self.network = network
+        self.workdir = workdir
+        self.is_connected = True
+        # like pyrogram, every get_file and save_file call holds one of these for its whole transfer
+        self.get_file_semaphore = asyncio.Semaphore(max_concurrent_transmissions)
+        self.save_file_semaphore = asyncio.Semaphore(max_concurrent_transmissions)
+        self.me = Obj(id=next(self._ids), username=name.replace(" ", "_"))
+        self.storage = FakeStorage(self.me.id)
+        self.message_ids = itertools.count(1)
+
+    def rnd_id(self) -> int:
+        return self.network.random.getrandbits(63)
+
+    async def resolve_peer(self, peer_id):
+        if peer_id in self.storage.peers:
+            return await self.storage.get_peer_by_id(peer_id)
+        await self.network.rpc()
+        peer_type = "channel" if isinstance(peer_id, int) and peer_id < 0 else "user"
+        await self.storage.update_peers([(peer_id, self.network.random.getrandbits(63), peer_type, None, None)])
+        return await self.storage.get_peer_by_id(peer_id)
+
+
+class FakeUserClient(FakeClient):
+    """The logged in user account, it can read the protected source chats"""
+
+    def __init__(self, name: str, network: Network, workdir: str, channels: Dict[int, Channel], bot: "FakeBot" = None, user_id: int = 0,
+                 max_concurrent_transmissions: int = 1):
+        super().__init__(name, network, workdir, max_concurrent_transmissions)
+        self.channels = channels
+        self.bot = bot
+        self.user_id = user_id
+
+    def _channel(self, chat_id) -> Channel:
+        return self.channels[int(chat_id)]
+
+    async def get_messages(self, chat_id, message_ids):
+        await self.network.rpc()
+        channel = self._channel(chat_id)
+        if isinstance(message_ids, list):
+            return [channel.get(msg_id) for msg_id in message_ids]
+        return channel.get(message_ids)
+
+    def _media(self, msg):
+        for kind in MEDIA_TYPES:
+            media = getattr(msg, kind)
+            if media is not None:
+                return media
+
+    async def open_media_session(self, dc_id: int) -> FakeMediaSession:
+        await self.network.rpc()
+        return FakeMediaSession(self.network)
+
+    async def stream_media(self, msg, offset: int = 0, limit: int = 0):
+        async with self.get_file_semaphore:
+            # get_file opens a media session, then asks for every chunk with its own GetFile
+            await self.network.rpc()
+            size = self._media(msg).file_size
+            total = -(-size // CHUNK_SIZE)
+            end = total if not limit else min(total, offset + limit)
+            for index in range(offset, end):
+                length = min(CHUNK_SIZE, size - index * CHUNK_SIZE)
+                await self.network.rpc()
+                await self.network.transfer(length)
+                yield bytes(length)
+
+    async def download_media(self, message, file_name: Optional[str] = None, progress=None, progress_args=()):
+        async with self.get_file_semaphore:
+            return await self._download_media(message, file_name, progress, progress_args)
+
+    async def _download_media(self, message, file_name: Optional[str] = None, progress=None, progress_args=()):
+        await self.network.rpc()
+        if isinstance(message, str):
+            # a thumbnail file_id
+            size, name = 8 * 1024, message + ".jpg"
+        else:
+            media = self._media(message)
+            size, name = media.file_size, f"{message.chat.id}_{message.id}_{media.file_name}"
+        # like pyrogram, a file_name ending in a separator is a directory and the name is generated
+        directory, given = os.path.split(file_name or "")
+        path = os.path.join(directory if os.path.isabs(directory) else os.path.join(self.workdir, directory), given or name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        done = 0
+        with open(path, "wb") as f:
+            while done < size:
+                length = min(CHUNK_SIZE, size - done)
+                await self.network.rpc()
+                await self.network.transfer(length)
+                f.write(bytes(length))
+                done += length
+                if progress:
+                    progress(done, size, *progress_args)
+        return path
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        await self.network.rpc()
+        source = self._channel(from_chat_id)
+        if source.protected:
+            raise ValueError("CHAT_FORWARDS_RESTRICTED")
+        msg = source.get(message_id)
+        copied = FakeMessage(self, id=next(self.message_ids), chat=Obj(id=chat_id))
+        # the bot receives the copy as an incoming private message from the logged in account
+        received = FakeMessage(self.bot, id=next(self.bot.message_ids), chat=Obj(id=self.me.id), from_user=Obj(id=self.me.id))
+        for kind in MEDIA_TYPES:
+            media = getattr(msg, kind)
+            if media is not None:
+                setattr(received, kind, Obj(**dict(media.__dict__, file_id=f"bot-{media.file_unique_id}")))
+        asyncio.get_running_loop().call_later(self.network.latency, self.bot.dispatch, received)
+        return copied
+
+    async def delete_messages(self, chat_id, message_ids, revoke: bool = True):
+        await self.network.rpc()
+        return True
+
+
+class FakeBot(FakeClient):
+    """The bot account, it records everything it delivers"""
+
+    def __init__(self, name: str, network: Network, workdir: str, channels: Dict[int, Channel] = None, max_concurrent_transmissions: int = 1):
+        super().__init__(name, network, workdir, max_concurrent_transmissions)
+        self.channels = channels or {}
+        self.handlers = []
+        self.answers: Dict[int, List[str]] = {}
+        # (chat id, bytes, time delivered)
+        self.deliveries: List[tuple] = []
+
+    def dispatch(self, message):
+        for handler in self.handlers:
+            handler(self, message)
+
+    def _deliver(self, chat_id, size: int = 0, **media):
+        self.deliveries.append((chat_id, size, time.perf_counter()))
+        return FakeMessage(self, id=next(self.message_ids), chat=Obj(id=chat_id), **media)
+
+    async def _upload(self, path: str, progress=None, progress_args=()):
+        async with self.save_file_semaphore:
+            size = os.path.getsize(path)
+            done = 0
+            while done < size:
+                length = min(CHUNK_SIZE, size - done)
+                await self.network.transfer(length)
+                done += length
+                if progress:
+                    progress(done, size, *progress_args)
+            return size
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self.network.rpc()
+        if kwargs.get('entities') is not None or text.startswith("post "):
+            return self._deliver(chat_id, text=text)
+        return FakeMessage(self, id=next(self.message_ids), chat=Obj(id=chat_id), text=text)
+
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        await self.network.rpc()
+
+    async def delete_messages(self, chat_id, message_ids, revoke: bool = True):
+        await self.network.rpc()
+        return True
+
+    async def _send_file(self, kind: str, chat_id, file, thumb=None, progress=None, progress_args=(), **kwargs):
+        await self.network.rpc()
+        if thumb:
+            await self._upload(thumb)
+        size = await self._upload(file, progress, progress_args)
+        unique_id = os.path.basename(file)
+        return self._deliver(chat_id, size, **{kind: Obj(file_id=f"bot-{unique_id}", file_unique_id=unique_id, file_size=size)})
+
+    async def send_document(self, chat_id, document, **kwargs):
+        return await self._send_file("document", chat_id, document, **kwargs)
+
+    async def send_video(self, chat_id, video, **kwargs):
+        return await self._send_file("video", chat_id, video, **kwargs)
+
+    async def send_audio(self, chat_id, audio, **kwargs):
+        return await self._send_file("audio", chat_id, audio, **kwargs)
+
+    async def send_voice(self, chat_id, voice, **kwargs):
+        return await self._send_file("voice", chat_id, voice, **kwargs)
+
+    async def send_animation(self, chat_id, animation, **kwargs):
+        return await self._send_file("animation", chat_id, animation, **kwargs)
+
+    async def send_sticker(self, chat_id, sticker, **kwargs):
+        return await self._send_file("sticker", chat_id, sticker, **kwargs)
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        return await self._send_file("photo", chat_id, photo, **kwargs)
+
+    async def send_cached_media(self, chat_id, file_id, **kwargs):
+        await self.network.rpc()
+        return self._deliver(chat_id, document=Obj(file_id=file_id))
+
+    async def send_media_group(self, chat_id, media, **kwargs):
+        await self.network.rpc()
+        sent = []
+        for item in media:
+            kind = type(item).__name__.replace("InputMedia", "").lower()
+            size = await self._upload(item.media) if os.path.exists(str(item.media)) else 0
+            sent.append(self._deliver(chat_id, size, **{kind: Obj(file_id=f"bot-{os.path.basename(str(item.media))}")}))
+        return sent
+
+    async def get_messages(self, chat_id, message_ids):
+        await self.network.rpc()
+        channel = self.channels[chat_id]
+        return [channel.get(msg_id) for msg_id in message_ids]
+
+    async def forward_messages(self, chat_id, from_chat_id, message_ids, **kwargs):
+        await self.network.rpc()
+        channel = self.channels[from_chat_id]
+        if channel.protected:
+            raise ValueError("CHAT_FORWARDS_RESTRICTED")
+        return [self._deliver(chat_id, **{k: v for k, v in channel.get(msg_id).__dict__.items() if k in MEDIA_TYPES + ('text',)}) for msg_id in message_ids]
+
+    async def ask(self, chat_id, text, filters=None, timeout=None):
+        """pyromod style question, answered from the scripted replies of the user"""
+        await self.network.rpc()
+        return FakeMessage(self, id=next(self.message_ids), chat=Obj(id=chat_id), from_user=Obj(id=chat_id), text=self.answers[chat_id].pop(0))
+
+
+class FakeLoginClient:
+    """Stands in for the throwaway pyrogram Client the /login flow creates"""
+
+    network: Network = None
+
+    def __init__(self, name, api_id=None, api_hash=None, session_string=None, **kwargs):
+        self.session_string = session_string
+
+    async def connect(self):
+        await self.network.rpc()
+
+    async def disconnect(self):
+        pass
+
+    async def send_code(self, phone_number):
+        await self.network.rpc()
+        return Obj(phone_code_hash="hash")
+
+    async def sign_in(self, phone_number, phone_code_hash, phone_code):
+        await self.network.rpc()
+
+    async def export_session_string(self):
+        return "S" * 351
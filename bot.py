@@ -2,12 +2,41 @@
 # Subscribe YouTube Channel For Amazing Bot https://youtube.com/@Tech_VJ
 # Ask Doubt on telegram @KingVJ01
 
-from pyrogram import Client
-from config import API_ID, API_HASH, BOT_TOKEN
+import time
+import multiprocessing
+from pyrogram import Client, filters
+from pyrogram.handlers import MessageHandler
+from config import API_ID, API_HASH, BOT_TOKEN, BOT_ROLE, WORKER_PROCESSES, MAX_CONCURRENT_TRANSMISSIONS, SLEEP_THRESHOLD
+from client_pool import client_pool
+from database.db import db
+from jobs import batch_queue
+from metrics import metrics
+from loop_monitor import loop_monitor
+from event_log import security_events
+from security import security_manager
+from staging import staging_area
+from TechVJ.start import run_claimed_job, receive_server_copy
 
 class Bot(Client):
 
-    def __init__(self):
+    def __init__(self, role=BOT_ROLE, index=0):
+        self.role = role
+        self.index = index
+        if role == "worker":
+            # workers only run queued batches, updates are handled by the main process
+            batch_queue.WORKER_ID = f"{batch_queue.WORKER_ID}-worker{index}"
+            super().__init__(
+                f"techvj worker {index}",
+                api_id=API_ID,
+                api_hash=API_HASH,
+                bot_token=BOT_TOKEN,
+                in_memory=True,
+                sleep_threshold=SLEEP_THRESHOLD,
+                max_concurrent_transmissions=MAX_CONCURRENT_TRANSMISSIONS
+            )
+            # batches run here, so media copied to the bot for them must be caught here too
+            self.add_handler(MessageHandler(receive_server_copy, filters.private & filters.incoming & filters.media), group=-1)
+            return
         super().__init__(
             "techvj login",
             api_id=API_ID,
@@ -15,21 +44,93 @@ class Bot(Client):
             bot_token=BOT_TOKEN,
             plugins=dict(root="TechVJ"),
             workers=50,
-            sleep_threshold=10
+            sleep_threshold=SLEEP_THRESHOLD,
+            max_concurrent_transmissions=MAX_CONCURRENT_TRANSMISSIONS
         )
 
-      
+
     async def start(self):
-            
+
+        # files left by a crashed or killed process
+        staging_area.sweep()
         await super().start()
-        print('Bot Started Powered By @VJ_Botz')
+        await db.create_indexes()
+        await security_manager.create_indexes()
+        await security_events.start()
+        client_pool.start()
+        if self.role != "frontend":
+            batch_queue.start(self, run_claimed_job)
+        loop_monitor.start()
+        register_metrics()
+        # workers listen next to the main process, one port each
+        await metrics.start_server(0 if self.role != "worker" else self.index + 1)
+        print(f'Bot Started ({self.role}) Powered By @VJ_Botz')
 
     async def stop(self, *args):
 
+        # workers drain their batches at the same time as this process
+        if self.role != "worker":
+            signal_workers()
+        await batch_queue.drain()
+        await client_pool.close_all()
+        await metrics.stop_server()
+        loop_monitor.stop()
+        await security_events.stop()
         await super().stop()
         print('Bot Stopped Bye')
 
-Bot().run()
+
+def register_metrics():
+    """Expose live bot state next to the stage timings"""
+    metrics.gauge('bot_active_jobs', 'Batches running in this process', lambda: len(batch_queue.tasks))
+    metrics.gauge('bot_queued_jobs', 'Batches waiting in the shared queue', db.queued_jobs_count)
+    metrics.gauge('bot_client_pool_size', 'Pooled user clients', lambda: len(client_pool.clients))
+    metrics.gauge('bot_client_pool_in_use', 'Pooled user clients running a batch', lambda: sum(1 for entry in client_pool.clients.values() if entry['in_use']))
+    metrics.counter('bot_file_cache_hits_total', 'Media re-sent from the file_id cache without a transfer', lambda: db.cache_hits)
+    metrics.counter('bot_file_cache_misses_total', 'Media not found in the file_id cache', lambda: db.cache_misses)
+    metrics.route('/health', loop_monitor.health)
+
+
+# worker processes started by this process
+workers = []
+
+
+def run_worker(index):
+    Bot(role="worker", index=index).run()
+
+
+def signal_workers():
+    """Ask every worker to stop, each one drains its batches like the main process"""
+    for worker in workers:
+        if worker.is_alive():
+            worker.terminate()
+
+
+def join_workers():
+    """Wait for the workers to finish draining, kill the ones that overrun"""
+    signal_workers()
+    # a worker needs its drain timeout plus a moment to disconnect
+    deadline = time.monotonic() + batch_queue.DRAIN_TIMEOUT + 15
+    for worker in workers:
+        worker.join(max(0, deadline - time.monotonic()))
+        if worker.is_alive():
+            print(f"{worker.name} did not stop in time, killing it")
+            worker.kill()
+            worker.join()
+
+
+if __name__ == "__main__":
+    # spawn, not fork, so every worker opens its own Mongo and Telegram connections
+    context = multiprocessing.get_context("spawn")
+    for index in range(WORKER_PROCESSES):
+        worker = context.Process(target=run_worker, args=(index,), name=f"worker{index}")
+        worker.start()
+        workers.append(worker)
+    try:
+        # SIGTERM or SIGINT stops the main client, whose stop() signals the workers
+        Bot().run()
+    finally:
+        join_workers()
 
 # Don't Remove Credit Tg - @VJ_Botz
 # Subscribe YouTube Channel For Amazing Bot https://youtube.com/@Tech_VJ
@@ -0,0 +1,162 @@
+# User client pool for VJ Save Restricted Content Bot
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+from pyrogram import Client
+from config import API_ID, API_HASH, MAX_CONCURRENT_TRANSMISSIONS, SLEEP_THRESHOLD
+from downloader import media_sessions
+from database.db import db
+from security import security_manager
+from peers import peer_cache
+
+class UserClientPool:
+    def __init__(self):
+        # Pool configurations
+        self.IDLE_TIMEOUT = int(os.environ.get('CLIENT_IDLE_TIMEOUT', '600'))  # 10 minutes
+        self.MAX_CLIENTS = int(os.environ.get('MAX_USER_CLIENTS', '50'))
+        self.SWEEP_INTERVAL = int(os.environ.get('CLIENT_SWEEP_INTERVAL', '60'))
+
+        # user_id -> {'client', 'session', 'last_used', 'in_use'}, least recently used first
+        self.clients: "OrderedDict[int, Dict]" = OrderedDict()
+        # user_id -> [lock, callers holding or waiting for it], dropped when the last caller leaves
+        self.locks: Dict[int, List] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+
+    @asynccontextmanager
+    async def _lock(self, user_id: int):
+        """Serialize pool changes of one user, only users being worked on keep a lock"""
+        entry = self.locks.get(user_id)
+        if entry is None:
+            entry = self.locks[user_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.locks[user_id]
+
+    async def acquire(self, user_id: int, session_string: str) -> tuple[Optional[Client], str]:
+        """Return a connected and validated client for the user, reusing a pooled one if possible"""
+        async with self._lock(user_id):
+            entry = self.clients.get(user_id)
+            if entry and entry['session'] == session_string and entry['client'].is_connected:
+                entry['last_used'] = time.time()
+                entry['in_use'] += 1
+                self.clients.move_to_end(user_id)
+                return entry['client'], "Session valid"
+
+            # Session changed or connection dropped, start over
+            if entry:
+                await self.close(user_id, _locked=True)
+
+            acc = Client(f"saverestricted_{user_id}", session_string=session_string, api_hash=API_HASH, api_id=API_ID, in_memory=True,
+                         max_concurrent_transmissions=MAX_CONCURRENT_TRANSMISSIONS, sleep_threshold=SLEEP_THRESHOLD)
+            await acc.connect()
+
+            try:
+                is_valid, validation_msg = await security_manager.validate_session(acc, user_id)
+            except BaseException:
+                await self._disconnect(acc)
+                raise
+            if not is_valid:
+                await self._disconnect(acc)
+                return None, validation_msg
+
+            # an in-memory session starts empty, seed it with the chats this account used before
+            try:
+                await peer_cache.warm(acc, user_id)
+            except Exception as e:
+                print(f"Peer cache warm-up failed: {e}")
+
+            self.clients[user_id] = {
+                'client': acc,
+                'session': session_string,
+                'last_used': time.time(),
+                'in_use': 1
+            }
+            await self._evict_overflow()
+            return acc, validation_msg
+
+    def release(self, user_id: int):
+        """Mark one use of the user's client as finished"""
+        entry = self.clients.get(user_id)
+        if entry:
+            entry['in_use'] = max(0, entry['in_use'] - 1)
+            entry['last_used'] = time.time()
+
+    async def close(self, user_id: int, _locked: bool = False):
+        """Disconnect and forget the user's pooled client"""
+        if not _locked:
+            async with self._lock(user_id):
+                return await self.close(user_id, _locked=True)
+        entry = self.clients.pop(user_id, None)
+        if entry:
+            await self._disconnect(entry['client'])
+
+    async def close_all(self):
+        """Disconnect every pooled client, used on shutdown"""
+        if self._sweeper:
+            self._sweeper.cancel()
+            self._sweeper = None
+        for user_id in list(self.clients):
+            await self.close(user_id)
+
+    async def _disconnect(self, acc: Client):
+        await media_sessions.close(acc)
+        try:
+            await acc.disconnect()
+        except Exception:
+            pass
+
+    async def _evict_overflow(self):
+        """Close least recently used idle clients while the pool is over its cap"""
+        for user_id in list(self.clients):
+            if len(self.clients) <= self.MAX_CLIENTS:
+                break
+            entry = self.clients[user_id]
+            if entry['in_use'] == 0:
+                self.clients.pop(user_id)
+                await self._disconnect(entry['client'])
+
+    async def sweep_idle(self):
+        """Close clients that have not been used within IDLE_TIMEOUT"""
+        now = time.time()
+        for user_id in list(self.clients):
+            async with self._lock(user_id):
+                entry = self.clients.get(user_id)
+                if entry and entry['in_use'] == 0 and now - entry['last_used'] > self.IDLE_TIMEOUT:
+                    await self.close(user_id, _locked=True)
+
+    async def sweep_revoked(self):
+        """Close idle clients whose session was logged out or replaced, possibly by another process"""
+        idle = [user_id for user_id, entry in self.clients.items() if entry['in_use'] == 0]
+        if not idle:
+            return
+        sessions = await db.get_sessions(idle)
+        for user_id in idle:
+            async with self._lock(user_id):
+                entry = self.clients.get(user_id)
+                if entry and entry['in_use'] == 0 and entry['session'] != sessions[user_id]:
+                    await self.close(user_id, _locked=True)
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.SWEEP_INTERVAL)
+            try:
+                await self.sweep_idle()
+                await self.sweep_revoked()
+            except Exception as e:
+                print(f"Client pool sweep error: {e}")
+
+    def start(self):
+        """Start the idle sweeper, must be called from a running event loop"""
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+# Global user client pool instance
+client_pool = UserClientPool()
@@ -19,6 +19,28 @@ API_HASH = os.environ.get("API_HASH", "")
 DB_URI = os.environ.get("DB_URI", "") # Warning - Give Db uri in deploy server environment variable, don't give in repo.
 DB_NAME = os.environ.get("DB_NAME", "vjsavecontentbot")
 
+# Uploaded file_id cache, entries unused for FILE_CACHE_TTL seconds expire and the least recently used are trimmed above FILE_CACHE_MAX_ENTRIES
+FILE_CACHE_TTL = int(os.environ.get("FILE_CACHE_TTL", str(30 * 24 * 3600)))
+FILE_CACHE_MAX_ENTRIES = int(os.environ.get("FILE_CACHE_MAX_ENTRIES", "100000"))
+
+# Seconds finished, cancelled or failed batch jobs are kept before Mongo removes them
+FINISHED_JOB_TTL = int(os.environ.get("FINISHED_JOB_TTL", str(7 * 24 * 3600)))
+
+# Seconds a resolved chat (id and access hash) of a user's account is remembered after its last use
+PEER_CACHE_TTL = int(os.environ.get("PEER_CACHE_TTL", str(30 * 24 * 3600)))
+
+# Longest FloodWait in seconds pyrogram sleeps through by itself, longer ones are raised to rate_scheduler
+SLEEP_THRESHOLD = int(os.environ.get("SLEEP_THRESHOLD", "10"))
+
+# Downloads and uploads one client runs at the same time, pyrogram allows only one by default
+MAX_CONCURRENT_TRANSMISSIONS = int(os.environ.get("MAX_CONCURRENT_TRANSMISSIONS", "8"))
+
+# Process role: "all" handles updates and runs batches, "frontend" only queues batches, "worker" only runs them
+BOT_ROLE = os.environ.get("BOT_ROLE", "all").lower()
+
+# Extra worker processes started next to the main process, all of them share the Mongo job queue
+WORKER_PROCESSES = int(os.environ.get("WORKER_PROCESSES", "0"))
+
 # If You Want Error Message In Your Personal Message Then Turn It True Else If You Don't Want Then Flase
 ERROR_MESSAGE = os.environ.get('ERROR_MESSAGE', 'True').lower() in ('true', '1', 'yes', 'on')
 
@@ -0,0 +1,70 @@
+# Shared test setup for VJ Save Restricted Content Bot
+import os
+import pytest
+
+# config exits without these, no test talks to Telegram or a real Mongo
+for name, value in dict(BOT_TOKEN="0:test", API_ID="1", API_HASH="test", DB_URI="mongodb://localhost:27017").items():
+    os.environ.setdefault(name, value)
+
+
+class Obj:
+    """Stand-in for pyrogram types, attributes that were not given read as None"""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def __getattr__(self, name):
+        return None
+
+
+class AsyncCursor:
+    """Motor style cursor over a mongomock cursor"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self.cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, count):
+        self.cursor.limit(count)
+        return self
+
+    async def __aiter__(self):
+        for doc in self.cursor:
+            yield doc
+
+
+class AsyncCollection:
+    """Motor style collection over a mongomock one, every call answers right away"""
+
+    def __init__(self, collection):
+        self.sync = collection
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self.sync.find(*args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self.sync, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+@pytest.fixture
+def mongo():
+    """A fresh in-memory database, collection(name) returns a motor style collection of it"""
+    mongomock = pytest.importorskip("mongomock")
+    database = mongomock.MongoClient().db
+    return lambda name: AsyncCollection(database[name])
+
+
+@pytest.fixture
+def database(mongo, monkeypatch):
+    """The global db with its collections moved to the in-memory database"""
+    from database.db import db
+    for attribute, name in (('col', 'users'), ('files', 'file_cache'), ('jobs', 'jobs'), ('usage', 'usage'), ('peers', 'peers')):
+        monkeypatch.setattr(db, attribute, mongo(name))
+    return db
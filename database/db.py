@@ -1,12 +1,42 @@
 import motor.motor_asyncio
-from config import DB_NAME, DB_URI
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure, DuplicateKeyError
+from metrics import metrics
+from config import DB_NAME, DB_URI, FILE_CACHE_TTL, FILE_CACHE_MAX_ENTRIES, FINISHED_JOB_TTL, PEER_CACHE_TTL
 
 class Database:
     
     def __init__(self, uri, database_name):
-        self._client = motor.motor_asyncio.AsyncIOMotorClient(uri)
+        self._client = motor.motor_asyncio.AsyncIOMotorClient(uri, event_listeners=[metrics.mongo_listener])
         self.db = self._client[database_name]
         self.col = self.db.users
+        self.files = self.db.file_cache
+        self.jobs = self.db.jobs
+        self.usage = self.db.usage
+        self.peers = self.db.peers
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache_writes = 0
+
+    async def create_indexes(self):
+        try:
+            await self.col.create_index('id', unique=True)
+        except OperationFailure as e:
+            print(f"Could not create unique index on users.id, remove duplicate users first: {e}")
+        await self.files.create_index([('chat_id', 1), ('msg_id', 1), ('file_unique_id', 1)], unique=True)
+        await self.files.create_index('last_used', expireAfterSeconds=FILE_CACHE_TTL)
+        await self.jobs.create_index('status')
+        # one queued or running batch per user across every bot process
+        await self.jobs.create_index('user_id', unique=True, partialFilterExpression={'active': True})
+        await self.jobs.create_index('finished_at', expireAfterSeconds=FINISHED_JOB_TTL)
+        await self.usage.create_index([('user_id', 1), ('day', 1)], unique=True)
+        # daily counters are only read on their own day
+        await self.usage.create_index('updated', expireAfterSeconds=2 * 24 * 3600)
+        # access hashes are only valid for the account that saw them
+        await self.peers.create_index([('user_id', 1), ('account_id', 1), ('peer_id', 1)], unique=True)
+        await self.peers.create_index([('user_id', 1), ('account_id', 1), ('used_at', -1)])
+        await self.peers.create_index('used_at', expireAfterSeconds=PEER_CACHE_TTL)
 
     def new_user(self, id, name):
         return dict(
@@ -16,15 +46,15 @@ class Database:
         )
     
     async def add_user(self, id, name):
-        user = self.new_user(id, name)
-        await self.col.insert_one(user)
+        user = self.new_user(int(id), name)
+        await self.col.update_one({'id': int(id)}, {'$setOnInsert': user}, upsert=True)
     
     async def is_user_exist(self, id):
         user = await self.col.find_one({'id':int(id)})
         return bool(user)
     
     async def total_users_count(self):
-        count = await self.col.count_documents({})
+        count = await self.col.estimated_document_count()
         return count
 
     async def get_all_users(self):
@@ -37,7 +67,154 @@ class Database:
         await self.col.update_one({'id': int(id)}, {'$set': {'session': session}})
 
     async def get_session(self, id):
-        user = await self.col.find_one({'id': int(id)})
-        return user.get('session')
+        """The user's session string, always read from the database since other processes log users in and out"""
+        user = await self.col.find_one({'id': int(id)}, {'session': 1})
+        return user.get('session') if user else None
+
+    async def get_sessions(self, ids):
+        """Current session strings of several users in one query, missing users map to None"""
+        sessions = {int(id): None for id in ids}
+        async for user in self.col.find({'id': {'$in': list(sessions)}}, {'id': 1, 'session': 1}):
+            sessions[user['id']] = user.get('session')
+        return sessions
+
+    async def get_cached_file(self, chat_id, msg_id, file_unique_id):
+        doc = await self.files.find_one_and_update(
+            {'chat_id': chat_id, 'msg_id': msg_id, 'file_unique_id': file_unique_id},
+            {'$set': {'last_used': datetime.utcnow()}}
+        )
+        if doc is None:
+            self.cache_misses += 1
+            return None
+        self.cache_hits += 1
+        return doc['file_id']
+
+    async def cache_file(self, chat_id, msg_id, file_unique_id, file_id):
+        await self.files.update_one(
+            {'chat_id': chat_id, 'msg_id': msg_id, 'file_unique_id': file_unique_id},
+            {'$set': {'file_id': file_id, 'last_used': datetime.utcnow()}},
+            upsert=True
+        )
+        self._cache_writes += 1
+        if self._cache_writes % 100 == 0:
+            await self.trim_file_cache()
+
+    async def forget_cached_file(self, chat_id, msg_id, file_unique_id):
+        await self.files.delete_one({'chat_id': chat_id, 'msg_id': msg_id, 'file_unique_id': file_unique_id})
+
+    async def trim_file_cache(self):
+        excess = await self.files.estimated_document_count() - FILE_CACHE_MAX_ENTRIES
+        if excess <= 0:
+            return
+        oldest = self.files.find({}, {'_id': 1}).sort('last_used', 1).limit(excess)
+        ids = [doc['_id'] async for doc in oldest]
+        await self.files.delete_many({'_id': {'$in': ids}})
+
+    def new_job(self, user_id, chat_id, message_id, from_id, to_id):
+        return dict(
+            user_id = int(user_id),
+            chat_id = chat_id,
+            message_id = message_id,
+            from_id = from_id,
+            to_id = to_id,
+            last_done = from_id - 1,
+            status = 'queued',
+            active = True,
+            worker = None,
+            heartbeat = None,
+            attempts = 0,
+            updated = datetime.utcnow(),
+        )
+
+    async def create_job(self, user_id, chat_id, message_id, from_id, to_id):
+        """Queue a batch, returns None if the user already has one queued or running"""
+        job = self.new_job(user_id, chat_id, message_id, from_id, to_id)
+        try:
+            result = await self.jobs.insert_one(job)
+        except DuplicateKeyError:
+            return None
+        return result.inserted_id
+
+    async def claim_job(self, worker, stale_after, job_id=None, exclude=(), started=None):
+        """Atomically take a queued job, a job whose worker stopped heartbeating, or one this worker left behind.
+
+        A job this worker claimed after started is running here and never taken again. A targeted
+        claim only takes the job while it is still queued, so racing the claim loop cannot run it twice.
+        """
+        now = datetime.utcnow()
+        if job_id is not None:
+            query = {'_id': job_id, 'status': 'queued'}
+        else:
+            own = {'status': 'running', 'worker': worker}
+            if started is not None:
+                own['heartbeat'] = {'$lt': started}
+            query = {
+                '$or': [
+                    {'status': 'queued'},
+                    own,
+                    {'status': 'running', 'heartbeat': None},
+                    {'status': 'running', 'heartbeat': {'$lt': now - timedelta(seconds=stale_after)}},
+                ],
+                '_id': {'$nin': list(exclude)},
+            }
+        return await self.jobs.find_one_and_update(
+            query,
+            {'$set': {'status': 'running', 'worker': worker, 'heartbeat': now, 'updated': now}, '$inc': {'attempts': 1}},
+            sort=[('_id', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def heartbeat_job(self, job_id, worker):
+        """Refresh the claim on a job and return its status, None if another worker owns it now"""
+        job = await self.jobs.find_one_and_update(
+            {'_id': job_id, 'worker': worker},
+            {'$set': {'heartbeat': datetime.utcnow()}},
+            projection={'status': 1}
+        )
+        return job['status'] if job else None
+
+    async def checkpoint_job(self, job_id, last_done):
+        await self.jobs.update_one({'_id': job_id}, {'$max': {'last_done': last_done}, '$set': {'updated': datetime.utcnow()}})
+
+    async def finish_job(self, job_id, status):
+        now = datetime.utcnow()
+        await self.jobs.update_one({'_id': job_id}, {'$set': {'status': status, 'updated': now, 'finished_at': now}, '$unset': {'active': ''}})
+
+    async def cancel_user_jobs(self, user_id):
+        now = datetime.utcnow()
+        await self.jobs.update_many(
+            {'user_id': int(user_id), 'active': True},
+            {'$set': {'status': 'cancelled', 'updated': now, 'finished_at': now}, '$unset': {'active': ''}}
+        )
+
+    async def queued_jobs_count(self):
+        return await self.jobs.count_documents({'status': 'queued'})
+
+    async def get_usage(self, user_id, day):
+        doc = await self.usage.find_one({'user_id': int(user_id), 'day': day}, {'bytes': 1})
+        return doc['bytes'] if doc else 0
+
+    async def add_usage(self, user_id, day, count):
+        await self.usage.update_one(
+            {'user_id': int(user_id), 'day': day},
+            {'$inc': {'bytes': count}, '$set': {'updated': datetime.utcnow()}},
+            upsert=True
+        )
+
+    async def get_peers(self, user_id, account_id, limit):
+        """The most recently used peers of a user's account, newest first"""
+        cursor = self.peers.find({'user_id': int(user_id), 'account_id': account_id}).sort('used_at', -1).limit(limit)
+        return [doc async for doc in cursor]
+
+    async def save_peer(self, user_id, account_id, peer_id, access_hash, peer_type, username=None):
+        await self.peers.update_one(
+            {'user_id': int(user_id), 'account_id': account_id, 'peer_id': peer_id},
+            {'$set': {'access_hash': access_hash, 'type': peer_type, 'username': username, 'used_at': datetime.utcnow()}},
+            upsert=True
+        )
+
+    async def forget_peers(self, user_id):
+        await self.peers.delete_many({'user_id': int(user_id)})
+
 
 db = Database(DB_URI, DB_NAME)
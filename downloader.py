@@ -0,0 +1,208 @@
+# Parallel ranged downloads for VJ Save Restricted Content Bot
+import os
+import math
+import asyncio
+from collections import deque
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple
+from pyrogram import Client, raw
+from pyrogram.errors import FloodWait, AuthBytesInvalid
+from pyrogram.file_id import FileId, FileType
+from pyrogram.session import Session
+from pyrogram.session.auth import Auth
+from pyrogram.types import Message
+from metrics import metrics
+
+# stream_media offsets and limits are counted in chunks of this size, GetFile parts are one chunk
+CHUNK_SIZE = 1024 * 1024
+
+# Message attributes that carry a downloadable file
+MEDIA_ATTRIBUTES = ("document", "video", "audio", "voice", "animation", "video_note", "sticker", "photo")
+
+def file_location(msg: Message) -> Tuple[int, raw.base.InputFileLocation]:
+    """The DC and raw location of the message's file, as get_file builds them"""
+    media = next(getattr(msg, kind) for kind in MEDIA_ATTRIBUTES if getattr(msg, kind, None))
+    file_id = FileId.decode(media.file_id)
+    if file_id.file_type == FileType.PHOTO:
+        location = raw.types.InputPhotoFileLocation(
+            id=file_id.media_id,
+            access_hash=file_id.access_hash,
+            file_reference=file_id.file_reference,
+            thumb_size=file_id.thumbnail_size
+        )
+    else:
+        location = raw.types.InputDocumentFileLocation(
+            id=file_id.media_id,
+            access_hash=file_id.access_hash,
+            file_reference=file_id.file_reference,
+            thumb_size=file_id.thumbnail_size
+        )
+    return file_id.dc_id, location
+
+class MediaSessions:
+    """Media connections of the user clients, one per DC, kept open as long as the client.
+
+    get_file opens a new session for every call, which for a file on another DC means a new
+    auth key and an authorization export on each range.
+    """
+
+    def __init__(self):
+        # client -> dc_id -> session
+        self.sessions: Dict[Client, Dict[int, Session]] = {}
+        self.locks: Dict[Tuple[Client, int], asyncio.Lock] = {}
+
+        metrics.describe('bot_media_sessions_opened_total', 'counter', 'Media connections opened for ranged downloads, by DC')
+
+    async def get(self, client: Client, dc_id: int) -> Session:
+        sessions = self.sessions.setdefault(client, {})
+        session = sessions.get(dc_id)
+        if session is not None:
+            return session
+        lock = self.locks.setdefault((client, dc_id), asyncio.Lock())
+        async with lock:
+            if dc_id not in sessions:
+                sessions[dc_id] = await self.open_session(client, dc_id)
+                metrics.inc('bot_media_sessions_opened_total', dc=dc_id)
+            return sessions[dc_id]
+
+    async def open_session(self, client: Client, dc_id: int) -> Session:
+        """Start a media session on dc_id, authorized for the client's account"""
+        test_mode = await client.storage.test_mode()
+        home = dc_id == await client.storage.dc_id()
+        auth_key = await client.storage.auth_key() if home else await Auth(client, dc_id, test_mode).create()
+        session = Session(client, dc_id, auth_key, test_mode, is_media=True)
+        await session.start()
+        if home:
+            return session
+        try:
+            for _ in range(3):
+                exported_auth = await client.invoke(raw.functions.auth.ExportAuthorization(dc_id=dc_id))
+                try:
+                    await session.invoke(raw.functions.auth.ImportAuthorization(id=exported_auth.id, bytes=exported_auth.bytes))
+                except AuthBytesInvalid:
+                    continue
+                return session
+            raise AuthBytesInvalid
+        except BaseException:
+            await _stop(session)
+            raise
+
+    async def drop(self, client: Client, dc_id: int, session: Session):
+        """Forget a broken session, unless a concurrent range already replaced it"""
+        sessions = self.sessions.get(client, {})
+        if sessions.get(dc_id) is session:
+            del sessions[dc_id]
+            await _stop(session)
+
+    async def close(self, client: Client):
+        """Stop every media session of a client that is being disconnected"""
+        for dc_id, session in self.sessions.pop(client, {}).items():
+            self.locks.pop((client, dc_id), None)
+            await _stop(session)
+
+async def _stop(session: Session):
+    try:
+        await session.stop()
+    except Exception:
+        pass
+
+class ParallelDownloader:
+    def __init__(self):
+        # Downloader configurations
+        self.PARALLELISM = int(os.environ.get('DOWNLOAD_PARALLELISM', '4'))  # ranges in flight per file
+        self.MIN_SIZE = int(os.environ.get('PARALLEL_DOWNLOAD_MIN_SIZE', str(20 * CHUNK_SIZE)))
+        self.RANGE_CHUNKS = int(os.environ.get('DOWNLOAD_RANGE_CHUNKS', '8'))  # 1MB chunks per range
+        self.RETRIES = int(os.environ.get('DOWNLOAD_RANGE_RETRIES', '3'))
+
+    def supports(self, file_size: int) -> bool:
+        """Small files keep the plain sequential download"""
+        return self.PARALLELISM > 1 and file_size >= self.MIN_SIZE
+
+    def _ranges(self, file_size: int):
+        total_chunks = math.ceil(file_size / CHUNK_SIZE)
+        for start in range(0, total_chunks, self.RANGE_CHUNKS):
+            yield start, min(self.RANGE_CHUNKS, total_chunks - start)
+
+    async def _fetch_range(self, acc: Client, msg: Message, start: int, count: int) -> bytes:
+        """Fetch one range with GetFile parts on the client's shared media session, retrying only this range when it fails.
+
+        stream_media would take the client's get_file semaphore and open a session of its own.
+        """
+        dc_id, location = file_location(msg)
+        for attempt in range(self.RETRIES):
+            session = None
+            try:
+                session = await media_sessions.get(acc, dc_id)
+                # the parts of a range are requested together, one connection carries many requests in flight
+                parts = await asyncio.gather(*[
+                    session.invoke(
+                        raw.functions.upload.GetFile(location=location, offset=index * CHUNK_SIZE, limit=CHUNK_SIZE),
+                        sleep_threshold=0
+                    )
+                    for index in range(start, start + count)
+                ])
+                if not all(isinstance(r, raw.types.upload.File) for r in parts):
+                    # a CDN redirect, pyrogram's own download does the CDN handshake
+                    return await self._stream_range(acc, msg, start, count)
+                return b"".join(r.bytes for r in parts)
+            except FloodWait as e:
+                await asyncio.sleep(e.value)
+            except Exception as e:
+                if session is not None and isinstance(e, (OSError, asyncio.TimeoutError)):
+                    await media_sessions.drop(acc, dc_id, session)
+                if attempt == self.RETRIES - 1:
+                    raise
+                await asyncio.sleep(1 + attempt)
+        raise RuntimeError(f"Range at chunk {start} failed after {self.RETRIES} attempts")
+
+    async def _stream_range(self, acc: Client, msg: Message, start: int, count: int) -> bytes:
+        data = bytearray()
+        async for chunk in acc.stream_media(msg, offset=start, limit=count):
+            data.extend(chunk)
+        return bytes(data)
+
+    async def iter_chunks(self, acc: Client, msg: Message, file_size: int) -> AsyncIterator[bytes]:
+        """Yield the file in order while up to PARALLELISM ranges are fetched concurrently"""
+        ranges = self._ranges(file_size)
+        pending = deque()
+
+        def schedule() -> bool:
+            next_range = next(ranges, None)
+            if next_range is None:
+                return False
+            pending.append(asyncio.create_task(self._fetch_range(acc, msg, *next_range)))
+            return True
+
+        for _ in range(self.PARALLELISM):
+            if not schedule():
+                break
+        try:
+            while pending:
+                data = await pending.popleft()
+                schedule()
+                metrics.add_bytes("down", len(data))
+                yield data
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def download(self, acc: Client, msg: Message, file_size: int, path: str,
+                       progress: Optional[Callable] = None, progress_args: tuple = ()) -> str:
+        """Download to path through parallel ranges, keeping the download_media progress contract"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        done = 0
+        try:
+            with open(path, "wb") as f:
+                async for data in self.iter_chunks(acc, msg, file_size):
+                    await asyncio.to_thread(f.write, data)
+                    done += len(data)
+                    if progress:
+                        progress(min(done, file_size), file_size, *progress_args)
+        except BaseException:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        return path
+
+# Global media session and parallel downloader instances
+media_sessions = MediaSessions()
+parallel_downloader = ParallelDownloader()
@@ -0,0 +1,143 @@
+# Non-blocking security event log for VJ Save Restricted Content Bot
+import os
+import sys
+import json
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import List, Optional
+from metrics import metrics
+
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+
+# Events that point at abuse or broken sessions, everything else is INFO
+WARNING_EVENTS = (
+    'RATE_LIMIT', 'LOGIN_RATE_LIMIT', 'INVALID_INPUT', 'LARGE_BATCH',
+    'INVALID_SESSION', 'SESSION_ERROR', 'SESSION_TIMEOUT', 'FORCE_LOGOUT',
+    'QUOTA_EXCEEDED', 'FILE_TOO_LARGE',
+)
+
+class SecurityEventLog:
+    def __init__(self):
+        # Event log configurations
+        self.SINK = os.environ.get('SECURITY_LOG_SINK', 'stdout').lower()  # stdout, file or mongo
+        self.LEVEL = LEVELS.get(os.environ.get('SECURITY_LOG_LEVEL', 'INFO').upper(), LEVELS['INFO'])
+        self.BUFFER_SIZE = int(os.environ.get('SECURITY_LOG_BUFFER', '10000'))
+        self.BATCH_SIZE = int(os.environ.get('SECURITY_LOG_BATCH', '500'))
+        self.FLUSH_INTERVAL = float(os.environ.get('SECURITY_LOG_FLUSH_INTERVAL', '1'))
+        self.FILE = os.environ.get('SECURITY_LOG_FILE', 'security.log')
+        self.MAX_BYTES = int(os.environ.get('SECURITY_LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+        self.BACKUPS = int(os.environ.get('SECURITY_LOG_BACKUPS', '5'))
+        self.TTL = int(os.environ.get('SECURITY_LOG_TTL', str(30 * 24 * 3600)))  # mongo sink only
+
+        # ring buffer, the oldest event is dropped when it is full
+        self.buffer = deque(maxlen=self.BUFFER_SIZE)
+        self.dropped = 0
+        self.filtered = 0
+        self.written = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._collection = None
+
+        metrics.counter('bot_security_events_dropped_total', 'Security events lost to a full buffer or a failed write', lambda: self.dropped)
+        metrics.counter('bot_security_events_written_total', 'Security events written to the sink', lambda: self.written)
+        metrics.gauge('bot_security_events_buffered', 'Security events waiting to be written', lambda: len(self.buffer))
+
+    def level_of(self, event_type: str) -> str:
+        return 'WARNING' if event_type in WARNING_EVENTS else 'INFO'
+
+    def emit(self, user_id: int, event_type: str, details: str, level: Optional[str] = None):
+        """Queue an event, never blocks and never raises"""
+        level = level or self.level_of(event_type)
+        if LEVELS.get(level, LEVELS['INFO']) < self.LEVEL:
+            self.filtered += 1
+            return
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        self.buffer.append({
+            'time': datetime.utcnow().isoformat(),
+            'level': level,
+            'user_id': user_id,
+            'event': event_type,
+            'details': details,
+        })
+        if self._wakeup and len(self.buffer) >= self.BATCH_SIZE:
+            self._wakeup.set()
+
+    def _take(self) -> List[dict]:
+        batch = []
+        while self.buffer and len(batch) < self.BATCH_SIZE:
+            batch.append(self.buffer.popleft())
+        return batch
+
+    async def _write(self, batch: List[dict]):
+        if self.SINK == 'mongo':
+            await self._collection.insert_many([dict(event, time=datetime.fromisoformat(event['time'])) for event in batch], ordered=False)
+        elif self.SINK == 'file':
+            await asyncio.to_thread(self._write_file, batch)
+        else:
+            lines = "".join(f"SECURITY: [{e['time']}] {e['level']} User {e['user_id']}: {e['event']} - {e['details']}\n" for e in batch)
+            await asyncio.to_thread(self._write_stdout, lines)
+
+    def _write_stdout(self, lines: str):
+        sys.stdout.write(lines)
+        sys.stdout.flush()
+
+    def _write_file(self, batch: List[dict]):
+        if os.path.exists(self.FILE) and os.path.getsize(self.FILE) >= self.MAX_BYTES:
+            self._rotate()
+        with open(self.FILE, 'a', encoding='utf-8') as f:
+            f.write("".join(json.dumps(event, ensure_ascii=False) + "\n" for event in batch))
+
+    def _rotate(self):
+        """security.log -> security.log.1 -> ... -> security.log.BACKUPS, the oldest is removed"""
+        for index in range(self.BACKUPS - 1, 0, -1):
+            source = f"{self.FILE}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.FILE}.{index + 1}")
+        if self.BACKUPS > 0:
+            os.replace(self.FILE, f"{self.FILE}.1")
+        else:
+            os.remove(self.FILE)
+
+    async def flush(self):
+        """Write everything buffered so far, in batches"""
+        while self.buffer:
+            batch = self._take()
+            try:
+                await self._write(batch)
+                self.written += len(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                print(f"Security log write failed, {len(batch)} events dropped: {e}", file=sys.stderr)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def start(self):
+        """Start the background writer, must be called from a running event loop"""
+        if self._task is not None:
+            return
+        if self.SINK == 'mongo':
+            from database.db import db
+            self._collection = db.db.security_events
+            await self._collection.create_index('time', expireAfterSeconds=self.TTL)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the writer and flush what is left"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+# Global security event log instance
+security_events = SecurityEventLog()
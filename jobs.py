@@ -0,0 +1,99 @@
+# Durable batch jobs for VJ Save Restricted Content Bot
+import os
+import socket
+import asyncio
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+from database.db import db
+
+class BatchQueue:
+    def __init__(self):
+        # Queue configurations
+        self.DRAIN_TIMEOUT = int(os.environ.get('DRAIN_TIMEOUT', '60'))
+        self.WORKER_ID = os.environ.get('WORKER_ID', socket.gethostname())
+        self.MAX_WORKER_JOBS = int(os.environ.get('MAX_WORKER_JOBS', '10'))  # batches run at once by one process
+        self.POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', '2'))
+        self.HEARTBEAT_INTERVAL = int(os.environ.get('JOB_HEARTBEAT_INTERVAL', '15'))
+        self.STALE_AFTER = int(os.environ.get('JOB_STALE_AFTER', '90'))  # reclaim jobs of silent workers
+
+        # job id -> running batch task
+        self.tasks: Dict[object, asyncio.Task] = {}
+        self.cancelled = set()
+        self.stopping = False
+        # jobs this worker id holds from before this moment were left behind by an earlier process
+        self.started = datetime.utcnow()
+        self._worker: Optional[asyncio.Task] = None
+
+    def track(self, job_id, task: asyncio.Task):
+        """Remember a running batch so shutdown can wait for it"""
+        self.tasks[job_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(job_id, None))
+
+    def is_cancelled(self, job_id) -> bool:
+        return job_id in self.cancelled
+
+    async def claim(self, job_id=None) -> Optional[dict]:
+        """Claim a specific job, or the oldest claimable one"""
+        return await db.claim_job(self.WORKER_ID, self.STALE_AFTER, job_id=job_id, exclude=list(self.tasks), started=self.started)
+
+    def spawn(self, client, job: dict, runner: Callable[..., Awaitable]) -> asyncio.Task:
+        """Run a claimed job and keep its claim alive until it ends"""
+        task = asyncio.create_task(runner(client, job))
+        self.track(job['_id'], task)
+        heartbeat = asyncio.create_task(self._heartbeat(job['_id']))
+
+        def _done(_):
+            heartbeat.cancel()
+            self.cancelled.discard(job['_id'])
+        task.add_done_callback(_done)
+        return task
+
+    async def _heartbeat(self, job_id):
+        while True:
+            await asyncio.sleep(self.HEARTBEAT_INTERVAL)
+            try:
+                status = await db.heartbeat_job(job_id, self.WORKER_ID)
+            except Exception as e:
+                print(f"Job heartbeat error: {e}")
+                continue
+            # cancelled from another process, or reclaimed after we went silent
+            if status != 'running':
+                self.cancelled.add(job_id)
+                return
+
+    async def _worker_loop(self, client, runner: Callable[..., Awaitable]):
+        while not self.stopping:
+            if len(self.tasks) >= self.MAX_WORKER_JOBS:
+                await asyncio.sleep(self.POLL_INTERVAL)
+                continue
+            try:
+                job = await self.claim()
+            except Exception as e:
+                print(f"Job claim error: {e}")
+                job = None
+            if job is None:
+                await asyncio.sleep(self.POLL_INTERVAL)
+                continue
+            self.spawn(client, job, runner)
+
+    def start(self, client, runner: Callable[..., Awaitable]):
+        """Start claiming jobs from the shared queue, must be called from a running event loop"""
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._worker_loop(client, runner))
+
+    async def drain(self):
+        """Stop dispatching new messages and let in-flight ones finish and checkpoint"""
+        self.stopping = True
+        if self._worker:
+            self._worker.cancel()
+            self._worker = None
+        if not self.tasks:
+            return
+        done, pending = await asyncio.wait(list(self.tasks.values()), timeout=self.DRAIN_TIMEOUT)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+# Global batch queue instance
+batch_queue = BatchQueue()
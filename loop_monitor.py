@@ -0,0 +1,97 @@
+# Event loop responsiveness monitoring for VJ Save Restricted Content Bot
+import os
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from typing import Optional
+from metrics import metrics
+
+class LoopMonitor:
+    def __init__(self):
+        # Monitor configurations
+        self.INTERVAL = float(os.environ.get('LOOP_LAG_INTERVAL', '0.5'))
+        self.UNHEALTHY_LAG = float(os.environ.get('LOOP_LAG_UNHEALTHY', '5'))  # /health fails above this
+        self.DEBUG = os.environ.get('LOOP_DEBUG', 'False').lower() in ('true', '1', 'yes', 'on')
+        self.BLOCKING_THRESHOLD = float(os.environ.get('LOOP_BLOCKING_THRESHOLD', '0.25'))  # seconds, debug mode only
+        self.WINDOW = 60  # seconds the worst lag is remembered for
+
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.max_lag_at = 0.0
+        self.heartbeat = time.monotonic()
+        self.blocked = 0
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+        metrics.describe('bot_event_loop_lag_seconds', 'histogram', 'Delay of the event loop in waking up a sleeping task')
+        metrics.describe('bot_event_loop_blocked_total', 'counter', 'Callbacks that held the loop longer than the blocking threshold')
+        metrics.gauge('bot_event_loop_lag_max_seconds', 'Worst event loop lag of the last minute', lambda: self.recent_max_lag())
+
+    async def _measure(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.INTERVAL)
+            now = time.monotonic()
+            self.heartbeat = now
+            self.lag = max(0.0, now - start - self.INTERVAL)
+            metrics.observe('bot_event_loop_lag_seconds', self.lag)
+            if self.lag >= self.recent_max_lag():
+                self.max_lag, self.max_lag_at = self.lag, now
+
+    def recent_max_lag(self) -> float:
+        if time.monotonic() - self.max_lag_at > self.WINDOW:
+            return self.lag
+        return self.max_lag
+
+    def _watch(self, loop_thread_id: int):
+        """Runs in its own thread, samples the loop thread's stack while it is stuck"""
+        reported = False
+        while not self._stopping.wait(self.BLOCKING_THRESHOLD / 2):
+            stuck_for = time.monotonic() - self.heartbeat - self.INTERVAL
+            if stuck_for < self.BLOCKING_THRESHOLD:
+                reported = False
+                continue
+            if reported:
+                continue
+            reported = True
+            self.blocked += 1
+            metrics.inc('bot_event_loop_blocked_total')
+            frame = sys._current_frames().get(loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "unavailable"
+            print(f"Event loop blocked for {stuck_for:.2f}s, stack sample:\n{stack}", file=sys.stderr)
+
+    def start(self):
+        """Start measuring lag, must be called from a running event loop"""
+        if self._task is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self.heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._measure())
+        if self.DEBUG:
+            # asyncio also logs every slow callback with the handle that ran it
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.BLOCKING_THRESHOLD
+            self._stopping.clear()
+            self._watchdog = threading.Thread(target=self._watch, args=(threading.get_ident(),), daemon=True, name="loop-watchdog")
+            self._watchdog.start()
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self._stopping.set()
+        self._watchdog = None
+
+    async def health(self):
+        """Liveness that fails when the loop has recently been too slow to answer"""
+        lag = self.recent_max_lag()
+        body = f"lag={self.lag:.3f}s max_lag_1m={lag:.3f}s blocked={self.blocked}\n"
+        if lag > self.UNHEALTHY_LAG:
+            return 503, "SLOW " + body
+        return 200, "OK " + body
+
+# Global loop monitor instance
+loop_monitor = LoopMonitor()
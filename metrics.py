@@ -0,0 +1,206 @@
+# Prometheus metrics for VJ Save Restricted Content Bot
+import os
+import time
+import asyncio
+import inspect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+from pymongo import monitoring
+
+# Latency buckets in seconds, from a quick API call to a multi-GB transfer
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+def _labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # labels -> [bucket counts..., sum, count]
+        self.series: Dict[Tuple, List[float]] = {}
+
+    def observe(self, labels: Tuple, value: float):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 2)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def copy(self) -> "Histogram":
+        snapshot = Histogram(self.buckets)
+        snapshot.series = {labels: list(series) for labels, series in self.series.items()}
+        return snapshot
+
+    def render(self, name: str) -> List[str]:
+        lines = []
+        for labels, series in self.series.items():
+            for index, bound in enumerate(self.buckets):
+                le = 'le="%s"' % bound
+                lines.append(f'{name}_bucket{_labels(labels, le)} {series[index]}')
+            le = 'le="+Inf"'
+            lines.append(f'{name}_bucket{_labels(labels, le)} {series[-1]}')
+            lines.append(f'{name}_sum{_labels(labels)} {series[-2]}')
+            lines.append(f'{name}_count{_labels(labels)} {series[-1]}')
+        return lines
+
+class MongoListener(monitoring.CommandListener):
+    """Time every Mongo command the bot sends"""
+
+    def __init__(self, metrics: "Metrics"):
+        self.metrics = metrics
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.metrics.observe('bot_mongo_seconds', event.duration_micros / 1e6, command=event.command_name)
+
+    def failed(self, event):
+        self.metrics.observe('bot_mongo_seconds', event.duration_micros / 1e6, command=event.command_name)
+        self.metrics.inc('bot_mongo_errors_total', command=event.command_name)
+
+class Metrics:
+    def __init__(self):
+        # Metrics configurations
+        self.PORT = int(os.environ.get('METRICS_PORT', '9090'))  # 0 disables the endpoint
+        self.HOST = os.environ.get('METRICS_HOST', '0.0.0.0')
+
+        self.help: Dict[str, Tuple[str, str]] = {}
+        self.counters: Dict[str, Dict[Tuple, float]] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        # name -> callable returning a value or {labels: value}, read at scrape time, for gauges and owner kept counters
+        self.gauges: Dict[str, Callable] = {}
+        # path -> async callable returning (status, body)
+        self.routes: Dict[str, Callable] = {'/metrics': self._metrics_route}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.mongo_listener = MongoListener(self)
+        # the Mongo listener and the watchdog thread record from other threads than the one rendering
+        self._lock = threading.Lock()
+
+        self.describe('bot_stage_seconds', 'histogram', 'Latency of each transfer stage')
+        self.describe('bot_transfer_bytes_total', 'counter', 'Bytes moved through this process')
+        self.describe('bot_flood_waits_total', 'counter', 'FloodWait errors received')
+        self.describe('bot_flood_wait_seconds_total', 'counter', 'Seconds spent blocked by FloodWait')
+        self.describe('bot_mongo_seconds', 'histogram', 'Latency of Mongo commands')
+        self.describe('bot_mongo_errors_total', 'counter', 'Failed Mongo commands')
+
+    def describe(self, name: str, kind: str, text: str):
+        self.help[name] = (kind, text)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(key, value)
+
+    @contextmanager
+    def time(self, stage: str):
+        """Record how long a stage took, failed attempts included"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('bot_stage_seconds', time.perf_counter() - start, stage=stage)
+
+    def add_bytes(self, direction: str, count: int):
+        self.inc('bot_transfer_bytes_total', count, direction=direction)
+
+    def gauge(self, name: str, text: str, func: Callable):
+        """Register a gauge whose value is read from live state on every scrape"""
+        self.describe(name, 'gauge', text)
+        self.gauges[name] = func
+
+    def counter(self, name: str, text: str, func: Callable):
+        """Register a counter whose total is kept by its owner and read on every scrape"""
+        self.describe(name, 'counter', text)
+        self.gauges[name] = func
+
+    def route(self, path: str, handler: Callable):
+        self.routes[path] = handler
+
+    async def render(self) -> str:
+        with self._lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            histograms = {name: histogram.copy() for name, histogram in self.histograms.items()}
+        lines = []
+        for name, series in counters.items():
+            lines.extend(self._header(name))
+            lines.extend(f'{name}{_labels(labels)} {value}' for labels, value in series.items())
+        for name, histogram in histograms.items():
+            lines.extend(self._header(name))
+            lines.extend(histogram.render(name))
+        for name, func in list(self.gauges.items()):
+            try:
+                value = func()
+                if inspect.isawaitable(value):
+                    value = await value
+            except Exception as e:
+                print(f"Metrics gauge {name} failed: {e}")
+                continue
+            lines.extend(self._header(name))
+            if isinstance(value, dict):
+                lines.extend(f'{name}{_labels(tuple(sorted(labels)))} {v}' for labels, v in value.items())
+            else:
+                lines.append(f'{name} {value}')
+        return "\n".join(lines) + "\n"
+
+    def _header(self, name: str) -> List[str]:
+        kind, text = self.help.get(name, ('untyped', name))
+        return [f'# HELP {name} {text}', f'# TYPE {name} {kind}']
+
+    async def _metrics_route(self):
+        return 200, await self.render()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 10)
+            # headers are not needed, drain them
+            while (await asyncio.wait_for(reader.readline(), 10)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request.decode("latin-1").split()
+            path = parts[1].split("?")[0] if len(parts) > 1 else "/"
+            handler = self.routes.get(path)
+            status, body = await handler() if handler else (404, "Not Found\n")
+            payload = body.encode()
+            writer.write(
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+        except Exception as e:
+            print(f"Metrics request error: {e}")
+        finally:
+            writer.close()
+
+    async def start_server(self, offset: int = 0):
+        """Serve the registered routes on METRICS_PORT + offset, one port per process"""
+        if not self.PORT or self._server:
+            return
+        try:
+            self._server = await asyncio.start_server(self._handle, self.HOST, self.PORT + offset)
+        except OSError as e:
+            print(f"Metrics endpoint disabled, port {self.PORT + offset} unavailable: {e}")
+
+    async def stop_server(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+# Global metrics instance
+metrics = Metrics()
@@ -0,0 +1,106 @@
+# Adaptive API pacing for VJ Save Restricted Content Bot
+import os
+import time
+import asyncio
+from typing import Awaitable, Callable, Dict
+from pyrogram.errors import FloodWait
+from metrics import metrics
+
+class RateScheduler:
+    def __init__(self):
+        # Pacing configurations
+        self.MIN_INTERVAL = float(os.environ.get('PACING_MIN_INTERVAL', '0.3'))
+        self.START_INTERVAL = float(os.environ.get('PACING_START_INTERVAL', '1.0'))
+        self.MAX_INTERVAL = float(os.environ.get('PACING_MAX_INTERVAL', '30'))
+        self.MAX_FLOOD_WAIT = int(os.environ.get('MAX_FLOOD_WAIT', '600'))  # give up above this
+        self.GLOBAL_RATE = float(os.environ.get('PACING_GLOBAL_RATE', '25'))  # sends per second of one client over all chats
+        self.IDLE_TTL = 600  # seconds before an unused chat's pacing state is dropped
+        self.SPEEDUP = 0.9   # interval multiplier after a call without pressure
+        self.BACKOFF = 2.0   # interval multiplier after a FloodWait
+
+        # key (account, or client and destination chat) -> {'interval', 'next_at', 'blocked_until', 'flood_waits'}
+        self.accounts: Dict[str, Dict] = {}
+        # client -> next free slot of its global send bucket
+        self.global_next_at: Dict[str, float] = {}
+        self._pruned_at = time.time()
+
+    def _state(self, key: str) -> Dict:
+        if key not in self.accounts:
+            self._prune()
+            self.accounts[key] = {
+                'interval': self.START_INTERVAL,
+                'next_at': 0.0,
+                'blocked_until': 0.0,
+                'flood_waits': 0
+            }
+        return self.accounts[key]
+
+    def _prune(self):
+        """Forget chats that have not been sent to for a while, a bot talks to many of them"""
+        now = time.time()
+        if now - self._pruned_at < self.IDLE_TTL:
+            return
+        self._pruned_at = now
+        for key in [key for key, state in self.accounts.items() if max(state['next_at'], state['blocked_until']) < now - self.IDLE_TTL]:
+            del self.accounts[key]
+
+    async def wait(self, key: str):
+        """Wait for the next call slot of an account, honouring any FloodWait in progress"""
+        state = self._state(key)
+        now = time.time()
+        start_at = max(now, state['next_at'], state['blocked_until'])
+        # Reserve the slot before sleeping so concurrent jobs queue up behind each other
+        state['next_at'] = start_at + state['interval']
+        if start_at > now:
+            await asyncio.sleep(start_at - now)
+
+    def on_success(self, key: str):
+        state = self._state(key)
+        state['interval'] = max(self.MIN_INTERVAL, state['interval'] * self.SPEEDUP)
+
+    def on_flood_wait(self, key: str, seconds: int):
+        """Block the account for exactly the requested time and slow down afterwards"""
+        state = self._state(key)
+        now = time.time()
+        state['blocked_until'] = max(state['blocked_until'], now + seconds)
+        state['next_at'] = max(state['next_at'], state['blocked_until'])
+        state['interval'] = min(self.MAX_INTERVAL, state['interval'] * self.BACKOFF)
+        state['flood_waits'] += 1
+        metrics.inc('bot_flood_waits_total')
+        metrics.inc('bot_flood_wait_seconds_total', seconds)
+
+    async def wait_global(self, client_name: str):
+        """Wait for a slot of the client's fixed rate bucket shared by all destination chats"""
+        if self.GLOBAL_RATE <= 0:
+            return
+        now = time.time()
+        start_at = max(now, self.global_next_at.get(client_name, 0.0))
+        self.global_next_at[client_name] = start_at + 1 / self.GLOBAL_RATE
+        if start_at > now:
+            await asyncio.sleep(start_at - now)
+
+    async def call(self, key: str, func: Callable[..., Awaitable], *args, **kwargs):
+        """Run an API call in the account's pace, retrying it after a FloodWait"""
+        return await self._call(key, None, func, *args, **kwargs)
+
+    async def send(self, client, chat_id, func: Callable[..., Awaitable], *args, **kwargs):
+        """Run a send to one chat in that chat's pace and within the client's global rate, retrying it after a FloodWait"""
+        return await self._call(f"{client.name}:{chat_id}", client.name, func, *args, **kwargs)
+
+    async def _call(self, key: str, global_key, func: Callable[..., Awaitable], *args, **kwargs):
+        while True:
+            await self.wait(key)
+            if global_key is not None:
+                await self.wait_global(global_key)
+            try:
+                result = await func(*args, **kwargs)
+            except FloodWait as e:
+                self.on_flood_wait(key, e.value)
+                if e.value > self.MAX_FLOOD_WAIT:
+                    raise
+                continue
+            self.on_success(key)
+            return result
+
+# Global rate scheduler instance
+rate_scheduler = RateScheduler()
@@ -0,0 +1,84 @@
+# Peer resolution cache for VJ Save Restricted Content Bot
+import os
+from typing import Optional, Tuple, Union
+from pyrogram import Client, raw, utils
+from pyrogram.errors import PeerIdInvalid, ChannelInvalid
+from database.db import db
+from metrics import metrics
+from pacing import rate_scheduler
+
+class PeerCache:
+    def __init__(self):
+        # Peer cache configurations
+        self.WARM_LIMIT = int(os.environ.get('PEER_WARM_LIMIT', '50'))  # recently used chats loaded into a new client
+        self.DIALOG_SCAN = int(os.environ.get('PEER_DIALOG_SCAN', '500'))  # dialogs searched for a chat the session never saw
+
+        metrics.describe('bot_peer_resolutions_total', 'counter', 'Source chats resolved at batch start, by where the peer was found')
+
+    async def warm(self, acc: Client, user_id: int) -> int:
+        """Load the user's recently used chats into a freshly connected client's session"""
+        account_id = await acc.storage.user_id()
+        docs = await db.get_peers(user_id, account_id, self.WARM_LIMIT)
+        if docs:
+            await acc.storage.update_peers([
+                (doc['peer_id'], doc['access_hash'], doc['type'], doc.get('username'), None) for doc in docs
+            ])
+        return len(docs)
+
+    async def resolve(self, acc: Client, user_id: int, chat: Union[int, str]):
+        """Resolve a chat once for the user's client and remember it for the account's later sessions"""
+        peer = None
+        if isinstance(chat, int):
+            try:
+                peer = await acc.storage.get_peer_by_id(chat)
+                metrics.inc('bot_peer_resolutions_total', source="session")
+            except KeyError:
+                pass
+        if peer is None:
+            peer = await self._lookup(acc, chat)
+        try:
+            await self._remember(acc, user_id, chat, peer)
+        except Exception as e:
+            print(f"Peer cache write failed: {e}")
+        return peer
+
+    async def _lookup(self, acc: Client, chat: Union[int, str]):
+        try:
+            if isinstance(chat, int):
+                # the lookup get_messages would otherwise make by itself, so it takes no extra pacing slot
+                peer = await acc.resolve_peer(chat)
+            else:
+                # username resolution is flood limited tightly
+                peer = await rate_scheduler.call(acc.name, acc.resolve_peer, chat)
+            metrics.inc('bot_peer_resolutions_total', source="api")
+            return peer
+        except (PeerIdInvalid, ChannelInvalid, KeyError):
+            if not isinstance(chat, int):
+                raise
+        # a private chat this fresh session has never seen, its access hash comes with the dialog list
+        async for dialog in acc.get_dialogs(limit=self.DIALOG_SCAN):
+            if dialog.chat.id == chat:
+                metrics.inc('bot_peer_resolutions_total', source="dialogs")
+                return await acc.storage.get_peer_by_id(chat)
+        raise PeerIdInvalid
+
+    async def _remember(self, acc: Client, user_id: int, chat: Union[int, str], peer):
+        row = _row(peer)
+        if row is None:
+            return
+        peer_id, access_hash, peer_type = row
+        username = chat.lstrip("@").lower() if isinstance(chat, str) else None
+        await db.save_peer(user_id, await acc.storage.user_id(), peer_id, access_hash, peer_type, username)
+
+def _row(peer) -> Optional[Tuple[int, int, str]]:
+    """The session storage row (id, access_hash, type) of an input peer"""
+    if isinstance(peer, raw.types.InputPeerChannel):
+        return utils.get_peer_id(raw.types.PeerChannel(channel_id=peer.channel_id)), peer.access_hash, "channel"
+    if isinstance(peer, raw.types.InputPeerUser):
+        return peer.user_id, peer.access_hash, "user"
+    if isinstance(peer, raw.types.InputPeerChat):
+        return -peer.chat_id, 0, "group"
+    return None
+
+# Global peer cache instance
+peer_cache = PeerCache()
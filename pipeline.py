@@ -0,0 +1,68 @@
+# Batch pipeline for VJ Save Restricted Content Bot
+import os
+import asyncio
+from typing import Dict
+
+class OrderedDelivery:
+    """Hands out tickets and lets each ticket deliver only after every earlier one finished"""
+
+    def __init__(self):
+        self._issued = 0
+        self._next = 0
+        self._finished = set()
+        self._turns: Dict[int, asyncio.Event] = {}
+
+    def ticket(self) -> int:
+        ticket = self._issued
+        self._issued += 1
+        self._turns[ticket] = asyncio.Event()
+        if ticket == self._next:
+            self._turns[ticket].set()
+        return ticket
+
+    async def wait(self, ticket: int):
+        """Wait until all earlier tickets are finished"""
+        turn = self._turns.get(ticket)
+        if turn:
+            await turn.wait()
+
+    def finish(self, ticket: int):
+        """Mark a ticket as delivered (or skipped) and wake up the next one"""
+        self._finished.add(ticket)
+        while self._next in self._finished:
+            self._finished.discard(self._next)
+            self._turns.pop(self._next, None)
+            self._next += 1
+            if self._next in self._turns:
+                self._turns[self._next].set()
+
+class BatchPipeline:
+    def __init__(self):
+        # Pipeline configurations
+        self.PER_USER_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '3'))
+        self.GLOBAL_CONCURRENCY = int(os.environ.get('MAX_CONCURRENT_JOBS', '20'))
+
+        self.global_slots = asyncio.Semaphore(self.GLOBAL_CONCURRENCY)
+
+    def user_slots(self) -> asyncio.Semaphore:
+        """Create the in-flight limit for one batch"""
+        return asyncio.Semaphore(self.PER_USER_CONCURRENCY)
+
+    async def acquire(self, user_slots: asyncio.Semaphore, fast: bool = False):
+        """Reserve a per-user and a global slot, in that order, fast messages only take the per-user one"""
+        await user_slots.acquire()
+        if fast:
+            return
+        try:
+            await self.global_slots.acquire()
+        except BaseException:
+            user_slots.release()
+            raise
+
+    def release(self, user_slots: asyncio.Semaphore, fast: bool = False):
+        if not fast:
+            self.global_slots.release()
+        user_slots.release()
+
+# Global batch pipeline instance
+batch_pipeline = BatchPipeline()
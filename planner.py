@@ -0,0 +1,109 @@
+# Batch planning and daily byte quotas for VJ Save Restricted Content Bot
+import os
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional, Tuple
+from database.db import db
+from security import security_manager
+from tracker import human_size, human_time
+
+class BatchPlan:
+    """Metadata of a whole batch, resolved before any transfer starts"""
+
+    def __init__(self, max_file_size: int):
+        self.max_file_size = max_file_size
+        # messages to deliver, in id order
+        self.messages = []
+        # (message id, size) of files over max_file_size
+        self.oversized: List[Tuple[int, int]] = []
+        self.empty = 0
+        self.total_bytes = 0
+        self.types = Counter()
+        self.albums = set()
+        self.album_items = 0
+
+    def add(self, msg, msg_type: Optional[str]):
+        if msg.empty or msg.service or not msg_type:
+            self.empty += 1
+            return
+        size = self.size_of(msg, msg_type)
+        if size > self.max_file_size:
+            self.oversized.append((msg.id, size))
+            return
+        self.messages.append(msg)
+        self.total_bytes += size
+        self.types[msg_type] += 1
+        if msg.media_group_id:
+            self.albums.add(msg.media_group_id)
+            self.album_items += 1
+
+    @staticmethod
+    def size_of(msg, msg_type: Optional[str]) -> int:
+        if not msg_type or msg_type == "Text":
+            return 0
+        return getattr(getattr(msg, msg_type.lower(), None), 'file_size', 0) or 0
+
+class BatchPlanner:
+    def __init__(self):
+        # Planner configurations
+        self.DAILY_BYTE_QUOTA = int(os.environ.get('DAILY_BYTE_QUOTA', '0'))  # per user, 0 = unlimited
+        self.ASSUMED_THROUGHPUT = float(os.environ.get('PLAN_THROUGHPUT', str(5 * 1024 * 1024)))  # bytes/s until measured
+        self.MESSAGE_SECONDS = float(os.environ.get('PLAN_MESSAGE_SECONDS', '1'))  # fixed cost of one delivery
+        self.MIN_SAMPLE = 1024 * 1024  # batches moving less say nothing about throughput
+
+        # moving average of the throughput finished batches reached
+        self.throughput: Optional[float] = None
+
+    def today(self) -> str:
+        return datetime.utcnow().strftime('%Y-%m-%d')
+
+    async def remaining_quota(self, user_id: int) -> Optional[int]:
+        """Bytes the user may still move today, None without a quota"""
+        if self.DAILY_BYTE_QUOTA <= 0:
+            return None
+        used = await db.get_usage(user_id, self.today())
+        return max(0, self.DAILY_BYTE_QUOTA - used)
+
+    async def check(self, user_id: int, plan: BatchPlan) -> tuple[bool, str]:
+        """Validate a planned batch against the user's daily byte quota"""
+        remaining = await self.remaining_quota(user_id)
+        if remaining is None or plan.total_bytes <= remaining:
+            return True, "Within quota"
+        return False, f"Daily limit reached. This batch needs {human_size(plan.total_bytes)} but only {human_size(remaining)} of your {human_size(self.DAILY_BYTE_QUOTA)} daily limit is left"
+
+    async def charge(self, user_id: int, count: int):
+        if self.DAILY_BYTE_QUOTA <= 0 or count <= 0:
+            return
+        await db.add_usage(user_id, self.today(), count)
+
+    def record(self, count: int, seconds: float):
+        """Learn the throughput of a finished batch for later estimates"""
+        if count < self.MIN_SAMPLE or seconds <= 0:
+            return
+        sample = count / seconds
+        self.throughput = sample if self.throughput is None else 0.7 * self.throughput + 0.3 * sample
+
+    def eta(self, plan: BatchPlan) -> float:
+        throughput = self.throughput or self.ASSUMED_THROUGHPUT
+        # an album is delivered with one send
+        deliveries = len(plan.messages) - plan.album_items + len(plan.albums)
+        return plan.total_bytes / throughput + deliveries * self.MESSAGE_SECONDS
+
+    def summary(self, plan: BatchPlan) -> str:
+        text = f"📋 {len(plan.messages)} messages"
+        if plan.albums:
+            text += f" ({len(plan.albums)} albums)"
+        text += f", {human_size(plan.total_bytes)}, about {human_time(self.eta(plan))}"
+        if plan.empty:
+            text += f"\n{plan.empty} empty or deleted ids skipped"
+        if plan.oversized:
+            ids = ", ".join(str(msg_id) for msg_id, _ in plan.oversized[:10])
+            more = f" and {len(plan.oversized) - 10} more" if len(plan.oversized) > 10 else ""
+            text += f"\n{len(plan.oversized)} files over the {human_size(plan.max_file_size)} limit skipped: {ids}{more}"
+        return text
+
+    def new_plan(self) -> BatchPlan:
+        return BatchPlan(security_manager.MAX_FILE_SIZE)
+
+# Global batch planner instance
+batch_planner = BatchPlanner()
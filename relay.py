@@ -0,0 +1,78 @@
+# Streaming media relay for VJ Save Restricted Content Bot
+import os
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Optional
+from pyrogram import Client
+from pyrogram.types import Message
+from downloader import parallel_downloader, CHUNK_SIZE
+from metrics import metrics
+from uploader import parallel_uploader, send_uploaded_media, split_parts, UPLOADABLE_TYPES
+
+class MediaRelay:
+    def __init__(self):
+        # Relay configurations
+        self.ENABLED = os.environ.get('STREAM_RELAY', 'True').lower() in ('true', '1', 'yes', 'on')
+        self.BUFFER_CHUNKS = int(os.environ.get('RELAY_BUFFER_CHUNKS', '8'))  # 1MB chunks queued between download and upload
+
+    def supports(self, msg: Message, msg_type: str) -> bool:
+        """Check if the message can be relayed without touching the disk"""
+        if not self.ENABLED:
+            return False
+        media = getattr(msg, msg_type.lower(), None)
+        return msg_type in UPLOADABLE_TYPES and bool(getattr(media, 'file_size', 0))
+
+    async def _produce(self, acc: Client, msg: Message, file_size: int, queue: asyncio.Queue):
+        """Stream 1MB chunks from the user client into the bounded queue"""
+        # parallel ranges count their own bytes
+        parallel = parallel_downloader.supports(file_size)
+        if parallel:
+            source = parallel_downloader.iter_chunks(acc, msg, file_size)
+        else:
+            source = acc.stream_media(msg)
+        try:
+            async for chunk in source:
+                if not parallel:
+                    metrics.add_bytes("down", len(chunk))
+                # parallel ranges arrive DOWNLOAD_RANGE_CHUNKS at a time, the queue bound counts 1MB chunks
+                for offset in range(0, len(chunk), CHUNK_SIZE):
+                    await queue.put(chunk[offset:offset + CHUNK_SIZE])
+            await queue.put(None)
+        except Exception as e:
+            await queue.put(e)
+
+    async def _consume(self, queue: asyncio.Queue) -> AsyncIterator[bytes]:
+        while True:
+            chunk = await queue.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            if chunk is None:
+                return
+            yield chunk
+
+    async def relay(self, client: Client, acc: Client, msg: Message, msg_type: str, chat_id: int,
+                    reply_to_message_id: int, caption: Optional[str] = None, thumb: Optional[Awaitable[Optional[str]]] = None,
+                    progress: Optional[Callable] = None, progress_args: tuple = (),
+                    turn: Optional[Callable] = None) -> Optional[Message]:
+        """Stream media from the user client to the bot upload, overlapping download and upload.
+
+        The upload runs right away, `turn` is awaited only before the message is sent so batches stay in order.
+        The thumbnail is still being fetched while the parts upload, `thumb` is awaited right before the send.
+        """
+        media = getattr(msg, msg_type.lower())
+        queue = asyncio.Queue(maxsize=self.BUFFER_CHUNKS)
+        producer = asyncio.create_task(self._produce(acc, msg, media.file_size, queue))
+        try:
+            with metrics.time("relay"):
+                input_file = await parallel_uploader.upload_parts(
+                    client, split_parts(self._consume(queue)), media.file_size,
+                    getattr(media, 'file_name', None) or "file", progress, progress_args
+                )
+        finally:
+            producer.cancel()
+
+        if turn:
+            await turn()
+        return await send_uploaded_media(client, msg, msg_type, chat_id, reply_to_message_id, input_file, caption, thumb)
+
+# Global media relay instance
+media_relay = MediaRelay()
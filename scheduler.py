@@ -0,0 +1,130 @@
+# Fair transfer scheduling for VJ Save Restricted Content Bot
+import os
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Tuple
+
+# Message types served by the fast lane, cheap enough to never wait behind big files
+FAST_TYPES = ("Text", "Photo")
+
+class Lane:
+    """A pool of slots granted by weighted fair queuing on bytes between users"""
+
+    def __init__(self, slots: int):
+        self.free = slots
+        # user id -> waiting (future, cost, weight), in request order
+        self.queues: Dict[int, Deque[Tuple[asyncio.Future, float, float]]] = {}
+        # user id -> virtual time at which the user's granted work finishes
+        self.finish: Dict[int, float] = {}
+        self.clock = 0.0
+
+    def _charge(self, user_id: int, start: float, cost: float, weight: float):
+        self.clock = max(self.clock, start)
+        self.finish[user_id] = start + cost / weight
+
+    async def acquire(self, user_id: int, cost: float, weight: float):
+        if self.free > 0 and not self.queues:
+            self.free -= 1
+            self._charge(user_id, max(self.clock, self.finish.get(user_id, 0.0)), cost, weight)
+            return
+        if user_id not in self.queues:
+            # the user's virtual start is fixed when they begin waiting, not when they are served
+            self.finish[user_id] = max(self.clock, self.finish.get(user_id, 0.0))
+        future = asyncio.get_running_loop().create_future()
+        self.queues.setdefault(user_id, deque()).append((future, cost, weight))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # granted just before the cancellation arrived
+                self.release()
+            else:
+                self._forget(user_id, future)
+            raise
+
+    def _forget(self, user_id: int, future: asyncio.Future):
+        queue = self.queues.get(user_id)
+        if queue is None:
+            return
+        for item in queue:
+            if item[0] is future:
+                queue.remove(item)
+                break
+        if not queue:
+            del self.queues[user_id]
+
+    def release(self):
+        self.free += 1
+        while self.free > 0 and self.queues:
+            # the user whose next request would finish first in virtual time goes next
+            user_id = min(
+                self.queues,
+                key=lambda uid: self.finish[uid] + self.queues[uid][0][1] / self.queues[uid][0][2]
+            )
+            queue = self.queues[user_id]
+            future, cost, weight = queue.popleft()
+            if not queue:
+                del self.queues[user_id]
+            if future.done():
+                continue
+            self.free -= 1
+            self._charge(user_id, self.finish[user_id], cost, weight)
+            future.set_result(None)
+        if not self.queues:
+            # nobody is waiting, past usage no longer matters
+            self.finish.clear()
+            self.clock = 0.0
+
+class Slot:
+    def __init__(self, lane: Lane):
+        self.lane = lane
+        self.held = True
+
+    def release(self):
+        """Give the slot back early, e.g. before waiting for an ordered delivery turn"""
+        if self.held:
+            self.held = False
+            self.lane.release()
+
+class TransferScheduler:
+    def __init__(self):
+        # Scheduler configurations
+        self.DOWNLOAD_SLOTS = int(os.environ.get('MAX_CONCURRENT_DOWNLOADS', '6'))
+        self.UPLOAD_SLOTS = int(os.environ.get('MAX_CONCURRENT_UPLOADS', '6'))
+        self.FAST_SLOTS = int(os.environ.get('FAST_LANE_SLOTS', '4'))
+        self.MIN_COST = 64 * 1024  # bytes charged for a transfer of unknown or tiny size
+
+        self.lanes = {
+            'download': Lane(self.DOWNLOAD_SLOTS),
+            'upload': Lane(self.UPLOAD_SLOTS),
+            'fast': Lane(self.FAST_SLOTS),
+        }
+        # user id -> share weight, users without an entry weigh 1
+        self.weights: Dict[int, float] = {}
+
+    def lane_for(self, msg_type: str, phase: str) -> str:
+        return 'fast' if msg_type in FAST_TYPES else phase
+
+    @asynccontextmanager
+    async def slot(self, user_id: int, lane: str, cost: int = 0):
+        """Hold a slot of a lane, users get turns in proportion to their weight and the bytes they move.
+
+        Never wait for an ordered delivery turn while holding a slot, release it first.
+        """
+        chosen = self.lanes[lane]
+        await chosen.acquire(user_id, max(cost or 0, self.MIN_COST), self.weights.get(user_id, 1.0))
+        slot = Slot(chosen)
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            name: {'free': lane.free, 'waiting': sum(len(queue) for queue in lane.queues.values())}
+            for name, lane in self.lanes.items()
+        }
+
+# Global transfer scheduler instance
+transfer_scheduler = TransferScheduler()
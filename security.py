@@ -8,6 +8,9 @@ from typing import Dict, Optional
 import asyncio
 from pyrogram import Client
 from pyrogram.errors import FloodWait, AuthKeyUnregistered, SessionPasswordNeeded
+from state_backends import MemoryStateBackend, MongoStateBackend
+from event_log import security_events
+from pacing import rate_scheduler
 
 class SecurityManager:
     def __init__(self):
@@ -17,12 +20,23 @@ class SecurityManager:
         self.RATE_LIMIT_WINDOW = int(os.environ.get('RATE_LIMIT_WINDOW', '300'))  # 5 minutes
         self.MAX_REQUESTS_PER_WINDOW = int(os.environ.get('MAX_REQUESTS_PER_WINDOW', '20'))
         self.MAX_FILE_SIZE = int(os.environ.get('MAX_FILE_SIZE', '2097152000'))  # 2GB
+        self.MAX_TRACKED_USERS = int(os.environ.get('MAX_TRACKED_USERS', '100000'))
+        self.IDLE_USER_TTL = int(os.environ.get('IDLE_USER_TTL', '86400'))  # forget idle users after 1 day
         
-        # User activity tracking
-        self.user_activity: Dict[int, Dict] = {}
-        self.rate_limits: Dict[int, list] = {}
-        self.suspicious_activity: Dict[int, int] = {}
+        self.STATE_BACKEND = os.environ.get('STATE_BACKEND', 'memory').lower()  # memory or mongo
         
+        # User activity tracking, shared by all bot processes with the mongo backend
+        self.backend = self._create_backend()
+        
+    def _create_backend(self):
+        if self.STATE_BACKEND == 'mongo':
+            from database.db import db
+            return MongoStateBackend(db.db.security_state, self.IDLE_USER_TTL)
+        return MemoryStateBackend(self.MAX_TRACKED_USERS, self.IDLE_USER_TTL)
+    
+    async def create_indexes(self):
+        await self.backend.create_indexes()
+    
     def generate_session_id(self) -> str:
         """Generate a secure session ID"""
         return secrets.token_urlsafe(32)
@@ -31,57 +45,36 @@ class SecurityManager:
         """Hash session string for secure storage"""
         return hashlib.sha256(session_string.encode()).hexdigest()
     
-    def is_rate_limited(self, user_id: int) -> bool:
-        """Check if user is rate limited"""
-        now = time.time()
-        if user_id not in self.rate_limits:
-            self.rate_limits[user_id] = []
-        
-        # Remove old requests outside the window
-        self.rate_limits[user_id] = [
-            req_time for req_time in self.rate_limits[user_id] 
-            if now - req_time < self.RATE_LIMIT_WINDOW
-        ]
-        
-        # Check if user has exceeded the limit
-        if len(self.rate_limits[user_id]) >= self.MAX_REQUESTS_PER_WINDOW:
-            return True
-        
-        # Add current request
-        self.rate_limits[user_id].append(now)
-        return False
+    async def forget_user(self, user_id: int):
+        """Drop all tracked state of a user"""
+        await self.backend.forget(user_id)
     
-    def track_user_activity(self, user_id: int, activity_type: str):
+    async def is_rate_limited(self, user_id: int) -> bool:
+        """Check if user is rate limited (token bucket refilled over RATE_LIMIT_WINDOW)"""
+        allowed = await self.backend.take_token(user_id, self.MAX_REQUESTS_PER_WINDOW, self.RATE_LIMIT_WINDOW)
+        return not allowed
+    
+    async def track_user_activity(self, user_id: int, activity_type: str):
         """Track user activity for security monitoring"""
-        now = time.time()
-        if user_id not in self.user_activity:
-            self.user_activity[user_id] = {
-                'last_activity': now,
-                'login_time': None,
-                'request_count': 0,
-                'suspicious_count': 0
-            }
-        
-        self.user_activity[user_id]['last_activity'] = now
-        self.user_activity[user_id]['request_count'] += 1
-        
         # Track suspicious activity
-        if activity_type in ['large_batch', 'rapid_requests', 'invalid_input']:
-            self.user_activity[user_id]['suspicious_count'] += 1
-            if user_id not in self.suspicious_activity:
-                self.suspicious_activity[user_id] = 0
-            self.suspicious_activity[user_id] += 1
+        suspicious = activity_type in ['large_batch', 'rapid_requests', 'invalid_input']
+        await self.backend.track_activity(user_id, suspicious)
+    
+    async def get_user_activity(self, user_id: int) -> Dict:
+        """Get last activity, request count and suspicious count of a user"""
+        return await self.backend.get_activity(user_id)
     
-    def is_session_expired(self, user_id: int) -> bool:
+    async def is_session_expired(self, user_id: int) -> bool:
         """Check if user session has expired"""
         # Session timeout is disabled (SESSION_TIMEOUT = 0)
         if self.SESSION_TIMEOUT == 0:
             return False
-            
-        if user_id not in self.user_activity:
+        
+        activity = await self.backend.get_activity(user_id)
+        if not activity:
             return True
         
-        last_activity = self.user_activity[user_id].get('last_activity', 0)
+        last_activity = activity.get('last_activity', 0)
         return time.time() - last_activity > self.SESSION_TIMEOUT
     
     def validate_batch_size(self, from_id: int, to_id: int) -> tuple[bool, str]:
@@ -117,12 +110,13 @@ class SecurityManager:
         
         return True, "Valid input"
     
-    def get_security_warning(self, user_id: int) -> Optional[str]:
+    async def get_security_warning(self, user_id: int) -> Optional[str]:
         """Get security warning for user if needed"""
-        if user_id not in self.suspicious_activity:
+        activity = await self.backend.get_activity(user_id)
+        suspicious_count = activity.get('suspicious_count', 0)
+        if not suspicious_count:
             return None
         
-        suspicious_count = self.suspicious_activity[user_id]
         if suspicious_count >= 5:
             return "⚠️ High suspicious activity detected. Your account may be temporarily restricted."
         elif suspicious_count >= 3:
@@ -134,26 +128,21 @@ class SecurityManager:
         """Validate user session is still active"""
         try:
             # Try to get user info to validate session
-            me = await client.get_me()
+            me = await rate_scheduler.call(client.name, client.get_me)
             if not me:
                 return False, "Session validation failed"
             return True, "Session valid"
+        except FloodWait:
+            # a busy account, not a dead session, the caller decides when to retry
+            raise
         except AuthKeyUnregistered:
             return False, "Session expired or invalid"
         except Exception as e:
             return False, f"Session validation error: {str(e)}"
     
-    def log_security_event(self, user_id: int, event_type: str, details: str):
-        """Log security events for monitoring"""
-        timestamp = datetime.now().isoformat()
-        log_entry = f"[{timestamp}] User {user_id}: {event_type} - {details}"
-        
-        # In production, you might want to send this to a logging service
-        print(f"SECURITY: {log_entry}")
-        
-        # You could also write to a file or send to monitoring service
-        # with open('security.log', 'a') as f:
-        #     f.write(log_entry + '\n')
+    def log_security_event(self, user_id: int, event_type: str, details: str, level: Optional[str] = None):
+        """Log security events for monitoring, buffered and written in batches by a background task"""
+        security_events.emit(user_id, event_type, details, level)
 
 # Global security manager instance
 security_manager = SecurityManager()
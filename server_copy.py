@@ -0,0 +1,74 @@
+# Server-side copy fast path for VJ Save Restricted Content Bot
+import os
+import asyncio
+from typing import Dict, Optional, Tuple
+from pyrogram import Client
+from pyrogram.types import Message
+from pacing import rate_scheduler
+from metrics import metrics
+
+class ServerCopy:
+    def __init__(self):
+        # Fast path configurations
+        self.ENABLED = os.environ.get('SERVER_COPY', 'True').lower() in ('true', '1', 'yes', 'on')
+        self.TIMEOUT = float(os.environ.get('SERVER_COPY_TIMEOUT', '15'))  # wait for the copy to reach the bot
+
+        # (logged in account id, file_unique_id) -> future resolved with the bot side message
+        self.pending: Dict[Tuple[int, str], asyncio.Future] = {}
+
+    def supports(self, msg: Message) -> bool:
+        """Only chats without protected content can be copied by the user client"""
+        if not self.ENABLED:
+            return False
+        if getattr(msg, 'has_protected_content', False):
+            return False
+        return not getattr(msg.chat, 'has_protected_content', False)
+
+    def receive(self, message: Message) -> bool:
+        """Hand a media message the bot received to the copy waiting for it"""
+        if message.from_user is None:
+            return False
+        for media_type in ("document", "video", "animation", "sticker", "voice", "audio", "photo"):
+            media = getattr(message, media_type, None)
+            if media is None:
+                continue
+            # the copy comes from the logged in account, not from the bot user who asked for it
+            waiter = self.pending.get((message.from_user.id, media.file_unique_id))
+            if waiter is None or waiter.done():
+                return False
+            waiter.set_result(message)
+            return True
+        return False
+
+    async def fetch(self, client: Client, acc: Client, msg: Message, msg_type: str) -> Optional[str]:
+        """Copy the source message to the bot with the user client and return the bot's file_id for it.
+
+        Returns None when the copy is rejected or does not arrive in time, the caller then downloads.
+        """
+        media = getattr(msg, msg_type.lower())
+        key = (await acc.storage.user_id(), media.file_unique_id)
+        if key in self.pending:
+            # the same file is already on its way from this account
+            return None
+        waiter = asyncio.get_running_loop().create_future()
+        self.pending[key] = waiter
+        copied = None
+        try:
+            with metrics.time("copy"):
+                copied = await rate_scheduler.call(acc.name, acc.copy_message, client.me.username, msg.chat.id, msg.id)
+                received = await asyncio.wait_for(waiter, self.TIMEOUT)
+            return getattr(received, msg_type.lower()).file_id
+        except Exception as e:
+            print(f"Server copy failed, falling back to download: {e}")
+            return None
+        finally:
+            self.pending.pop(key, None)
+            if copied is not None:
+                try:
+                    # revoke so the copy disappears from the user's chat with the bot too
+                    await acc.delete_messages(copied.chat.id, copied.id)
+                except Exception:
+                    pass
+
+# Global server copy instance
+server_copy = ServerCopy()
@@ -0,0 +1,128 @@
+# Download staging area for VJ Save Restricted Content Bot
+import os
+import shutil
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from metrics import metrics
+
+class StagingArea:
+    def __init__(self):
+        # Staging configurations
+        self.DIR = os.path.abspath(os.environ.get('STAGING_DIR', os.path.join("downloads", "staging")))
+        self.TMPFS_DIR = os.environ.get('STAGING_TMPFS_DIR', '')  # e.g. /dev/shm/savebot, empty disables the tier
+        self.TMPFS_MAX_FILE = int(os.environ.get('STAGING_TMPFS_MAX_FILE', str(20 * 1024 * 1024)))
+        self.TMPFS_BUDGET = int(os.environ.get('STAGING_TMPFS_BUDGET', str(256 * 1024 * 1024)))
+        self.DISK_BUDGET = int(os.environ.get('STAGING_DISK_BUDGET', str(10 * 1024 * 1024 * 1024)))  # 0 = unlimited
+        self.MIN_FREE = int(os.environ.get('STAGING_MIN_FREE', str(512 * 1024 * 1024)))  # bytes always left free on disk
+        self.WAIT = float(os.environ.get('STAGING_WAIT', '300'))  # seconds a download waits for space before failing
+
+        self.roots = {'disk': self.DIR}
+        if self.TMPFS_DIR:
+            self.roots['tmpfs'] = os.path.abspath(self.TMPFS_DIR)
+        # tier -> bytes admitted and not yet removed
+        self.reserved: Dict[str, int] = {tier: 0 for tier in self.roots}
+        self.waiting = 0
+        self._space: Optional[asyncio.Condition] = None
+        self._ids = 0
+
+        metrics.gauge('bot_staging_reserved_bytes', 'Bytes admitted to the staging area', lambda: {(('tier', tier),): size for tier, size in self.reserved.items()})
+        metrics.gauge('bot_staging_waiting', 'Downloads waiting for staging space', lambda: self.waiting)
+
+    def process_dir(self, tier: str) -> str:
+        # files of every process live apart, so a sweep can tell which owner is gone
+        return os.path.join(self.roots[tier], str(os.getpid()))
+
+    def job_dir(self, tier: str, job: str) -> str:
+        return os.path.join(self.process_dir(tier), job)
+
+    def _tier_for(self, size: int) -> str:
+        if 'tmpfs' in self.roots and size <= self.TMPFS_MAX_FILE and self.reserved['tmpfs'] + size <= self.TMPFS_BUDGET:
+            return 'tmpfs'
+        return 'disk'
+
+    def _fits(self, size: int) -> bool:
+        if self.DISK_BUDGET > 0 and self.reserved['disk'] + size > self.DISK_BUDGET:
+            return False
+        return shutil.disk_usage(self.roots['disk']).free - size >= self.MIN_FREE
+
+    async def _admit(self, size: int):
+        """Wait until a disk download of size bytes fits the budget and the free space"""
+        if self.DISK_BUDGET > 0 and size > self.DISK_BUDGET:
+            raise RuntimeError(f"File of {size} bytes is larger than the staging budget")
+        os.makedirs(self.roots['disk'], exist_ok=True)
+        if self._space is None:
+            self._space = asyncio.Condition()
+        async with self._space:
+            if self._fits(size):
+                return
+            self.waiting += 1
+            try:
+                # a timeout keeps a batch from waiting forever on space held by its own later messages
+                await asyncio.wait_for(self._space.wait_for(lambda: self._fits(size)), self.WAIT)
+            except asyncio.TimeoutError:
+                raise RuntimeError("Not enough disk space to download this file right now, try again later")
+            finally:
+                self.waiting -= 1
+
+    @asynccontextmanager
+    async def reserve(self, job: str, size: int):
+        """Admit a download of size bytes and yield an empty directory for it.
+
+        The directory and everything in it are removed on exit, whatever happened inside.
+        """
+        size = size or 0
+        tier = self._tier_for(size)
+        if tier == 'disk':
+            await self._admit(size)
+        self.reserved[tier] += size
+        self._ids += 1
+        directory = os.path.join(self.job_dir(tier, job), str(self._ids))
+        try:
+            await asyncio.to_thread(os.makedirs, directory, exist_ok=True)
+            yield directory
+        finally:
+            await asyncio.to_thread(shutil.rmtree, directory, True)
+            self.reserved[tier] -= size
+            if self._space is not None:
+                async with self._space:
+                    self._space.notify_all()
+
+    async def cleanup(self, job: str):
+        """Remove whatever a finished job left behind"""
+        for tier in self.roots:
+            await asyncio.to_thread(shutil.rmtree, self.job_dir(tier, job), True)
+
+    def sweep(self):
+        """Remove the files of processes that are gone, call once at startup before anything is staged"""
+        removed = 0
+        for root in self.roots.values():
+            if not os.path.isdir(root):
+                continue
+            for entry in os.listdir(root):
+                if not entry.isdigit():
+                    continue
+                pid = int(entry)
+                # a leftover directory with our own pid belongs to an earlier process that had it
+                if pid != os.getpid() and _alive(pid):
+                    continue
+                shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+                removed += 1
+        if removed:
+            print(f"Staging area: removed {removed} directories left by stopped processes")
+
+    def stats(self) -> dict:
+        return {'reserved': dict(self.reserved), 'waiting': self.waiting}
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # exists, owned by someone else
+        return True
+    return True
+
+# Global staging area instance
+staging_area = StagingArea()
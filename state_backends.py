@@ -0,0 +1,122 @@
+# Shared security state backends for VJ Save Restricted Content Bot
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict
+from pymongo import ReturnDocument
+
+class MemoryStateBackend:
+    """Process-local state, evicting users idle for idle_ttl or beyond max_users"""
+
+    def __init__(self, max_users: int, idle_ttl: int):
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        # user_id -> [tokens, last_refill]
+        self.rate_limits: Dict[int, list] = {}
+        # user_id -> {'last_activity', 'request_count', 'suspicious_count'}
+        self.user_activity: Dict[int, Dict] = {}
+        # user_id -> last seen, least recently seen first
+        self.last_seen: "OrderedDict[int, float]" = OrderedDict()
+
+    def _touch(self, user_id: int, now: float):
+        """Mark user as recently seen and evict idle or excess users"""
+        self.last_seen[user_id] = now
+        self.last_seen.move_to_end(user_id)
+
+        while self.last_seen:
+            oldest_id, oldest_seen = next(iter(self.last_seen.items()))
+            if len(self.last_seen) <= self.max_users and now - oldest_seen < self.idle_ttl:
+                break
+            self._forget(oldest_id)
+
+    async def create_indexes(self):
+        return
+
+    def _forget(self, user_id: int):
+        self.last_seen.pop(user_id, None)
+        self.rate_limits.pop(user_id, None)
+        self.user_activity.pop(user_id, None)
+
+    async def take_token(self, user_id: int, capacity: int, window: int) -> bool:
+        """Take one token from the user's bucket, False if it is empty"""
+        now = time.time()
+        self._touch(user_id, now)
+        bucket = self.rate_limits.get(user_id)
+        if bucket is None:
+            bucket = self.rate_limits[user_id] = [float(capacity), now]
+
+        # Refill tokens for the time passed since the last request
+        bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * capacity / window)
+        bucket[1] = now
+        if bucket[0] < 1:
+            return False
+        bucket[0] -= 1
+        return True
+
+    async def track_activity(self, user_id: int, suspicious: bool):
+        now = time.time()
+        self._touch(user_id, now)
+        activity = self.user_activity.setdefault(user_id, {
+            'last_activity': now,
+            'request_count': 0,
+            'suspicious_count': 0
+        })
+        activity['last_activity'] = now
+        activity['request_count'] += 1
+        if suspicious:
+            activity['suspicious_count'] += 1
+
+    async def get_activity(self, user_id: int) -> Dict:
+        return dict(self.user_activity.get(user_id, {}))
+
+    async def forget(self, user_id: int):
+        self._forget(user_id)
+
+class MongoStateBackend:
+    """State shared by every bot process through one Mongo collection, idle users expire by TTL index"""
+
+    def __init__(self, collection, idle_ttl: int):
+        self.col = collection
+        self.idle_ttl = idle_ttl
+
+    async def create_indexes(self):
+        await self.col.create_index('seen', expireAfterSeconds=self.idle_ttl)
+
+    async def take_token(self, user_id: int, capacity: int, window: int) -> bool:
+        """Refill and take a token in one atomic update pipeline"""
+        now = time.time()
+        tokens = {'$min': [capacity, {'$add': [
+            {'$ifNull': ['$tokens', capacity]},
+            {'$multiply': [{'$subtract': [now, {'$ifNull': ['$refilled', now]}]}, capacity / window]}
+        ]}]}
+        doc = await self.col.find_one_and_update(
+            {'_id': int(user_id)},
+            [
+                {'$set': {'tokens': tokens, 'refilled': now, 'seen': datetime.utcnow()}},
+                {'$set': {'allowed': {'$gte': ['$tokens', 1]}}},
+                {'$set': {'tokens': {'$cond': ['$allowed', {'$subtract': ['$tokens', 1]}, '$tokens']}}}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return bool(doc['allowed'])
+
+    async def track_activity(self, user_id: int, suspicious: bool):
+        await self.col.update_one(
+            {'_id': int(user_id)},
+            {
+                '$set': {'last_activity': time.time(), 'seen': datetime.utcnow()},
+                '$inc': {'request_count': 1, 'suspicious_count': int(suspicious)}
+            },
+            upsert=True
+        )
+
+    async def get_activity(self, user_id: int) -> Dict:
+        doc = await self.col.find_one({'_id': int(user_id)}, {'last_activity': 1, 'request_count': 1, 'suspicious_count': 1})
+        if not doc or 'last_activity' not in doc:
+            return {}
+        doc.pop('_id', None)
+        return doc
+
+    async def forget(self, user_id: int):
+        await self.col.delete_one({'_id': int(user_id)})
@@ -0,0 +1,211 @@
+# Tests of the shared batch job queue, session lookups and the user client pool
+import asyncio
+from datetime import datetime, timedelta
+from client_pool import UserClientPool
+from jobs import BatchQueue
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_one_active_job_per_user(database):
+    async def scenario():
+        await database.create_indexes()
+        first = await database.create_job(1, 1, 10, 1, 5)
+        assert first is not None
+        assert await database.create_job(1, 1, 11, 1, 5) is None
+        # a finished job no longer blocks the user
+        await database.finish_job(first, 'done')
+        assert await database.create_job(1, 1, 12, 1, 5) is not None
+    run(scenario())
+
+
+def test_claim_is_exclusive(database):
+    async def scenario():
+        job_id = await database.create_job(1, 1, 10, 1, 5)
+        claims = await asyncio.gather(*[database.claim_job(f"worker{n}", 90) for n in range(5)])
+        owners = [job['worker'] for job in claims if job]
+        assert len(owners) == 1
+        job = await database.jobs.find_one({'_id': job_id})
+        assert job['worker'] == owners[0] and job['status'] == 'running' and job['attempts'] == 1
+    run(scenario())
+
+
+def test_claim_skips_excluded_and_takes_oldest(database):
+    async def scenario():
+        first = await database.create_job(1, 1, 10, 1, 5)
+        second = await database.create_job(2, 2, 20, 1, 5)
+        assert (await database.claim_job("a", 90))['_id'] == first
+        assert (await database.claim_job("a", 90, exclude=[first]))['_id'] == second
+    run(scenario())
+
+
+def test_stale_lease_is_reclaimed(database):
+    async def scenario():
+        job_id = await database.create_job(1, 1, 10, 1, 5)
+        await database.claim_job("a", 90)
+        assert await database.claim_job("b", 90) is None
+        assert await database.heartbeat_job(job_id, "a") == 'running'
+
+        # worker a went silent past the lease
+        await database.jobs.update_one({'_id': job_id}, {'$set': {'heartbeat': datetime.utcnow() - timedelta(seconds=91)}})
+        job = await database.claim_job("b", 90)
+        assert job['_id'] == job_id and job['worker'] == "b" and job['attempts'] == 2
+        # the old owner learns it lost the job on its next heartbeat
+        assert await database.heartbeat_job(job_id, "a") is None
+        assert await database.heartbeat_job(job_id, "b") == 'running'
+    run(scenario())
+
+
+def test_worker_reclaims_its_own_job_after_restart(database):
+    async def scenario():
+        job_id = await database.create_job(1, 1, 10, 1, 5)
+        await database.claim_job("a", 90)
+        job = await database.claim_job("a", 90)
+        assert job['_id'] == job_id and job['attempts'] == 2
+    run(scenario())
+
+
+def test_targeted_claim_never_takes_a_running_job(database):
+    async def scenario():
+        job_id = await database.create_job(1, 1, 10, 1, 5)
+        assert (await database.claim_job("a", 90))['_id'] == job_id
+        assert await database.claim_job("a", 90, job_id=job_id, exclude=[job_id]) is None
+        assert await database.claim_job("a", 90, job_id=job_id) is None
+        job = await database.jobs.find_one({'_id': job_id})
+        assert job['attempts'] == 1
+    run(scenario())
+
+
+def test_save_racing_the_claim_loop_runs_the_job_once(database):
+    async def scenario():
+        queue = BatchQueue()
+        queue.WORKER_ID = "a"
+        job_id = await database.create_job(1, 1, 10, 1, 5)
+        # the claim loop and save() both ask before either has spawned a runner
+        claims = await asyncio.gather(queue.claim(), queue.claim(job_id), queue.claim())
+        assert [job['_id'] for job in claims if job] == [job_id]
+    run(scenario())
+
+
+def test_restarted_worker_only_reclaims_jobs_of_its_previous_run(database):
+    async def scenario():
+        left_behind = await database.create_job(1, 1, 10, 1, 5)
+        await database.claim_job("a", 90)
+        queue = BatchQueue()
+        queue.WORKER_ID = "a"
+        queue.started = datetime.utcnow() + timedelta(seconds=1)
+        job = await queue.claim()
+        assert job['_id'] == left_behind and job['attempts'] == 2
+        # claimed by this run now, another claim must not hand it out again
+        queue.started = datetime.utcnow() - timedelta(seconds=1)
+        assert await queue.claim() is None
+    run(scenario())
+
+
+def test_heartbeat_sees_cancel_from_another_process(database):
+    async def scenario():
+        queue = BatchQueue()
+        queue.WORKER_ID = "a"
+        queue.HEARTBEAT_INTERVAL = 0.01
+        job_id = await database.create_job(1, 1, 10, 1, 5)
+        job = await queue.claim()
+        release = asyncio.Event()
+
+        async def runner(client, job):
+            await release.wait()
+        task = queue.spawn(None, job, runner)
+        await asyncio.sleep(0.05)
+        assert not queue.is_cancelled(job_id)
+
+        await database.cancel_user_jobs(1)
+        await asyncio.sleep(0.05)
+        assert queue.is_cancelled(job_id)
+        release.set()
+        await task
+        assert job_id not in queue.tasks
+    run(scenario())
+
+
+def test_drain_waits_for_running_jobs(database):
+    async def scenario():
+        queue = BatchQueue()
+        queue.WORKER_ID = "a"
+        await database.create_job(1, 1, 10, 1, 5)
+        job = await queue.claim()
+        finished = []
+
+        async def runner(client, job):
+            while not queue.stopping:
+                await asyncio.sleep(0.01)
+            finished.append(job['_id'])
+        queue.spawn(None, job, runner)
+        await queue.drain()
+        assert finished == [job['_id']]
+    run(scenario())
+
+
+def test_session_changes_of_other_processes_are_seen(database):
+    async def scenario():
+        await database.add_user(1, "user")
+        assert await database.get_session(1) is None
+        # logged in and out again through another process
+        await database.col.update_one({'id': 1}, {'$set': {'session': "new"}})
+        assert await database.get_session(1) == "new"
+        await database.col.update_one({'id': 1}, {'$set': {'session': None}})
+        assert await database.get_session(1) is None
+    run(scenario())
+
+
+def test_get_sessions(database):
+    async def scenario():
+        await database.add_user(1, "a")
+        await database.set_session(1, "s1")
+        await database.add_user(2, "b")
+        assert await database.get_sessions([1, 2, 3]) == {1: "s1", 2: None, 3: None}
+    run(scenario())
+
+
+def test_pool_closes_clients_logged_out_elsewhere(database):
+    class Client:
+        disconnected = False
+
+        async def disconnect(self):
+            self.disconnected = True
+
+    async def scenario():
+        pool = UserClientPool()
+        for user_id, session in ((1, "s1"), (2, "s2"), (3, "s3")):
+            await database.add_user(user_id, "user")
+            await database.set_session(user_id, session)
+            pool.clients[user_id] = {'client': Client(), 'session': session, 'last_used': 0, 'in_use': 0}
+        pool.clients[3]['in_use'] = 1
+        clients = {user_id: entry['client'] for user_id, entry in pool.clients.items()}
+
+        await database.col.update_one({'id': 1}, {'$set': {'session': None}})
+        await database.col.update_one({'id': 3}, {'$set': {'session': None}})
+        await pool.sweep_revoked()
+        # a client running a batch is left to finish it
+        assert sorted(pool.clients) == [2, 3]
+        assert clients[1].disconnected and not clients[2].disconnected
+    run(scenario())
+
+
+def test_pool_keeps_no_lock_for_users_it_is_done_with(database):
+    async def scenario():
+        pool = UserClientPool()
+        inside = []
+
+        async def hold(user_id):
+            async with pool._lock(user_id):
+                inside.append(user_id)
+                assert inside.count(user_id) == 1
+                await asyncio.sleep(0.01)
+                inside.remove(user_id)
+        # callers of one user still take turns
+        await asyncio.gather(*[hold(user_id) for user_id in (1, 1, 1, 2)])
+        for user_id in range(100):
+            await pool.close(user_id)
+        assert pool.locks == {}
+    run(scenario())
@@ -0,0 +1,52 @@
+# Tests of the Prometheus metrics registry
+import asyncio
+import threading
+from metrics import Metrics
+
+
+def test_render_format():
+    metrics = Metrics()
+    metrics.add_bytes("down", 10)
+    metrics.add_bytes("down", 5)
+    metrics.observe('bot_stage_seconds', 0.02, stage="download")
+    metrics.gauge('bot_waiting', 'Waiting jobs', lambda: {(('lane', 'fast'),): 2})
+    text = asyncio.run(metrics.render())
+    assert 'bot_transfer_bytes_total{direction="down"} 15' in text
+    assert 'bot_stage_seconds_bucket{stage="download",le="0.01"} 0' in text
+    assert 'bot_stage_seconds_bucket{stage="download",le="0.025"} 1' in text
+    assert 'bot_stage_seconds_count{stage="download"} 1' in text
+    assert '# TYPE bot_waiting gauge' in text and 'bot_waiting{lane="fast"} 2' in text
+
+
+def test_owner_kept_counter_is_read_on_scrape():
+    metrics = Metrics()
+    state = {'hits': 0}
+    metrics.counter('bot_file_cache_hits_total', 'Cache hits', lambda: state['hits'])
+    state['hits'] = 3
+    text = asyncio.run(metrics.render())
+    assert '# TYPE bot_file_cache_hits_total counter' in text and 'bot_file_cache_hits_total 3' in text
+
+
+def test_render_while_other_threads_record():
+    metrics = Metrics()
+    stop = threading.Event()
+
+    def record(thread):
+        count = 0
+        while not stop.is_set():
+            # new label sets keep growing the dicts being rendered
+            metrics.inc('bot_mongo_errors_total', command=f"{thread}-{count % 500}")
+            metrics.observe('bot_mongo_seconds', 0.001, command=f"{thread}-{count % 500}")
+            metrics.observe(f'bot_thread_{thread}_{count % 50}_seconds', 0.001)
+            count += 1
+
+    threads = [threading.Thread(target=record, args=(n,)) for n in range(2)]
+    for thread in threads:
+        thread.start()
+    try:
+        for _ in range(20):
+            asyncio.run(metrics.render())
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
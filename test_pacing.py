@@ -0,0 +1,153 @@
+# Tests of the adaptive FloodWait pacing
+import heapq
+import asyncio
+import pytest
+from pyrogram.errors import FloodWait
+import pacing
+from pacing import RateScheduler
+
+real_sleep = asyncio.sleep
+
+
+class Clock:
+    """Virtual time, the next sleeper wakes as soon as every task is waiting"""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+        self.sleepers = []
+        self.count = 0
+
+    def time(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        future = asyncio.get_running_loop().create_future()
+        self.count += 1
+        heapq.heappush(self.sleepers, (self.now + seconds, self.count, future))
+        await future
+
+    def run(self, coro):
+        async def drive():
+            task = asyncio.create_task(coro)
+            while not task.done():
+                for _ in range(10):
+                    await real_sleep(0)
+                if self.sleepers and not task.done():
+                    wake, _, future = heapq.heappop(self.sleepers)
+                    self.now = max(self.now, wake)
+                    future.set_result(None)
+            return task.result()
+        return asyncio.run(drive())
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(pacing.time, 'time', clock.time)
+    monkeypatch.setattr(pacing.asyncio, 'sleep', clock.sleep)
+    return clock
+
+
+@pytest.fixture
+def scheduler(clock):
+    scheduler = RateScheduler()
+    scheduler.MIN_INTERVAL, scheduler.START_INTERVAL, scheduler.MAX_INTERVAL = 0.5, 1.0, 8.0
+    scheduler.GLOBAL_RATE = 10
+    return scheduler
+
+
+class Api:
+    """Fails with the given FloodWaits before answering"""
+
+    def __init__(self, clock, waits=()):
+        self.clock = clock
+        self.waits = list(waits)
+        self.calls = []
+
+    async def __call__(self, value):
+        self.calls.append(self.clock.now)
+        if self.waits:
+            raise FloodWait(value=self.waits.pop(0))
+        return value
+
+
+class Bot:
+    name = "bot"
+
+
+def test_flood_wait_is_honoured_and_retried(scheduler, clock):
+    api = Api(clock, waits=[5])
+    assert clock.run(scheduler.call("acc", api, "ok")) == "ok"
+    assert len(api.calls) == 2
+    assert api.calls[1] - api.calls[0] >= 5
+    state = scheduler.accounts["acc"]
+    assert state['flood_waits'] == 1 and state['blocked_until'] == api.calls[0] + 5
+
+
+def test_flood_wait_over_the_limit_is_raised(scheduler, clock):
+    scheduler.MAX_FLOOD_WAIT = 60
+    with pytest.raises(FloodWait):
+        clock.run(scheduler.call("acc", Api(clock, waits=[61]), "ok"))
+    # the account stays blocked for the others
+    assert scheduler.accounts["acc"]['blocked_until'] >= clock.now + 61 - 1
+
+
+def test_backoff_after_flood_wait_and_speed_up_after_success(scheduler, clock):
+    async def scenario():
+        await scheduler.call("acc", Api(clock, waits=[1, 1, 1, 1]), "ok")
+        # doubled for every FloodWait, capped, then eased once for the success
+        assert scheduler.accounts["acc"]['interval'] == pytest.approx(8.0 * 0.9)
+        for _ in range(40):
+            await scheduler.call("acc", Api(clock), "ok")
+        assert scheduler.accounts["acc"]['interval'] == scheduler.MIN_INTERVAL
+    clock.run(scenario())
+
+
+def test_calls_of_one_account_are_spaced_by_its_interval(scheduler, clock):
+    async def scenario():
+        api = Api(clock)
+        await asyncio.gather(*[scheduler.call("acc", api, n) for n in range(3)])
+        gaps = [later - earlier for earlier, later in zip(api.calls, api.calls[1:])]
+        assert all(gap >= scheduler.MIN_INTERVAL for gap in gaps)
+    clock.run(scenario())
+
+
+def test_flood_wait_in_one_chat_does_not_hold_back_another(scheduler, clock):
+    async def scenario():
+        bot = Bot()
+        slow, fast = Api(clock, waits=[30]), Api(clock)
+        start = clock.now
+        blocked = asyncio.create_task(scheduler.send(bot, 1, slow, "ok"))
+        for _ in range(5):
+            await real_sleep(0)
+        assert scheduler.accounts["bot:1"]['flood_waits'] == 1
+        await scheduler.send(bot, 2, fast, "ok")
+        assert clock.now - start < 1 and not blocked.done()
+        await blocked
+        assert slow.calls[1] - slow.calls[0] >= 30
+        assert scheduler.accounts["bot:2"]['flood_waits'] == 0
+    clock.run(scenario())
+
+
+def test_global_bucket_caps_sends_over_all_chats(scheduler, clock):
+    async def scenario():
+        bot = Bot()
+        api = Api(clock)
+        start = clock.now
+        await asyncio.gather(*[scheduler.send(bot, chat_id, api, chat_id) for chat_id in range(20)])
+        # 20 chats, each on its first send, still go out at GLOBAL_RATE per second
+        assert clock.now - start >= (20 - 1) / scheduler.GLOBAL_RATE - 1e-9
+        assert len(api.calls) == 20
+        gaps = [later - earlier for earlier, later in zip(api.calls, api.calls[1:])]
+        assert min(gaps) >= 1 / scheduler.GLOBAL_RATE - 1e-9
+    clock.run(scenario())
+
+
+def test_idle_chats_are_forgotten(scheduler, clock):
+    async def scenario():
+        bot = Bot()
+        await scheduler.send(bot, 1, Api(clock), "ok")
+        clock.now += 2 * scheduler.IDLE_TTL + 1
+        await scheduler.send(bot, 2, Api(clock), "ok")
+        assert "bot:1" not in scheduler.accounts and "bot:2" in scheduler.accounts
+    clock.run(scenario())
@@ -0,0 +1,163 @@
+# Tests of ordered batch delivery and checkpointing
+import asyncio
+import pytest
+import TechVJ.start as start
+from pipeline import OrderedDelivery, batch_pipeline
+from conftest import Obj
+
+
+class Bot:
+    def __init__(self):
+        self.errors = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.errors.append(text)
+
+
+def document(msg_id, size=1):
+    return Obj(id=msg_id, document=Obj(file_id=f"file-{msg_id}", file_size=size))
+
+
+class FakeTransfers:
+    """Stands in for handle_private, each message takes its own time and some fail before their turn"""
+
+    def __init__(self, delays, failing=(), undelivered=()):
+        self.delays = delays
+        self.failing = set(failing)
+        self.undelivered = set(undelivered)
+        self.charged = []
+        self.delivered = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.checkpoints = []
+
+    async def handle_private(self, client, acc, message, chatid, msgid, msg=None, turn=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delays.get(msgid, 0))
+            if msgid in self.failing:
+                raise RuntimeError(f"message {msgid} failed")
+            if msgid in self.undelivered:
+                # handled errors are reported to the user and do not raise
+                await turn()
+                return False
+            await turn()
+            self.delivered.append(msgid)
+            return True
+        finally:
+            self.in_flight -= 1
+
+    async def checkpoint_job(self, job_id, last_done):
+        # everything up to the checkpoint was delivered or given up on before it
+        self.checkpoints.append((last_done, set(self.delivered)))
+
+    async def charge(self, user_id, count):
+        self.charged.append(count)
+
+
+@pytest.fixture
+def transfers(monkeypatch):
+    def install(delays, failing=(), undelivered=()):
+        fake = FakeTransfers(delays, failing, undelivered)
+        monkeypatch.setattr(start, 'handle_private', fake.handle_private)
+        monkeypatch.setattr(start.db, 'checkpoint_job', fake.checkpoint_job)
+        monkeypatch.setattr(start.batch_planner, 'charge', fake.charge)
+        monkeypatch.setattr(batch_pipeline, 'PER_USER_CONCURRENCY', 3)
+        monkeypatch.setattr(batch_pipeline, 'global_slots', asyncio.Semaphore(20))
+        monkeypatch.setitem(start.batch_temp.IS_BATCH, 1, False)
+        return fake
+    return install
+
+
+def request():
+    return Obj(id=100, chat=Obj(id=1), from_user=Obj(id=1))
+
+
+def test_tickets_finish_out_of_order_but_deliver_in_order():
+    async def scenario():
+        delivery = OrderedDelivery()
+        tickets = [delivery.ticket() for _ in range(4)]
+        order = []
+
+        async def item(ticket, delay):
+            await asyncio.sleep(delay)
+            await delivery.wait(ticket)
+            order.append(ticket)
+            delivery.finish(ticket)
+        await asyncio.gather(*[item(ticket, delay) for ticket, delay in zip(tickets, (0.04, 0.01, 0.03, 0))])
+        assert order == tickets
+    asyncio.run(scenario())
+
+
+def test_skipped_ticket_unblocks_the_next():
+    async def scenario():
+        delivery = OrderedDelivery()
+        first, second, third = delivery.ticket(), delivery.ticket(), delivery.ticket()
+        waiter = asyncio.create_task(delivery.wait(third))
+        await asyncio.sleep(0)
+        delivery.finish(second)
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        # the first one failed and is finished without delivering
+        delivery.finish(first)
+        await asyncio.wait_for(waiter, 1)
+    asyncio.run(scenario())
+
+
+def test_batch_delivers_in_order_within_the_slot_limit(transfers):
+    fake = transfers({1: 0.05, 2: 0.01, 3: 0.03, 4: 0, 5: 0.02, 6: 0})
+
+    async def scenario():
+        msgs = [document(msg_id) for msg_id in range(1, 7)]
+        assert await start.deliver_messages(Bot(), None, request(), -100, msgs, job_id="job")
+    asyncio.run(scenario())
+    assert fake.delivered == [1, 2, 3, 4, 5, 6]
+    assert fake.max_in_flight == 3
+    assert [last for last, _ in fake.checkpoints] == [1, 2, 3, 4, 5, 6]
+    for last, delivered in fake.checkpoints:
+        assert set(range(1, last + 1)) <= delivered
+
+
+def test_failed_middle_message_does_not_hold_back_the_rest(transfers):
+    fake = transfers({1: 0.03, 2: 0.01, 3: 0}, failing={2})
+    bot = Bot()
+
+    async def scenario():
+        msgs = [document(msg_id) for msg_id in range(1, 5)]
+        assert await start.deliver_messages(bot, None, request(), -100, msgs, job_id="job")
+    asyncio.run(scenario())
+    assert fake.delivered == [1, 3, 4]
+    assert bot.errors == ["Error: message 2 failed"]
+    # a resume goes on after the failed message instead of retrying it forever
+    assert [last for last, _ in fake.checkpoints] == [1, 2, 3, 4]
+    for last, delivered in fake.checkpoints:
+        assert set(range(1, last + 1)) - {2} <= delivered
+
+
+def test_cancel_mid_batch_stops_dispatching_and_never_checkpoints_ahead(transfers):
+    fake = transfers({msg_id: 0.02 for msg_id in range(1, 21)})
+
+    async def scenario():
+        msgs = [document(msg_id) for msg_id in range(1, 21)]
+        run = asyncio.create_task(start.deliver_messages(Bot(), None, request(), -100, msgs, job_id="job"))
+        while len(fake.delivered) < 3:
+            await asyncio.sleep(0.005)
+        start.batch_temp.IS_BATCH[1] = True
+        await run
+    asyncio.run(scenario())
+    # whatever was already in flight finishes, nothing new starts, not even the one waiting for a slot
+    assert 3 <= len(fake.delivered) <= 3 + batch_pipeline.PER_USER_CONCURRENCY
+    assert fake.delivered == list(range(1, len(fake.delivered) + 1))
+    assert max(last for last, _ in fake.checkpoints) == fake.delivered[-1]
+
+
+def test_only_delivered_messages_are_charged(transfers):
+    fake = transfers({}, failing={2}, undelivered={3})
+
+    async def scenario():
+        msgs = [document(msg_id, size=msg_id * 10) for msg_id in range(1, 5)]
+        assert await start.deliver_messages(Bot(), None, request(), -100, msgs, job_id="job")
+    asyncio.run(scenario())
+    assert fake.delivered == [1, 4]
+    assert sorted(count for count in fake.charged if count) == [10, 40]
@@ -0,0 +1,89 @@
+# Tests of batch planning and the daily byte quota
+import asyncio
+import pytest
+from planner import BatchPlan, BatchPlanner
+from conftest import Obj
+
+MB = 1024 * 1024
+
+
+def video(msg_id, size, group=None):
+    return Obj(id=msg_id, video=Obj(file_size=size), media_group_id=group)
+
+
+def test_plan_counts_what_it_will_deliver():
+    plan = BatchPlan(max_file_size=100 * MB)
+    plan.add(Obj(id=1, text="hi"), "Text")
+    plan.add(video(2, 10 * MB), "Video")
+    plan.add(video(3, 5 * MB), "Video")
+    assert [msg.id for msg in plan.messages] == [1, 2, 3]
+    assert plan.total_bytes == 15 * MB
+    assert plan.types == {"Text": 1, "Video": 2}
+
+
+def test_plan_skips_empty_service_and_oversized():
+    plan = BatchPlan(max_file_size=100 * MB)
+    plan.add(Obj(id=1, empty=True), None)
+    plan.add(Obj(id=2, service="pinned"), "Text")
+    plan.add(Obj(id=3), None)
+    plan.add(video(4, 101 * MB), "Video")
+    plan.add(video(5, 100 * MB), "Video")
+    assert plan.empty == 3
+    assert plan.oversized == [(4, 101 * MB)]
+    assert [msg.id for msg in plan.messages] == [5]
+    assert plan.total_bytes == 100 * MB
+
+
+def test_albums_are_grouped_and_sent_once():
+    planner = BatchPlanner()
+    planner.ASSUMED_THROUGHPUT = MB
+    planner.MESSAGE_SECONDS = 1
+    plan = BatchPlan(max_file_size=100 * MB)
+    for msg_id, group in ((1, "a"), (2, "a"), (3, "a"), (4, None), (5, "b"), (6, "b")):
+        plan.add(video(msg_id, MB, group), "Video")
+    assert plan.albums == {"a", "b"} and plan.album_items == 5
+    # 6 MB at 1 MB/s plus three sends: two albums and one single video
+    assert planner.eta(plan) == 6 + 3
+    assert "(2 albums)" in planner.summary(plan)
+
+
+def test_summary_lists_skipped_ids():
+    planner = BatchPlanner()
+    plan = BatchPlan(max_file_size=MB)
+    for msg_id in range(1, 13):
+        plan.add(video(msg_id, 2 * MB), "Video")
+    text = planner.summary(plan)
+    assert "12 files over the" in text
+    assert ": 1, 2, 3, 4, 5, 6, 7, 8, 9, 10 and 2 more" in text
+
+
+@pytest.fixture
+def planner(database):
+    planner = BatchPlanner()
+    planner.DAILY_BYTE_QUOTA = 100 * MB
+    return planner
+
+
+def test_quota_blocks_a_batch_that_does_not_fit(planner):
+    async def scenario():
+        plan = BatchPlan(max_file_size=100 * MB)
+        plan.add(video(1, 60 * MB), "Video")
+        assert (await planner.check(1, plan))[0]
+        await planner.charge(1, 60 * MB)
+        assert await planner.remaining_quota(1) == 40 * MB
+        allowed, reason = await planner.check(1, plan)
+        assert not allowed and "Daily limit reached" in reason
+        # other users keep their own quota
+        assert (await planner.check(2, plan))[0]
+    asyncio.run(scenario())
+
+
+def test_no_quota_allows_anything(planner):
+    async def scenario():
+        planner.DAILY_BYTE_QUOTA = 0
+        plan = BatchPlan(max_file_size=10 ** 12)
+        plan.add(video(1, 10 ** 11), "Video")
+        await planner.charge(1, 10 ** 11)
+        assert await planner.remaining_quota(1) is None
+        assert (await planner.check(1, plan))[0]
+    asyncio.run(scenario())
@@ -0,0 +1,34 @@
+# Tests of the streaming relay's bounded buffer
+import asyncio
+from downloader import CHUNK_SIZE
+from relay import MediaRelay
+import relay
+
+
+def test_parallel_ranges_are_queued_as_1mb_chunks(monkeypatch):
+    range_size = 8 * CHUNK_SIZE
+    file_size = 3 * range_size + 100
+
+    async def iter_chunks(acc, msg, size):
+        for start in range(0, size, range_size):
+            yield bytes(min(range_size, size - start))
+    monkeypatch.setattr(relay.parallel_downloader, 'supports', lambda size: True)
+    monkeypatch.setattr(relay.parallel_downloader, 'iter_chunks', iter_chunks)
+
+    async def scenario():
+        media_relay = MediaRelay()
+        queue = asyncio.Queue(maxsize=media_relay.BUFFER_CHUNKS)
+        producer = asyncio.create_task(media_relay._produce(None, None, file_size, queue))
+        received, peak = [], 0
+        while True:
+            await asyncio.sleep(0)
+            peak = max(peak, sum(len(item) for item in queue._queue if item is not None))
+            chunk = await queue.get()
+            if chunk is None:
+                break
+            received.append(chunk)
+        await producer
+        assert all(len(chunk) <= CHUNK_SIZE for chunk in received)
+        assert sum(len(chunk) for chunk in received) == file_size
+        assert peak <= media_relay.BUFFER_CHUNKS * CHUNK_SIZE
+    asyncio.run(scenario())
@@ -0,0 +1,95 @@
+# Tests of the weighted fair transfer scheduler
+import asyncio
+from scheduler import Lane, TransferScheduler
+
+MB = 1024 * 1024
+
+
+class Grants:
+    """Queues requests on a one slot lane and hands the slot on one release at a time"""
+
+    def __init__(self):
+        self.lane = Lane(1)
+        self.order = []
+        self.tasks = []
+
+    async def request(self, user_id, cost, weight=1.0):
+        await self.lane.acquire(user_id, cost, weight)
+        self.order.append(user_id)
+
+    async def queue(self, user_id, count, cost, weight=1.0):
+        for _ in range(count):
+            self.tasks.append(asyncio.create_task(self.request(user_id, cost, weight)))
+        await asyncio.sleep(0)
+
+    async def grant(self, count):
+        for _ in range(count):
+            self.lane.release()
+            await asyncio.sleep(0)
+
+
+def test_heavy_user_cannot_starve_a_light_one():
+    async def scenario():
+        grants = Grants()
+        # someone holds the only slot, the heavy user queues a big batch first
+        await grants.lane.acquire(0, MB, 1.0)
+        await grants.queue(1, 20, 100 * MB)
+        await grants.grant(3)
+        await grants.queue(2, 1, MB)
+        await grants.grant(2)
+        assert grants.order == [1, 1, 1, 2, 1]
+        await grants.grant(16)
+        await asyncio.gather(*grants.tasks)
+    asyncio.run(scenario())
+
+
+def test_small_files_go_before_big_ones_of_another_user():
+    async def scenario():
+        grants = Grants()
+        await grants.lane.acquire(0, MB, 1.0)
+        await grants.queue(1, 3, 100 * MB)
+        await grants.queue(2, 3, MB)
+        await grants.grant(6)
+        assert grants.order == [2, 2, 2, 1, 1, 1]
+    asyncio.run(scenario())
+
+
+def test_weights_are_respected():
+    async def scenario():
+        grants = Grants()
+        await grants.lane.acquire(0, MB, 1.0)
+        await grants.queue(1, 30, MB, weight=2.0)
+        await grants.queue(2, 30, MB, weight=1.0)
+        await grants.grant(30)
+        # twice the weight gets twice the turns while both keep the lane busy
+        assert grants.order.count(1) == 20 and grants.order.count(2) == 10
+        await grants.grant(30)
+        await asyncio.gather(*grants.tasks)
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_does_not_leak_the_slot():
+    async def scenario():
+        grants = Grants()
+        await grants.lane.acquire(0, MB, 1.0)
+        await grants.queue(1, 1, MB)
+        await grants.queue(2, 1, MB)
+        grants.tasks[0].cancel()
+        await asyncio.sleep(0)
+        await grants.grant(1)
+        assert grants.order == [2]
+        assert grants.lane.free == 0 and not grants.lane.queues
+    asyncio.run(scenario())
+
+
+def test_slot_uses_configured_weights_and_gives_the_slot_back():
+    async def scenario():
+        scheduler = TransferScheduler()
+        scheduler.weights[7] = 4.0
+        async with scheduler.slot(7, 'download', 4 * MB):
+            assert scheduler.stats()['download']['free'] == scheduler.DOWNLOAD_SLOTS - 1
+            assert scheduler.lanes['download'].finish[7] == MB
+        assert scheduler.stats()['download'] == {'free': scheduler.DOWNLOAD_SLOTS, 'waiting': 0}
+        assert scheduler.lane_for("Photo", 'upload') == 'fast'
+        assert scheduler.lane_for("Video", 'upload') == 'upload'
+    asyncio.run(scenario())
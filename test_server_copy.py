@@ -0,0 +1,62 @@
+# Tests of the server-side copy fast path
+import asyncio
+from server_copy import ServerCopy
+from conftest import Obj
+
+
+class Storage:
+    def __init__(self, account_id):
+        self.account_id = account_id
+
+    async def user_id(self):
+        return self.account_id
+
+
+class Account:
+    """A logged in account whose id differs from the bot user's id, copies reach the bot as messages from it"""
+
+    name = "account"
+
+    def __init__(self, server_copy, account_id, deliver=True):
+        self.server_copy = server_copy
+        self.storage = Storage(account_id)
+        self.deliver = deliver
+        self.deleted = []
+
+    async def copy_message(self, chat_id, from_chat_id, message_id):
+        if self.deliver:
+            received = Obj(from_user=Obj(id=self.storage.account_id), document=Obj(file_id="bot-file", file_unique_id="unique"))
+            asyncio.get_running_loop().call_soon(self.server_copy.receive, received)
+        return Obj(id=77, chat=Obj(id=chat_id))
+
+    async def delete_messages(self, chat_id, message_ids):
+        self.deleted.append(message_ids)
+
+
+def source_message():
+    return Obj(id=5, chat=Obj(id=-100100), document=Obj(file_id="src-file", file_unique_id="unique"))
+
+
+def test_copy_is_matched_by_the_account_id():
+    async def scenario():
+        server_copy = ServerCopy()
+        acc = Account(server_copy, account_id=555)
+        bot = Obj(me=Obj(username="bot"))
+        assert await server_copy.fetch(bot, acc, source_message(), "Document") == "bot-file"
+        assert acc.deleted == [77]
+        assert not server_copy.pending
+    asyncio.run(scenario())
+
+
+def test_message_of_another_sender_is_left_alone():
+    async def scenario():
+        server_copy = ServerCopy()
+        server_copy.TIMEOUT = 0.05
+        acc = Account(server_copy, account_id=555, deliver=False)
+        bot = Obj(me=Obj(username="bot"))
+        fetch = asyncio.create_task(server_copy.fetch(bot, acc, source_message(), "Document"))
+        await asyncio.sleep(0)
+        # the same file sent to the bot by the user who asked for it is not the copy
+        assert not server_copy.receive(Obj(from_user=Obj(id=1), document=Obj(file_id="other", file_unique_id="unique")))
+        assert await fetch is None
+    asyncio.run(scenario())
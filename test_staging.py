@@ -0,0 +1,98 @@
+# Tests of the download staging area
+import os
+import asyncio
+import pytest
+from staging import StagingArea
+
+
+@pytest.fixture
+def staging(tmp_path):
+    area = StagingArea()
+    area.DIR = str(tmp_path / "disk")
+    area.roots = {'disk': area.DIR}
+    area.reserved = {'disk': 0}
+    area.DISK_BUDGET = 100
+    area.MIN_FREE = 0
+    area.WAIT = 1
+    return area
+
+
+def test_reserve_accounts_bytes_and_removes_the_directory(staging):
+    async def scenario():
+        async with staging.reserve("job", 60) as directory:
+            assert os.path.isdir(directory)
+            assert staging.reserved['disk'] == 60
+            with open(os.path.join(directory, "file"), "wb") as f:
+                f.write(b"x" * 60)
+        assert not os.path.exists(directory)
+        assert staging.reserved['disk'] == 0
+    asyncio.run(scenario())
+
+
+def test_cleanup_on_failure(staging):
+    async def scenario():
+        with pytest.raises(ValueError):
+            async with staging.reserve("job", 60) as directory:
+                with open(os.path.join(directory, "part"), "wb") as f:
+                    f.write(b"x")
+                raise ValueError("download failed")
+        assert not os.path.exists(directory)
+        assert staging.reserved['disk'] == 0
+    asyncio.run(scenario())
+
+
+def test_download_waits_for_space_in_the_budget(staging):
+    async def scenario():
+        order = []
+
+        async def download(name, size, hold):
+            async with staging.reserve("job", size):
+                order.append(name)
+                await asyncio.sleep(hold)
+        first = asyncio.create_task(download("first", 80, 0.05))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(download("second", 50, 0))
+        await asyncio.sleep(0.01)
+        assert staging.waiting == 1 and order == ["first"]
+        await asyncio.gather(first, second)
+        assert order == ["first", "second"]
+        assert staging.stats() == {'reserved': {'disk': 0}, 'waiting': 0}
+    asyncio.run(scenario())
+
+
+def test_waiting_for_space_times_out(staging):
+    async def scenario():
+        staging.WAIT = 0.05
+        async with staging.reserve("job", 80):
+            with pytest.raises(RuntimeError, match="Not enough disk space"):
+                async with staging.reserve("job", 50):
+                    pass
+            assert staging.waiting == 0
+        assert staging.reserved['disk'] == 0
+    asyncio.run(scenario())
+
+
+def test_file_over_the_budget_fails_right_away(staging):
+    async def scenario():
+        with pytest.raises(RuntimeError, match="larger than the staging budget"):
+            async with staging.reserve("job", 101):
+                pass
+        assert staging.reserved['disk'] == 0
+    asyncio.run(scenario())
+
+
+def test_small_files_go_to_tmpfs_within_its_budget(staging, tmp_path):
+    async def scenario():
+        staging.roots['tmpfs'] = str(tmp_path / "tmpfs")
+        staging.reserved['tmpfs'] = 0
+        staging.TMPFS_MAX_FILE = 30
+        staging.TMPFS_BUDGET = 50
+        async with staging.reserve("job", 30) as first:
+            async with staging.reserve("job", 30) as second:
+                # over the tmpfs budget, it spills to disk
+                assert first.startswith(staging.roots['tmpfs']) and second.startswith(staging.DIR)
+                assert staging.reserved == {'disk': 30, 'tmpfs': 30}
+        assert staging.reserved == {'disk': 0, 'tmpfs': 0}
+        await staging.cleanup("job")
+        assert not os.path.exists(staging.job_dir('tmpfs', "job"))
+    asyncio.run(scenario())
@@ -0,0 +1,107 @@
+# Tests of the in-memory and Mongo security state backends
+import asyncio
+import pytest
+import state_backends
+from state_backends import MemoryStateBackend, MongoStateBackend
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(state_backends.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture(params=["memory", "mongo"])
+def backend(request, mongo):
+    if request.param == "memory":
+        return MemoryStateBackend(max_users=100, idle_ttl=3600)
+    return MongoStateBackend(mongo("security_state"), idle_ttl=3600)
+
+
+def test_bucket_empties_and_refills(backend, clock):
+    async def scenario():
+        assert [await backend.take_token(1, 3, 60) for _ in range(4)] == [True, True, True, False]
+        # one token comes back every window / capacity seconds
+        clock.now += 20
+        assert await backend.take_token(1, 3, 60)
+        assert not await backend.take_token(1, 3, 60)
+        # never more than capacity, however long the user was away
+        clock.now += 3600
+        assert [await backend.take_token(1, 3, 60) for _ in range(4)] == [True, True, True, False]
+    run(scenario())
+
+
+def test_buckets_are_per_user(backend, clock):
+    async def scenario():
+        for _ in range(2):
+            await backend.take_token(1, 2, 60)
+        assert not await backend.take_token(1, 2, 60)
+        assert await backend.take_token(2, 2, 60)
+    run(scenario())
+
+
+def test_activity_is_counted(backend, clock):
+    async def scenario():
+        assert await backend.get_activity(1) == {}
+        await backend.track_activity(1, False)
+        clock.now += 5
+        await backend.track_activity(1, True)
+        activity = await backend.get_activity(1)
+        assert activity['request_count'] == 2
+        assert activity['suspicious_count'] == 1
+        assert activity['last_activity'] == clock.now
+    run(scenario())
+
+
+def test_forget_clears_everything(backend, clock):
+    async def scenario():
+        await backend.take_token(1, 1, 60)
+        await backend.track_activity(1, True)
+        await backend.forget(1)
+        assert await backend.get_activity(1) == {}
+        assert await backend.take_token(1, 1, 60)
+    run(scenario())
+
+
+def test_memory_backend_evicts_least_recently_seen(clock):
+    async def scenario():
+        backend = MemoryStateBackend(max_users=2, idle_ttl=3600)
+        for user_id in (1, 2):
+            await backend.track_activity(user_id, False)
+        await backend.track_activity(1, False)
+        await backend.track_activity(3, False)
+        assert set(backend.last_seen) == {1, 3}
+        assert await backend.get_activity(2) == {}
+    run(scenario())
+
+
+def test_memory_backend_evicts_idle_users(clock):
+    async def scenario():
+        backend = MemoryStateBackend(max_users=100, idle_ttl=60)
+        await backend.track_activity(1, False)
+        clock.now += 61
+        await backend.track_activity(2, False)
+        assert list(backend.last_seen) == [2]
+    run(scenario())
+
+
+def test_mongo_backend_expires_idle_users_by_ttl_index(mongo):
+    async def scenario():
+        col = mongo("security_state")
+        await MongoStateBackend(col, idle_ttl=600).create_indexes()
+        info = await col.index_information()
+        assert any(index.get('expireAfterSeconds') == 600 and index['key'] == [('seen', 1)] for index in info.values())
+    run(scenario())
@@ -0,0 +1,91 @@
+# Tests of part splitting and the small/big file upload paths
+import asyncio
+import pytest
+from pyrogram import raw
+from uploader import BIG_FILE_THRESHOLD, UPLOAD_PART_SIZE, ParallelUploader, split_parts
+
+
+async def chunks(sizes):
+    for size in sizes:
+        yield b"x" * size
+
+
+async def collect(parts):
+    return [part async for part in parts]
+
+
+class Client:
+    """Records the parts uploaded over the main connection"""
+
+    def __init__(self):
+        self.rpcs = []
+
+    def rnd_id(self):
+        return 42
+
+    async def invoke(self, rpc):
+        self.rpcs.append(rpc)
+        return True
+
+
+def sequential():
+    uploader = ParallelUploader()
+    # one worker over the main connection, no extra sessions
+    uploader.CONNECTIONS = 1
+    uploader.WORKERS_PER_CONNECTION = 1
+    return uploader
+
+
+def test_split_parts_are_exactly_the_part_size():
+    parts = asyncio.run(collect(split_parts(chunks([1000, UPLOAD_PART_SIZE, 3 * UPLOAD_PART_SIZE - 1000, 7]))))
+    assert [len(part) for part in parts] == [UPLOAD_PART_SIZE] * 4 + [7]
+
+
+def test_split_parts_of_an_exact_multiple_has_no_empty_tail():
+    parts = asyncio.run(collect(split_parts(chunks([UPLOAD_PART_SIZE // 2] * 4))))
+    assert [len(part) for part in parts] == [UPLOAD_PART_SIZE] * 2
+
+
+def test_small_file_uses_save_file_part():
+    client = Client()
+    size = BIG_FILE_THRESHOLD
+    input_file = asyncio.run(sequential().upload_parts(client, split_parts(chunks([size])), size, "small.bin"))
+    assert isinstance(input_file, raw.types.InputFile)
+    assert input_file.parts == size // UPLOAD_PART_SIZE and input_file.name == "small.bin"
+    assert all(isinstance(rpc, raw.functions.upload.SaveFilePart) for rpc in client.rpcs)
+    assert [rpc.file_part for rpc in client.rpcs] == list(range(input_file.parts))
+
+
+def test_big_file_uses_save_big_file_part():
+    client = Client()
+    size = BIG_FILE_THRESHOLD + 1
+    input_file = asyncio.run(sequential().upload_parts(client, split_parts(chunks([size])), size, "big.bin"))
+    total = size // UPLOAD_PART_SIZE + 1
+    assert isinstance(input_file, raw.types.InputFileBig)
+    assert input_file.parts == total
+    assert all(isinstance(rpc, raw.functions.upload.SaveBigFilePart) and rpc.file_total_parts == total for rpc in client.rpcs)
+    assert len(client.rpcs[-1].bytes) == size - (total - 1) * UPLOAD_PART_SIZE
+
+
+def test_failed_part_fails_the_upload():
+    class Failing(Client):
+        async def invoke(self, rpc):
+            if rpc.file_part == 1:
+                raise ConnectionError("lost")
+            return await super().invoke(rpc)
+
+    uploader = sequential()
+    uploader.RETRIES = 1
+    client = Failing()
+    with pytest.raises(ConnectionError):
+        asyncio.run(uploader.upload_parts(client, split_parts(chunks([4 * UPLOAD_PART_SIZE])), 4 * UPLOAD_PART_SIZE, "f"))
+    assert 1 not in [rpc.file_part for rpc in client.rpcs]
+
+
+def test_parallel_upload_only_for_big_enough_files():
+    uploader = ParallelUploader()
+    uploader.CONNECTIONS, uploader.WORKERS_PER_CONNECTION, uploader.MIN_SIZE = 4, 4, BIG_FILE_THRESHOLD
+    assert uploader.supports(BIG_FILE_THRESHOLD)
+    assert not uploader.supports(BIG_FILE_THRESHOLD - 1)
+    uploader.CONNECTIONS = uploader.WORKERS_PER_CONNECTION = 1
+    assert not uploader.supports(10 * BIG_FILE_THRESHOLD)
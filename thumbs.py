@@ -0,0 +1,95 @@
+# Thumbnail cache for VJ Save Restricted Content Bot
+import os
+import asyncio
+from collections import Counter, OrderedDict
+from typing import Dict, Optional
+from pyrogram import Client
+from staging import staging_area
+
+# Message types whose thumbnail is uploaded with the media
+THUMB_TYPES = ("Document", "Video", "Audio")
+
+class ThumbnailCache:
+    def __init__(self):
+        # Cache configurations
+        # by default inside this process's staging directory, so a restart sweeps away the unindexed files
+        self.DIR = os.path.abspath(os.environ.get('THUMB_CACHE_DIR', os.path.join(staging_area.process_dir('disk'), "thumbs")))
+        self.MAX_BYTES = int(os.environ.get('THUMB_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+        # thumbnail file_unique_id -> (path, size), least recently used first
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.size = 0
+        self.in_use = Counter()
+        self.loading: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, acc: Client, media) -> Optional[str]:
+        """Return a local path of the media's thumbnail, downloading it at most once.
+
+        Every path returned must be given back with release().
+        """
+        thumbs = getattr(media, 'thumbs', None)
+        if not thumbs:
+            return None
+        key = thumbs[0].file_unique_id
+        if key in self.loading:
+            # the same thumbnail is already being downloaded for another message
+            await asyncio.shield(self.loading[key])
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            path = self.entries[key][0]
+            self.in_use[path] += 1
+            return path
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self.loading[key] = future
+        try:
+            path = await acc.download_media(thumbs[0].file_id, file_name=os.path.join(self.DIR, key + ".jpg"))
+            self.in_use[path] += 1
+            self._add(key, path)
+            return path
+        except Exception as e:
+            print(f"Thumbnail download failed: {e}")
+            return None
+        finally:
+            self.loading.pop(key, None)
+            future.set_result(None)
+
+    def release(self, path: Optional[str]):
+        """Give back a path returned by get() so it can be evicted again"""
+        if path is None:
+            return
+        self.in_use[path] -= 1
+        if self.in_use[path] <= 0:
+            del self.in_use[path]
+        self._evict()
+
+    def _add(self, key: str, path: str):
+        size = os.path.getsize(path)
+        self.entries[key] = (path, size)
+        self.size += size
+        self._evict()
+
+    def _evict(self):
+        """Drop least recently used thumbnails until the cache fits, skipping ones being uploaded"""
+        for key in list(self.entries):
+            if self.size <= self.MAX_BYTES:
+                return
+            path, size = self.entries[key]
+            if self.in_use[path]:
+                continue
+            del self.entries[key]
+            self.size -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        return {'entries': len(self.entries), 'bytes': self.size, 'hits': self.hits, 'misses': self.misses}
+
+# Global thumbnail cache instance
+thumbnail_cache = ThumbnailCache()
@@ -0,0 +1,85 @@
+# In-memory progress tracking for VJ Save Restricted Content Bot
+import os
+import time
+import asyncio
+from typing import Dict, Optional
+from pyrogram import Client
+
+PHASE_LABELS = {'down': 'Downloaded', 'up': 'Uploaded'}
+
+def human_size(size: float) -> str:
+    """Format a byte count for status messages"""
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{int(size)} B"
+        size /= 1024
+
+def human_time(seconds: float) -> str:
+    """Format a duration for status messages"""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours > 0:
+        return f"{hours}h {minutes}m {seconds}s"
+    elif minutes > 0:
+        return f"{minutes}m {seconds}s"
+    return f"{seconds}s"
+
+class ProgressTracker:
+    def __init__(self):
+        # Tracker configurations
+        self.EDIT_INTERVAL = int(os.environ.get('STATUS_EDIT_INTERVAL', '10'))
+
+        # job key -> {'phase', 'current', 'total', 'started'}
+        self.jobs: Dict[str, Dict] = {}
+
+    def start(self, key: str):
+        """Register a job before any progress is reported"""
+        self.jobs[key] = {'phase': None, 'current': 0, 'total': 0, 'started': time.time()}
+
+    def update(self, key: str, phase: str, current: int, total: int):
+        """Record progress, called from pyrogram progress callbacks so it must not do any I/O"""
+        job = self.jobs.get(key)
+        if job is None:
+            return
+        if job['phase'] != phase:
+            job['phase'] = phase
+            job['started'] = time.time()
+        job['current'] = current
+        job['total'] = total
+
+    def finish(self, key: str):
+        self.jobs.pop(key, None)
+
+    def render(self, key: str) -> Optional[str]:
+        """Render bytes, percent, speed and ETA of the current phase"""
+        job = self.jobs.get(key)
+        if not job or not job['phase'] or not job['total']:
+            return None
+        current, total = job['current'], job['total']
+        elapsed = max(time.time() - job['started'], 0.001)
+        speed = current / elapsed
+        eta = (total - current) / speed if speed > 0 else 0
+        return (
+            f"**{PHASE_LABELS.get(job['phase'], job['phase'])}:** **{current * 100 / total:.1f}%**\n"
+            f"**{human_size(current)} of {human_size(total)}**\n"
+            f"**Speed:** {human_size(speed)}/s | **ETA:** {human_time(eta)}"
+        )
+
+    async def watch(self, client: Client, chat: int, message_id: int, key: str):
+        """Edit the status message of a job until it finishes, at most once per EDIT_INTERVAL"""
+        last_text = None
+        while key in self.jobs:
+            text = self.render(key)
+            if text is None or text == last_text:
+                await asyncio.sleep(1)
+                continue
+            try:
+                await client.edit_message_text(chat, message_id, text)
+                last_text = text
+                await asyncio.sleep(self.EDIT_INTERVAL)
+            except:
+                await asyncio.sleep(5)
+
+# Global progress tracker instance
+progress_tracker = ProgressTracker()
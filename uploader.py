@@ -0,0 +1,204 @@
+# Parallel part uploads for VJ Save Restricted Content Bot
+import os
+import math
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+from pyrogram import Client, raw, types, enums
+from pyrogram.errors import FloodWait
+from pyrogram.session import Session
+from pyrogram.types import Message
+from pacing import rate_scheduler
+from metrics import metrics
+
+# Telegram upload limits
+UPLOAD_PART_SIZE = 512 * 1024
+BIG_FILE_THRESHOLD = 10 * 1024 * 1024
+
+# Message types sent through raw SendMedia after a manual upload
+UPLOADABLE_TYPES = ("Document", "Video", "Audio")
+
+async def split_parts(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Re-chunk a byte stream into upload parts, every part but the last is exactly UPLOAD_PART_SIZE"""
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer.extend(chunk)
+        while len(buffer) >= UPLOAD_PART_SIZE:
+            yield bytes(buffer[:UPLOAD_PART_SIZE])
+            del buffer[:UPLOAD_PART_SIZE]
+    if buffer:
+        yield bytes(buffer)
+
+async def file_parts(path: str) -> AsyncIterator[bytes]:
+    """Read a file part by part without blocking the event loop"""
+    with open(path, "rb") as f:
+        while True:
+            data = await asyncio.to_thread(f.read, UPLOAD_PART_SIZE)
+            if not data:
+                return
+            yield data
+
+def build_input_media(msg: Message, msg_type: str, input_file, thumb):
+    """Build the raw input media matching the source message type"""
+    if "Document" == msg_type:
+        media = msg.document
+        attributes = [raw.types.DocumentAttributeFilename(file_name=media.file_name or "file")]
+    elif "Video" == msg_type:
+        media = msg.video
+        attributes = [
+            raw.types.DocumentAttributeVideo(duration=media.duration, w=media.width, h=media.height, supports_streaming=media.supports_streaming or None),
+            raw.types.DocumentAttributeFilename(file_name=media.file_name or "video.mp4")
+        ]
+    else:
+        media = msg.audio
+        attributes = [
+            raw.types.DocumentAttributeAudio(duration=media.duration, performer=media.performer, title=media.title),
+            raw.types.DocumentAttributeFilename(file_name=media.file_name or "audio.mp3")
+        ]
+    return raw.types.InputMediaUploadedDocument(
+        file=input_file,
+        mime_type=media.mime_type or "application/octet-stream",
+        attributes=attributes,
+        thumb=thumb
+    )
+
+async def send_uploaded_media(client: Client, msg: Message, msg_type: str, chat_id: int, reply_to_message_id: int,
+                              input_file, caption: Optional[str] = None, thumb: Optional[Awaitable[Optional[str]]] = None) -> Optional[Message]:
+    """Send an already uploaded file as the same kind of media as the source message.
+
+    thumb resolves to the thumbnail path, it is only awaited here so its download overlaps the upload.
+    """
+    thumb_path = await thumb if thumb else None
+    thumb_file = await client.save_file(thumb_path) if thumb_path else None
+    with metrics.time("resolve"):
+        peer = await client.resolve_peer(chat_id)
+    r = await rate_scheduler.send(
+        client, chat_id, client.invoke,
+        raw.functions.messages.SendMedia(
+            peer=peer,
+            media=build_input_media(msg, msg_type, input_file, thumb_file),
+            reply_to=raw.types.InputReplyToMessage(reply_to_msg_id=reply_to_message_id),
+            random_id=client.rnd_id(),
+            **await client.parser.parse(caption, enums.ParseMode.HTML)
+        )
+    )
+
+    for update in r.updates:
+        if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+            return await types.Message._parse(
+                client, update.message,
+                {u.id: u for u in r.users},
+                {c.id: c for c in r.chats}
+            )
+
+class ParallelUploader:
+    def __init__(self):
+        # Uploader configurations
+        self.CONNECTIONS = int(os.environ.get('UPLOAD_CONNECTIONS', '4'))
+        self.WORKERS_PER_CONNECTION = int(os.environ.get('UPLOAD_WORKERS_PER_CONNECTION', '4'))
+        self.MIN_SIZE = int(os.environ.get('PARALLEL_UPLOAD_MIN_SIZE', str(BIG_FILE_THRESHOLD)))
+        self.RETRIES = int(os.environ.get('UPLOAD_PART_RETRIES', '5'))
+
+    def supports(self, file_size: int) -> bool:
+        """Small files keep a single sequential uploader"""
+        return self.CONNECTIONS * self.WORKERS_PER_CONNECTION > 1 and file_size >= self.MIN_SIZE
+
+    async def _open_sessions(self, client: Client) -> List[Session]:
+        """Open extra media connections to the bot's DC, none if that fails"""
+        sessions = []
+        try:
+            for _ in range(self.CONNECTIONS):
+                session = Session(client, await client.storage.dc_id(), await client.storage.auth_key(), await client.storage.test_mode(), is_media=True)
+                await session.start()
+                sessions.append(session)
+        except Exception as e:
+            print(f"Upload session error, falling back to the main connection: {e}")
+            await self._close_sessions(sessions)
+            return []
+        return sessions
+
+    async def _close_sessions(self, sessions: List[Session]):
+        for session in sessions:
+            try:
+                await session.stop()
+            except Exception:
+                pass
+
+    async def _invoke_part(self, invoke: Callable, rpc):
+        """Upload one part, retrying only this part when it fails"""
+        for attempt in range(self.RETRIES):
+            try:
+                return await invoke(rpc)
+            except FloodWait as e:
+                await asyncio.sleep(e.value)
+            except Exception:
+                if attempt == self.RETRIES - 1:
+                    raise
+                await asyncio.sleep(1 + attempt)
+        raise RuntimeError(f"Part {rpc.file_part} failed after {self.RETRIES} attempts")
+
+    async def upload_parts(self, client: Client, parts: AsyncIterator[bytes], file_size: int, file_name: str,
+                           progress: Optional[Callable] = None, progress_args: tuple = ()):
+        """Upload parts concurrently and return the raw input file to send"""
+        file_id = client.rnd_id()
+        is_big = file_size > BIG_FILE_THRESHOLD
+        total_parts = math.ceil(file_size / UPLOAD_PART_SIZE)
+
+        sessions = await self._open_sessions(client) if self.supports(file_size) else []
+        invokers = [session.invoke for session in sessions] or [client.invoke]
+        workers_count = len(sessions) * self.WORKERS_PER_CONNECTION or 1
+        queue = asyncio.Queue(maxsize=workers_count)
+        uploaded = 0
+        errors = []
+
+        async def worker(invoke):
+            nonlocal uploaded
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                index, data = item
+                # after a failure keep draining the queue so the producer never blocks
+                if errors:
+                    continue
+                if is_big:
+                    rpc = raw.functions.upload.SaveBigFilePart(file_id=file_id, file_part=index, file_total_parts=total_parts, bytes=data)
+                else:
+                    rpc = raw.functions.upload.SaveFilePart(file_id=file_id, file_part=index, bytes=data)
+                try:
+                    await self._invoke_part(invoke, rpc)
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                uploaded += len(data)
+                metrics.add_bytes("up", len(data))
+                if progress:
+                    progress(min(uploaded, file_size), file_size, *progress_args)
+
+        tasks = [asyncio.create_task(worker(invokers[i % len(invokers)])) for i in range(workers_count)]
+        count = 0
+        try:
+            async for data in parts:
+                if errors:
+                    break
+                await queue.put((count, data))
+                count += 1
+            for _ in tasks:
+                await queue.put(None)
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await self._close_sessions(sessions)
+
+        if errors:
+            raise errors[0]
+        if is_big:
+            return raw.types.InputFileBig(id=file_id, parts=count, name=file_name)
+        return raw.types.InputFile(id=file_id, parts=count, name=file_name, md5_checksum="")
+
+    async def upload_file(self, client: Client, path: str, progress: Optional[Callable] = None, progress_args: tuple = ()):
+        """Upload a file from disk with parallel parts"""
+        return await self.upload_parts(client, file_parts(path), os.path.getsize(path), os.path.basename(path), progress, progress_args)
+
+# Global parallel uploader instance
+parallel_uploader = ParallelUploader()